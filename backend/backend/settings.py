@@ -184,3 +184,61 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # External API Keys for Live Data Integration
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', None)  # Get from https://openweathermap.org/api
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', None)  # Get from Google Cloud Console
+
+# Notification delivery
+# Audiences at or above this size are stored once as a segment and merged into inboxes on read
+NOTIFICATION_FANOUT_ON_READ_THRESHOLD = int(os.getenv('NOTIFICATION_FANOUT_ON_READ_THRESHOLD', 10000))
+# Repeats of the same (type, medical item, region) alert within this window update the original
+NOTIFICATION_COALESCE_WINDOW_MINUTES = int(os.getenv('NOTIFICATION_COALESCE_WINDOW_MINUTES', 360))
+# Read notifications older than this are moved to the archive by prune_notifications
+NOTIFICATION_READ_RETENTION_DAYS = int(os.getenv('NOTIFICATION_READ_RETENTION_DAYS', 90))
+# Delivery workers per process for the priority lanes (0 delivers inline in the request)
+NOTIFICATION_DELIVERY_WORKERS = int(os.getenv('NOTIFICATION_DELIVERY_WORKERS', 0))
+# Workers reserved for the critical lane, out of NOTIFICATION_DELIVERY_WORKERS
+NOTIFICATION_CRITICAL_WORKERS = int(os.getenv('NOTIFICATION_CRITICAL_WORKERS', 2))
+# Recipients per chunk; lower lanes can be preempted between chunks
+NOTIFICATION_DELIVERY_CHUNK_SIZE = int(os.getenv('NOTIFICATION_DELIVERY_CHUNK_SIZE', 500))
+# External sends allowed per user and channel within the sliding window (0 disables the limit);
+# overflow is shown in-app only or added to the user's digest
+NOTIFICATION_RATE_WINDOW_SECONDS = int(os.getenv('NOTIFICATION_RATE_WINDOW_SECONDS', 3600))
+NOTIFICATION_CHANNEL_RATE_LIMITS = {
+    'push': int(os.getenv('NOTIFICATION_PUSH_RATE_LIMIT', 20)),
+    'sms': int(os.getenv('NOTIFICATION_SMS_RATE_LIMIT', 5)),
+    'email': int(os.getenv('NOTIFICATION_EMAIL_RATE_LIMIT', 10)),
+}
+
+# Prediction alert webhooks
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 100))  # Alerts per POST
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', 10))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 20))
+WEBHOOK_BACKOFF_BASE_SECONDS = int(os.getenv('WEBHOOK_BACKOFF_BASE_SECONDS', 30))
+WEBHOOK_BACKOFF_MAX_SECONDS = int(os.getenv('WEBHOOK_BACKOFF_MAX_SECONDS', 3600))
+
+# Prediction scheduler (run_prediction_scheduler)
+PREDICTION_SCHEDULER_INTERVAL_SECONDS = int(os.getenv('PREDICTION_SCHEDULER_INTERVAL_SECONDS', 60))
+# A node's lease on a config's cycle; must outlast the longest run
+PREDICTION_SCHEDULER_LEASE_SECONDS = int(os.getenv('PREDICTION_SCHEDULER_LEASE_SECONDS', 7200))
+# Running predictions refresh their heartbeat (and scheduler lease) this often, well inside the lease
+PREDICTION_HEARTBEAT_SECONDS = int(os.getenv('PREDICTION_HEARTBEAT_SECONDS', 60))
+# Threads per API process running queued prediction jobs; the default 0 leaves the CPU-bound
+# fitting to run_prediction_scheduler instead of API workers
+PREDICTION_JOB_THREADS = int(os.getenv('PREDICTION_JOB_THREADS', 0))
+# Processes used to fit demand forecasts in a prediction run (1 fits in-process)
+PREDICTION_WORKERS = int(os.getenv('PREDICTION_WORKERS', 1))
+# Runs whose demand matrix (series x days) is smaller than this fit in-process even with several workers
+PREDICTION_PARALLEL_MIN_CELLS = int(os.getenv('PREDICTION_PARALLEL_MIN_CELLS', 2000000))
+# Incremental runs treat demand written this long before a series' last fit as possibly unseen
+PREDICTION_DIRTY_MARGIN_SECONDS = int(os.getenv('PREDICTION_DIRTY_MARGIN_SECONDS', 300))
+# Incremental runs refit a series with unchanged demand once its stored fit is this old, since the
+# fit's horizon stays anchored at the run that computed it
+PREDICTION_STATE_MAX_AGE_DAYS = int(os.getenv('PREDICTION_STATE_MAX_AGE_DAYS', 7))
+# Predictions upserted per transaction by save_predictions
+PREDICTION_SAVE_CHUNK_SIZE = int(os.getenv('PREDICTION_SAVE_CHUNK_SIZE', 1000))
+# Demand history windows spanning at least this many weeks (or months) are read from the weekly (or monthly) rollups
+DEMAND_ROLLUP_MIN_PERIODS = int(os.getenv('DEMAND_ROLLUP_MIN_PERIODS', 12))
+# Directory of per-region memory-mapped demand matrices (sync_demand_store); empty reads demand through the ORM
+DEMAND_STORE_DIR = os.getenv('DEMAND_STORE_DIR', '')
+# Demand rows validated and upserted per transaction by bulk uploads and load_demand_data
+DEMAND_INGEST_CHUNK_SIZE = int(os.getenv('DEMAND_INGEST_CHUNK_SIZE', 5000))
+# Rejected rows reported back per upload (all are counted)
+DEMAND_INGEST_MAX_ERRORS = int(os.getenv('DEMAND_INGEST_MAX_ERRORS', 100))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Patient, MedicalRecord, Prescription, LabResult
+from .models import Patient, MedicalRecord, Prescription, LabResult, MedicalTerm
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -32,4 +32,10 @@ class PrescriptionAdmin(admin.ModelAdmin):
 class LabResultAdmin(admin.ModelAdmin):
     list_display = ('medical_record', 'test_name', 'result_value', 'date_tested')
     list_filter = ('test_name', 'date_tested')
-    search_fields = ('test_name', 'medical_record__patient__user__first_name')
\ No newline at end of file
+    search_fields = ('test_name', 'medical_record__patient__user__first_name')
+
+@admin.register(MedicalTerm)
+class MedicalTermAdmin(admin.ModelAdmin):
+    list_display = ('name', 'term_type')
+    list_filter = ('term_type',)
+    search_fields = ('name',)
@@ -0,0 +1,137 @@
+import re
+from typing import Dict, Iterable, Optional, Set
+from .models import Patient, Prescription, MedicalTerm, PatientMedicalTerm
+
+TERM_SEPARATORS = re.compile(r'[,;\n]+')
+WHITESPACE = re.compile(r'\s+')
+
+def normalize_term(value: str) -> str:
+    """
+    Normalize a single term: lowercase and collapse whitespace
+    """
+    return WHITESPACE.sub(' ', value or '').strip().lower()
+
+def normalize_terms(text: Optional[str]) -> Set[str]:
+    """
+    Split a free-text field (comma, semicolon or newline separated)
+    into a set of normalized terms
+    """
+    if not text:
+        return set()
+    terms = (normalize_term(part) for part in TERM_SEPARATORS.split(text))
+    return {term for term in terms if term}
+
+def patient_terms(patient: Patient) -> Dict[str, Set[str]]:
+    """
+    Collect normalized condition, medication and allergy terms for a patient.
+    Medications include the free-text field and all active prescriptions.
+    """
+    medications = normalize_terms(patient.current_medications)
+    if patient.pk:
+        prescribed = Prescription.objects.filter(
+            medical_record__patient=patient,
+            is_active=True
+        ).values_list('medication_name', flat=True)
+        medications |= {normalize_term(name) for name in prescribed if normalize_term(name)}
+
+    return {
+        'condition': normalize_terms(patient.chronic_conditions),
+        'medication': medications,
+        'allergy': normalize_terms(patient.allergies),
+    }
+
+def index_patient(patient: Patient) -> None:
+    """
+    Rebuild the postings for a single patient
+    """
+    wanted = {
+        (term_type, name)
+        for term_type, names in patient_terms(patient).items()
+        for name in names
+    }
+
+    if wanted:
+        MedicalTerm.objects.bulk_create(
+            [MedicalTerm(term_type=term_type, name=name) for term_type, name in wanted],
+            ignore_conflicts=True
+        )
+        names = {name for _, name in wanted}
+        term_ids = [
+            term_id for term_id, term_type, name in MedicalTerm.objects.filter(
+                name__in=names
+            ).values_list('id', 'term_type', 'name')
+            if (term_type, name) in wanted
+        ]
+    else:
+        term_ids = []
+
+    PatientMedicalTerm.objects.filter(user_id=patient.user_id).exclude(term_id__in=term_ids).delete()
+    PatientMedicalTerm.objects.bulk_create(
+        [PatientMedicalTerm(term_id=term_id, user_id=patient.user_id) for term_id in term_ids],
+        ignore_conflicts=True
+    )
+
+def unindex_prescription(prescription: Prescription) -> None:
+    """
+    Drop the medication posting of a deleted prescription unless the patient
+    still takes it through the free-text field or another active
+    prescription. Never adds postings, so it is safe while the patient
+    itself is being deleted.
+    """
+    name = normalize_term(prescription.medication_name)
+    patient = Patient.objects.filter(
+        medical_records__id=prescription.medical_record_id
+    ).values('id', 'user_id', 'current_medications').first()
+    if not name or patient is None:
+        return
+
+    other_names = Prescription.objects.filter(
+        medical_record__patient_id=patient['id'],
+        is_active=True
+    ).exclude(pk=prescription.pk).values_list('medication_name', flat=True)
+    if name in normalize_terms(patient['current_medications']) or name in {normalize_term(n) for n in other_names}:
+        return
+
+    PatientMedicalTerm.objects.filter(
+        user_id=patient['user_id'], term__term_type='medication', term__name=name
+    ).delete()
+
+def resolve_term_ids(term_type: str, query: str) -> Set[int]:
+    """
+    Resolve a targeting query (e.g. 'diabetes') to the ids of every indexed term
+    containing it. This scans the small term vocabulary, not the patient table.
+    """
+    name = normalize_term(query)
+    if not name:
+        return set()
+    return set(MedicalTerm.objects.filter(
+        term_type=term_type,
+        name__contains=name
+    ).values_list('id', flat=True))
+
+def find_user_ids(term_type: str, queries: Iterable[str], match: str = 'any') -> Set[int]:
+    """
+    Resolve targeting queries to a set of user ids using the posting lists.
+
+    match='any' unions the postings of every query (OR), match='all'
+    intersects them (AND).
+    """
+    result = None
+
+    for query in queries:
+        term_ids = resolve_term_ids(term_type, query)
+        user_ids = set(PatientMedicalTerm.objects.filter(
+            term_id__in=term_ids
+        ).values_list('user_id', flat=True)) if term_ids else set()
+
+        if result is None:
+            result = user_ids
+        elif match == 'all':
+            result &= user_ids
+        else:
+            result |= user_ids
+
+        if match == 'all' and not result:
+            break
+
+    return result or set()
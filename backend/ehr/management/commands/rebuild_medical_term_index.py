@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from ehr.models import Patient
+from ehr.indexing import index_patient
+
+class Command(BaseCommand):
+    help = 'Rebuild condition, medication and allergy postings for all patients'
+
+    def handle(self, *args, **options):
+        count = 0
+        for patient in Patient.objects.iterator(chunk_size=1000):
+            index_patient(patient)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} patients'))
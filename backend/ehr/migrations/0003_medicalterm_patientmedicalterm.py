@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0002_diagnosis'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicalTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term_type', models.CharField(choices=[('condition', 'Condition'), ('medication', 'Medication'), ('allergy', 'Allergy')], max_length=20)),
+                ('name', models.CharField(max_length=255)),
+            ],
+            options={
+                'unique_together': {('term_type', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PatientMedicalTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='ehr.medicalterm')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='medical_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('term', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+import re
+from django.db import migrations
+
+# Frozen copy of ehr.indexing's normalization, so later changes to the live
+# module cannot alter what this migration does
+TERM_SEPARATORS = re.compile(r'[,;\n]+')
+WHITESPACE = re.compile(r'\s+')
+
+def normalize_term(value):
+    return WHITESPACE.sub(' ', value or '').strip().lower()
+
+def normalize_terms(text):
+    if not text:
+        return set()
+    terms = (normalize_term(part) for part in TERM_SEPARATORS.split(text))
+    return {term for term in terms if term}
+
+def backfill_medical_terms(apps, schema_editor):
+    """
+    Index existing patients' conditions, medications (free text and active
+    prescriptions) and allergies, as ehr.indexing.index_patient does for
+    patients saved from now on
+    """
+    Patient = apps.get_model('ehr', 'Patient')
+    Prescription = apps.get_model('ehr', 'Prescription')
+    MedicalTerm = apps.get_model('ehr', 'MedicalTerm')
+    PatientMedicalTerm = apps.get_model('ehr', 'PatientMedicalTerm')
+
+    wanted = {}
+    patients = Patient.objects.values_list('user_id', 'chronic_conditions', 'current_medications', 'allergies')
+    for user_id, conditions, medications, allergies in patients.iterator(chunk_size=2000):
+        wanted[user_id] = (
+            {('condition', name) for name in normalize_terms(conditions)}
+            | {('medication', name) for name in normalize_terms(medications)}
+            | {('allergy', name) for name in normalize_terms(allergies)}
+        )
+    prescribed = Prescription.objects.filter(is_active=True).values_list(
+        'medical_record__patient__user_id', 'medication_name'
+    )
+    for user_id, medication_name in prescribed.iterator(chunk_size=2000):
+        name = normalize_term(medication_name)
+        if name and user_id in wanted:
+            wanted[user_id].add(('medication', name))
+
+    vocabulary = set().union(*wanted.values()) if wanted else set()
+    MedicalTerm.objects.bulk_create(
+        [MedicalTerm(term_type=term_type, name=name) for term_type, name in vocabulary],
+        batch_size=2000,
+        ignore_conflicts=True
+    )
+    term_ids = {
+        (term_type, name): term_id
+        for term_id, term_type, name in MedicalTerm.objects.values_list('id', 'term_type', 'name').iterator()
+    }
+    PatientMedicalTerm.objects.bulk_create(
+        [PatientMedicalTerm(user_id=user_id, term_id=term_ids[term])
+         for user_id, terms in wanted.items() for term in terms],
+        batch_size=2000,
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0003_medicalterm_patientmedicalterm'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_medical_terms, migrations.RunPython.noop),
+    ]
@@ -97,3 +97,33 @@ class Diagnosis(models.Model):
 
     def __str__(self):
         return f"{self.diagnosis_name} - {self.medical_record.patient}"
+
+class MedicalTerm(models.Model):
+    TERM_TYPE_CHOICES = (
+        ('condition', 'Condition'),
+        ('medication', 'Medication'),
+        ('allergy', 'Allergy'),
+    )
+
+    term_type = models.CharField(max_length=20, choices=TERM_TYPE_CHOICES)
+    name = models.CharField(max_length=255)  # Normalized: lowercase, single-spaced
+
+    class Meta:
+        unique_together = ['term_type', 'name']
+
+    def __str__(self):
+        return f"{self.term_type}: {self.name}"
+
+class PatientMedicalTerm(models.Model):
+    """
+    Posting linking a normalized medical term to a patient's user id.
+    Maintained by ehr.signals whenever a Patient or Prescription is saved.
+    """
+    term = models.ForeignKey(MedicalTerm, on_delete=models.CASCADE, related_name='postings')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='medical_terms')
+
+    class Meta:
+        unique_together = ['term', 'user']
+
+    def __str__(self):
+        return f"{self.term} - {self.user_id}"
@@ -1,9 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
-from .models import Patient, Prescription
+from .models import Patient, MedicalRecord, Prescription, PatientMedicalTerm
+from .indexing import index_patient, unindex_prescription
 
 # Import MCP models conditionally to avoid import errors when MCP app is not available
 try:
@@ -80,6 +81,37 @@ def create_demand_data_from_prescription(sender, instance, created, **kwargs):
             logger = logging.getLogger(__name__)
             logger.error(f"Error creating demand data from prescription: {e}")
 
+@receiver(post_save, sender=Patient)
+def index_patient_terms(sender, instance, **kwargs):
+    """
+    Keep condition, medication and allergy postings in sync with the patient profile
+    """
+    index_patient(instance)
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_terms(sender, instance, **kwargs):
+    """
+    Postings are keyed by user, so they outlive a deleted profile otherwise
+    """
+    PatientMedicalTerm.objects.filter(user_id=instance.user_id).delete()
+
+@receiver(post_save, sender=Prescription)
+def index_prescription_terms(sender, instance, **kwargs):
+    """
+    Re-index the patient's medications when a prescription changes
+    """
+    try:
+        patient = instance.medical_record.patient
+    except (MedicalRecord.DoesNotExist, Patient.DoesNotExist):
+        return
+    index_patient(patient)
+
+@receiver(post_delete, sender=Prescription)
+def unindex_prescription_terms(sender, instance, **kwargs):
+    # Only removes postings: the delete may be a cascade from the patient's
+    # user, where re-indexing would insert rows for a user being deleted
+    unindex_prescription(instance)
+
 # Connect the signal
 def ready(self):
     import ehr.signals
@@ -1,3 +1,169 @@
+from importlib import import_module
 from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from datetime import timedelta
 
-# Create your tests here.
+from ehr.models import Patient, MedicalRecord, Prescription, PatientMedicalTerm
+from ehr.indexing import normalize_terms, find_user_ids
+from inventory.models import MedicalItem
+from notifications.models import EmergencyBroadcast, Notification
+from notifications.services import EmergencyBroadcastService, NotificationService
+
+User = get_user_model()
+
+class MedicalTermIndexTestCase(TestCase):
+    """Test cases for the patient medical term index"""
+
+    def setUp(self):
+        """Set up patients with overlapping conditions and medications"""
+        self.both_user = self.create_patient(
+            'both', chronic_conditions='Type 2 Diabetes, Hypertension', current_medications='Metformin'
+        )
+        self.diabetic_user = self.create_patient(
+            'diabetic', chronic_conditions='Diabetes', allergies='Penicillin'
+        )
+        self.asthma_user = self.create_patient(
+            'asthma', chronic_conditions='Asthma', current_medications='Ventolin; Insulin'
+        )
+
+    def create_patient(self, username, **fields):
+        user = User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='testpass123',
+            user_type='patient',
+            city='Lagos'
+        )
+        # The User post_save signal already created the profile
+        patient = Patient.objects.get(user=user)
+        for name, value in fields.items():
+            setattr(patient, name, value)
+        patient.save()
+        return user
+
+    def test_normalize_terms(self):
+        """Free text is split and normalized"""
+        self.assertEqual(
+            normalize_terms(' Type 2  Diabetes;HYPERTENSION,\n, '),
+            {'type 2 diabetes', 'hypertension'}
+        )
+
+    def test_any_and_all_matching(self):
+        """OR targeting unions postings, AND targeting intersects them"""
+        any_ids = find_user_ids('condition', ['diabetes', 'asthma'], match='any')
+        all_ids = find_user_ids('condition', ['diabetes', 'hypertension'], match='all')
+
+        self.assertEqual(any_ids, {self.both_user.id, self.diabetic_user.id, self.asthma_user.id})
+        self.assertEqual(all_ids, {self.both_user.id})
+
+    def test_postings_follow_profile_updates(self):
+        """Editing the free-text field replaces stale postings"""
+        patient = self.asthma_user.patient_profile
+        patient.chronic_conditions = 'Hypertension'
+        patient.save()
+
+        self.assertEqual(find_user_ids('condition', ['asthma']), set())
+        self.assertIn(self.asthma_user.id, find_user_ids('condition', ['hypertension']))
+
+    def test_prescriptions_are_indexed_as_medications(self):
+        """Active prescriptions add medication postings and removal drops them"""
+        doctor = User.objects.create_user(username='doc', password='docpass123', user_type='doctor')
+        record = MedicalRecord.objects.create(
+            patient=self.diabetic_user.patient_profile,
+            record_type='consultation',
+            title='Review',
+            description='Review',
+            date_occurred=timezone.now(),
+            doctor=doctor
+        )
+        prescription = Prescription.objects.create(
+            medical_record=record,
+            medication_name='Insulin Glargine',
+            dosage='10 units',
+            frequency='daily',
+            duration='30 days'
+        )
+
+        self.assertEqual(
+            find_user_ids('medication', ['insulin']),
+            {self.diabetic_user.id, self.asthma_user.id}
+        )
+
+        prescription.delete()
+        self.assertEqual(find_user_ids('medication', ['insulin']), {self.asthma_user.id})
+
+    def test_migration_backfills_existing_patients(self):
+        """Patients saved before the index existed are indexed by the data migration"""
+        from django.apps import apps
+        backfill = import_module('ehr.migrations.0004_backfill_medical_terms')
+        expected = set(PatientMedicalTerm.objects.values_list('user_id', 'term__term_type', 'term__name'))
+        PatientMedicalTerm.objects.all().delete()
+
+        backfill.backfill_medical_terms(apps, None)
+        self.assertEqual(
+            set(PatientMedicalTerm.objects.values_list('user_id', 'term__term_type', 'term__name')), expected
+        )
+        self.assertEqual(find_user_ids('condition', ['diabetes']), {self.both_user.id, self.diabetic_user.id})
+
+    def test_deleting_user_with_prescriptions(self):
+        """Cascading a user's delete through their prescriptions leaves no postings behind"""
+        doctor = User.objects.create_user(username='doc', password='docpass123', user_type='doctor')
+        record = MedicalRecord.objects.create(
+            patient=self.diabetic_user.patient_profile,
+            record_type='consultation',
+            title='Review',
+            description='Review',
+            date_occurred=timezone.now(),
+            doctor=doctor
+        )
+        for name in ('Insulin Glargine', 'Metformin'):
+            Prescription.objects.create(
+                medical_record=record, medication_name=name, dosage='1', frequency='daily', duration='30 days'
+            )
+
+        self.diabetic_user.delete()
+
+        self.assertFalse(PatientMedicalTerm.objects.filter(user_id=self.diabetic_user.id).exists())
+        self.assertEqual(find_user_ids('medication', ['metformin']), {self.both_user.id})
+
+    def test_broadcast_targets_conditions_and_medications(self):
+        """Broadcast targeting honors every condition and target_medications"""
+        broadcast = EmergencyBroadcast.objects.create(
+            title='Heat wave',
+            message='Stay hydrated',
+            emergency_type='health_advisory',
+            urgency_level='warning',
+            regions=['Lagos'],
+            target_conditions=['diabetes', 'asthma'],
+            target_medications=['insulin'],
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+
+        targeted = set(EmergencyBroadcastService.get_targeted_users(broadcast).values_list('id', flat=True))
+        self.assertEqual(targeted, {self.asthma_user.id})
+
+        broadcast.target_medications = []
+        broadcast.medical_match_mode = 'all'
+        broadcast.target_conditions = ['diabetes', 'hypertension']
+        targeted = set(EmergencyBroadcastService.get_targeted_users(broadcast).values_list('id', flat=True))
+        self.assertEqual(targeted, {self.both_user.id})
+
+    def test_notification_recipients_match_generic_name(self):
+        """Medical item targeting matches brand and generic medication names"""
+        item = MedicalItem.objects.create(
+            name='Glucophage',
+            generic_name='Metformin',
+            category='medication',
+            unit_of_measure='tablets'
+        )
+        notification = Notification(
+            title='Stock update',
+            message='Back in stock',
+            notification_type='stock_update',
+            related_medical_item=item
+        )
+
+        recipients = NotificationService.get_recipients_for_notification(notification)
+        self.assertEqual(list(recipients.values_list('id', flat=True)), [self.both_user.id])
+        self.assertEqual(PatientMedicalTerm.objects.filter(user=self.both_user).count(), 3)
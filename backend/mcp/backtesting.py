@@ -0,0 +1,190 @@
+"""
+Backtests for the prediction engine. Each cutoff replays the engine as it
+would have run then: demand history up to the cutoff, supply reconstructed
+from stock transactions, and shortage predictions compared against the
+demand that actually followed. Context factors come from live sources and
+cannot be replayed, so backtests use a neutral context impact of 1.0.
+"""
+import logging
+import time
+from datetime import timedelta
+import numpy as np
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from inventory.models import Inventory, StockTransaction
+from .forecasting import model_version
+from .models import BacktestResult, DemandData
+from .prediction_engine import MCPPredictionEngine
+
+logger = logging.getLogger(__name__)
+
+def accuracy_metrics(forecast, actual, predicted_shortage, actual_shortage):
+    """
+    MAPE and relative bias of daily forecasts over series with actual
+    demand, and shortage hit, miss and false alarm rates. Inputs are
+    aligned arrays, one entry per (series, cutoff); actual is NaN where no
+    demand was recorded. Metrics that cannot be measured are None.
+    """
+    forecast, actual = np.asarray(forecast, dtype=float), np.asarray(actual, dtype=float)
+    predicted_shortage, actual_shortage = np.asarray(predicted_shortage, bool), np.asarray(actual_shortage, bool)
+
+    measured = ~np.isnan(actual) & (actual > 0)
+    errors = forecast[measured] - actual[measured]
+    actual_shortages = int(actual_shortage.sum())
+    predicted_shortages = int(predicted_shortage.sum())
+    hits = int((predicted_shortage & actual_shortage).sum())
+
+    def ratio(numerator, denominator):
+        return float(numerator / denominator) if denominator else None
+
+    hit_rate = ratio(hits, actual_shortages)
+    return {
+        'mape': float(np.mean(np.abs(errors) / actual[measured])) if measured.any() else None,
+        'bias': ratio(errors.sum(), actual[measured].sum()),
+        'hit_rate': hit_rate,
+        'miss_rate': None if hit_rate is None else 1.0 - hit_rate,
+        'false_alarm_rate': ratio(predicted_shortages - hits, predicted_shortages),
+        'actual_shortages': actual_shortages,
+        'predicted_shortages': predicted_shortages,
+    }
+
+def supply_at(cutoff, medical_item_ids, regions):
+    """
+    {(medical item id, region): stock} as of the cutoff: each inventory's
+    stock after its last transaction before the cutoff, else before its
+    first transaction after it, else its current stock
+    """
+    stock_before = StockTransaction.objects.filter(
+        inventory=OuterRef('pk'), transaction_date__lte=cutoff
+    ).order_by('-transaction_date', '-id').values('new_stock')[:1]
+    stock_after = StockTransaction.objects.filter(
+        inventory=OuterRef('pk'), transaction_date__gt=cutoff
+    ).order_by('transaction_date', 'id').values('previous_stock')[:1]
+
+    rows = Inventory.objects.filter(
+        medical_item_id__in=medical_item_ids,
+        vendor__city__in=regions,
+        is_available=True,
+        created_at__lte=cutoff
+    ).annotate(
+        stock_before=Subquery(stock_before), stock_after=Subquery(stock_after)
+    ).values_list('medical_item_id', 'vendor__city', 'stock_before', 'stock_after', 'current_stock')
+
+    supply = {}
+    for item_id, region, before, after, current in rows:
+        stock = next(value for value in (before, after, current) if value is not None)
+        if stock > 0:
+            supply[item_id, region] = supply.get((item_id, region), 0) + stock
+    return supply
+
+def config_model_version(config):
+    """
+    Version label for the config's forecasting setup; per-item model
+    overrides make it a different setup from the default model alone
+    """
+    version = model_version(config.forecast_model)
+    return version + '+item-overrides' if config.item_forecast_models else version
+
+def default_cutoffs(count, step_days, horizon_days, end=None):
+    """
+    `count` cutoffs `step_days` apart, oldest first, the latest leaving a
+    full horizon of known demand before `end` (now)
+    """
+    latest = (end or timezone.now()) - timedelta(days=horizon_days)
+    return [latest - timedelta(days=step_days * index) for index in reversed(range(count))]
+
+class Backtester:
+    def __init__(self, config_name="default"):
+        self.engine = MCPPredictionEngine(config_name)
+        self.config = self.engine.config
+
+    def series_for(self, cutoffs, horizon_days, days_back, regions=None, medical_items=None):
+        """
+        (medical item id, region) series with demand anywhere in the replayed span
+        """
+        rows = DemandData.objects.filter(
+            period_start__gte=min(cutoffs) - timedelta(days=days_back),
+            period_start__lt=max(cutoffs) + timedelta(days=horizon_days)
+        )
+        if regions:
+            rows = rows.filter(region__in=regions)
+        if medical_items:
+            rows = rows.filter(medical_item_id__in=medical_items)
+        return sorted(set(rows.values_list('medical_item_id', 'region')))
+
+    def evaluate(self, series, cutoff, horizon_days, days_back):
+        """
+        Aligned arrays for one cutoff: daily forecast, actual mean daily
+        demand, predicted and actual shortage flags. Also returns the
+        seconds spent fitting and predicting.
+        """
+        started = time.perf_counter()
+        forecasts = self.engine.forecast_demand(series, horizon_days, days_back, end_date=cutoff)
+        supply = supply_at(cutoff, {item_id for item_id, _ in series}, {region for _, region in series})
+        predictions = [
+            self.engine.build_prediction(item_id, region, forecasts[item_id, region], supply.get((item_id, region), 0),
+                                         1.0, horizon_days)
+            for item_id, region in series
+        ]
+        elapsed = time.perf_counter() - started
+
+        actual = self.engine.load_demand_history(series, horizon_days, end_date=cutoff + timedelta(days=horizon_days))
+        observed = ~np.isnan(actual)
+        actual_total = np.where(observed, actual, 0.0).sum(axis=1)
+        observed_days = observed.sum(axis=1)
+        actual_daily = np.divide(
+            actual_total, observed_days, out=np.full(len(series), np.nan), where=observed_days > 0
+        )
+        stock = np.array([prediction['current_supply'] for prediction in predictions], dtype=float)
+
+        return {
+            'forecast': np.array([prediction['predicted_demand'] for prediction in predictions]),
+            'actual': actual_daily,
+            'predicted_shortage': np.array([
+                prediction['days_until_shortage'] <= horizon_days and prediction['confidence_score'] >= 0.5
+                for prediction in predictions
+            ], dtype=bool),
+            'actual_shortage': actual_total > stock,
+        }, elapsed
+
+    def run(self, cutoffs, horizon_days=None, days_back=None, model=None, regions=None, medical_items=None):
+        """
+        Backtest over the cutoffs and store a BacktestResult. `model` replays
+        a single forecast model for every item instead of the config's.
+        """
+        horizon_days = horizon_days or self.config.prediction_horizon_days
+        days_back = days_back or self.config.history_days
+        if model:
+            self.config.forecast_model, self.config.item_forecast_models = model, {}
+        version = config_model_version(self.config)
+
+        started = time.monotonic()
+        series = self.series_for(cutoffs, horizon_days, days_back, regions, medical_items)
+        results, fit_seconds = [], 0.0
+        for cutoff in cutoffs:
+            if series:
+                result, elapsed = self.evaluate(series, cutoff, horizon_days, days_back)
+                results.append(result)
+                fit_seconds += elapsed
+
+        evaluated = len(series) * len(results)
+        metrics = accuracy_metrics(*(
+            np.concatenate([result[field] for result in results]) if results else np.zeros(0)
+            for field in ('forecast', 'actual', 'predicted_shortage', 'actual_shortage')
+        ))
+        backtest = BacktestResult.objects.create(
+            config=self.config,
+            model_version=version,
+            cutoffs=[cutoff.isoformat() for cutoff in cutoffs],
+            horizon_days=horizon_days,
+            history_days=days_back,
+            series_count=evaluated,
+            runtime_per_1k_series=fit_seconds * 1000 / evaluated if evaluated else 0.0,
+            duration_seconds=round(time.monotonic() - started, 3),
+            **metrics
+        )
+        logger.info(
+            f"Backtest {backtest.id} ({version}): {evaluated} series-cutoffs, MAPE {backtest.mape}, "
+            f"hit rate {backtest.hit_rate}, {backtest.runtime_per_1k_series:.3f}s per 1k series"
+        )
+        return backtest
@@ -0,0 +1,240 @@
+"""
+Columnar copy of DemandData for analytics: one dense (medical item x day)
+float64 matrix per region, saved as .npy and read back memory-mapped.
+
+Each region directory holds versioned matrix, item and row-count files plus
+a meta.json naming the current version. A sync writes a new version and then
+replaces meta.json, so readers always see a consistent set and mappings
+opened on an older version stay valid. The version meta.json last named is
+kept until the next write, for readers that read meta.json just before it
+changed; a reader that still finds its files gone re-reads meta.json.
+
+The store is only as fresh as its last sync, which the prediction scheduler
+runs every tick (or run sync_demand_store).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.text import slugify
+from .forecasting import demand_matrix
+from .models import DemandData
+
+logger = logging.getLogger(__name__)
+
+LOAD_ATTEMPTS = 3
+
+RegionHistory = namedtuple('RegionHistory', ['items', 'row_counts', 'start_date', 'matrix', 'synced_at', 'version'])
+
+def region_directory(region):
+    digest = hashlib.sha1(region.encode()).hexdigest()[:8]
+    return f"{slugify(region) or 'region'}-{digest}"
+
+class DemandStore:
+    """
+    Per-region (item x day) demand matrices under DEMAND_STORE_DIR. Items are
+    rows in ascending id order; day 0 is the region's earliest demand day.
+    Days without data are NaN.
+    """
+    def __init__(self, root=None):
+        self.root = Path(root or settings.DEMAND_STORE_DIR)
+
+    @staticmethod
+    def enabled():
+        return bool(settings.DEMAND_STORE_DIR)
+
+    def region_path(self, region):
+        return self.root / region_directory(region)
+
+    def load(self, region):
+        """
+        The region's RegionHistory with the matrix memory-mapped read-only,
+        or None if it has never been synced
+        """
+        path = self.region_path(region)
+        for attempt in range(LOAD_ATTEMPTS):
+            try:
+                meta = json.loads((path / 'meta.json').read_text())
+            except FileNotFoundError:
+                return None
+
+            version = meta['version']
+            try:
+                return RegionHistory(
+                    items=np.load(path / f"items-{version}.npy"),
+                    row_counts=np.load(path / f"counts-{version}.npy"),
+                    start_date=date.fromisoformat(meta['start_date']),
+                    matrix=np.load(path / f"matrix-{version}.npy", mmap_mode='r'),
+                    synced_at=datetime.fromisoformat(meta['synced_at']),
+                    version=version
+                )
+            except FileNotFoundError:
+                # Two syncs replaced the version between reading meta.json and its files
+                if attempt == LOAD_ATTEMPTS - 1:
+                    raise
+
+    def synced_at(self, regions):
+        """
+        The earliest last sync among `regions`, or None if none was synced
+        """
+        times = []
+        for region in regions:
+            try:
+                meta = json.loads((self.region_path(region) / 'meta.json').read_text())
+            except FileNotFoundError:
+                continue
+            times.append(datetime.fromisoformat(meta['synced_at']))
+        return min(times, default=None)
+
+    def changed_items(self, region, current):
+        """
+        Item ids whose rows changed since the last sync: rows written since
+        the watermark (less the dirty margin for in-flight writes), and items
+        whose row count moved, which catches deletes
+        """
+        since = current.synced_at - timedelta(seconds=settings.PREDICTION_DIRTY_MARGIN_SECONDS)
+        changed = set(DemandData.objects.filter(
+            region=region, updated_at__gt=since
+        ).values_list('medical_item_id', flat=True).distinct())
+
+        counts = dict(DemandData.objects.filter(region=region).values('medical_item_id').annotate(
+            rows=Count('id')
+        ).values_list('medical_item_id', 'rows'))
+        stored = dict(zip(current.items.tolist(), current.row_counts.tolist()))
+        changed.update(
+            item_id for item_id in counts.keys() | stored.keys()
+            if counts.get(item_id, 0) != stored.get(item_id, 0)
+        )
+        return changed
+
+    def sync_region(self, region, rebuild=False):
+        """
+        Bring the region's files up to date with DemandData, reloading only
+        items that changed. Returns the number of items reloaded.
+        """
+        synced_at = timezone.now()
+        current = None if rebuild else self.load(region)
+        rows = DemandData.objects.filter(region=region)
+        if current is not None:
+            changed = self.changed_items(region, current)
+            if not changed:
+                # Only the watermark moves
+                self.write_meta(region, current._replace(synced_at=synced_at))
+                return 0
+            rows = rows.filter(medical_item_id__in=changed)
+        rows = list(rows.values_list('medical_item_id', 'region', 'period_start', 'demand_count'))
+
+        reloaded = {item_id for item_id, _, _, _ in rows}
+        if current is not None:
+            reloaded |= changed
+        if current is None and not rows:
+            return 0
+
+        days_seen = [period_start.date() for _, _, period_start, _ in rows]
+        start_date = min(days_seen, default=current.start_date if current else None)
+        end_date = max(days_seen, default=start_date)
+        if current is not None:
+            start_date = min(start_date, current.start_date)
+            end_date = max(end_date, current.start_date + timedelta(days=current.matrix.shape[1] - 1))
+        days = (end_date - start_date).days + 1
+
+        items = np.array(sorted(reloaded | set(current.items.tolist() if current else ())), dtype=np.int64)
+        matrix = np.full((len(items), days), np.nan)
+        row_counts = np.zeros(len(items), dtype=np.int64)
+        if current is not None and len(current.items):
+            rows_at = np.searchsorted(items, current.items)
+            offset = (current.start_date - start_date).days
+            matrix[rows_at, offset:offset + current.matrix.shape[1]] = current.matrix
+            row_counts[rows_at] = current.row_counts
+
+        reloaded_at = np.searchsorted(items, np.array(sorted(reloaded), dtype=np.int64))
+        series = [(int(item_id), region) for item_id in items[reloaded_at]]
+        matrix[reloaded_at] = demand_matrix(rows, series, start_date, days)
+        counted = {}
+        for item_id, _, _, _ in rows:
+            counted[item_id] = counted.get(item_id, 0) + 1
+        row_counts[reloaded_at] = [counted.get(item_id, 0) for item_id, _ in series]
+
+        self.write(region, RegionHistory(items, row_counts, start_date, matrix, synced_at, None))
+        logger.info(f"Demand store: {region} synced, {len(reloaded)} of {len(items)} items reloaded")
+        return len(reloaded)
+
+    def sync(self, regions=None, rebuild=False):
+        """
+        Sync the given regions (every region with demand by default).
+        Returns {region: items reloaded}.
+        """
+        if regions is None:
+            regions = DemandData.objects.values_list('region', flat=True).distinct()
+        return {region: self.sync_region(region, rebuild) for region in sorted(set(regions))}
+
+    def write(self, region, history):
+        """
+        Save the history as a new version, switch meta.json to it and remove
+        versions older than the one it replaced
+        """
+        path = self.region_path(region)
+        path.mkdir(parents=True, exist_ok=True)
+        version = f"{history.synced_at.strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+        np.save(path / f"items-{version}.npy", history.items)
+        np.save(path / f"counts-{version}.npy", history.row_counts)
+        np.save(path / f"matrix-{version}.npy", history.matrix)
+
+        previous = self.write_meta(region, history._replace(version=version))
+        for file in path.glob('*.npy'):
+            if file.stem.split('-', 1)[1] not in (version, previous):
+                file.unlink(missing_ok=True)
+
+    def write_meta(self, region, history):
+        """
+        Atomically replace meta.json. Returns the version it replaced.
+        """
+        path = self.region_path(region)
+        meta_path = path / 'meta.json'
+        previous = json.loads(meta_path.read_text())['version'] if meta_path.exists() else None
+        meta = {
+            'region': region,
+            'version': history.version,
+            'start_date': history.start_date.isoformat(),
+            'synced_at': history.synced_at.isoformat(),
+        }
+        temporary = path / f"meta.json.{os.getpid()}.{threading.get_ident()}"
+        temporary.write_text(json.dumps(meta))
+        os.replace(temporary, meta_path)
+        return previous
+
+    def history(self, series, start_date, days):
+        """
+        (series x days) daily demand from `start_date` for (medical item id,
+        region) series, NaN outside the stored range. Only the requested
+        rows and days are read from the mapped files.
+        """
+        matrix = np.full((len(series), days), np.nan)
+        by_region = {}
+        for row, (item_id, region) in enumerate(series):
+            by_region.setdefault(region, []).append((row, item_id))
+
+        for region, entries in by_region.items():
+            stored = self.load(region)
+            if stored is None or not len(stored.items):
+                continue
+            rows = np.array([row for row, _ in entries])
+            item_ids = np.array([item_id for _, item_id in entries], dtype=np.int64)
+            positions = np.minimum(np.searchsorted(stored.items, item_ids), len(stored.items) - 1)
+            found = stored.items[positions] == item_ids
+
+            offset = (start_date - stored.start_date).days
+            first = max(offset, 0)
+            last = min(offset + days, stored.matrix.shape[1])
+            if first >= last or not found.any():
+                continue
+            matrix[rows[found], first - offset:last - offset] = stored.matrix[positions[found], first:last]
+        return matrix
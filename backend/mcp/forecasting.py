@@ -0,0 +1,311 @@
+"""
+Vectorized demand forecasting. Pure NumPy with no Django imports, so it can
+run in worker processes that never set up Django.
+"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+# Default size (series x days) below which parallel fits run in-process;
+# about 0.1s of fitting, against a few milliseconds to ship work to the pool
+PARALLEL_MIN_CELLS = 2000000
+
+class Forecaster:
+    """
+    Demand forecaster fitted to many series at once. Series are the rows of a
+    (series x days) matrix of daily demand, oldest day first, with NaN for days
+    without data. Fitting is vectorized across rows; recursive models loop
+    over days only.
+    """
+    name = None
+    version = 1  # Bump when a change alters forecasts, so backtests are kept apart
+
+    def fit(self, matrix):
+        matrix = np.asarray(matrix, dtype=float)
+        self.observed = ~np.isnan(matrix)
+        self.counts = self.observed.sum(axis=1)
+        totals = np.where(self.observed, matrix, 0.0).sum(axis=1)
+        self.mean = np.divide(totals, self.counts, out=np.zeros(len(matrix)), where=self.counts > 0)
+        self.n_days = matrix.shape[1]
+        self._fit(matrix)
+        return self
+
+    def _fit(self, matrix):
+        raise NotImplementedError
+
+    def forecast(self, horizon):
+        """
+        Daily demand for the next `horizon` days: (series x horizon), never negative
+        """
+        return np.maximum(self._forecast(np.arange(1, horizon + 1)), 0.0)
+
+    def _forecast(self, steps):
+        raise NotImplementedError
+
+class OLSTrendForecaster(Forecaster):
+    """
+    Ordinary least squares line through each series' observed days
+    """
+    name = 'ols_trend'
+
+    def _fit(self, matrix):
+        weights = self.observed.astype(float)
+        x = np.arange(self.n_days, dtype=float)
+        y = np.where(self.observed, matrix, 0.0)
+
+        sw = weights.sum(axis=1)
+        sx = weights @ x
+        sxx = weights @ (x * x)
+        sy = y.sum(axis=1)
+        sxy = y @ x
+
+        denominator = sw * sxx - sx * sx
+        has_slope = denominator > 0
+        self.trend = np.divide(sw * sxy - sx * sy, denominator, out=np.zeros(len(matrix)), where=has_slope)
+        self.intercept = np.divide(sy - self.trend * sx, sw, out=np.zeros(len(matrix)), where=sw > 0)
+
+    def _forecast(self, steps):
+        return self.intercept[:, None] + self.trend[:, None] * (self.n_days - 1 + steps)
+
+class ExponentialSmoothingForecaster(Forecaster):
+    """
+    Simple exponential smoothing: a flat forecast at the smoothed level.
+    Missing days leave the level unchanged.
+    """
+    name = 'exponential_smoothing'
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+
+    def _fit(self, matrix):
+        self.level = self.mean.copy()
+        first = self.observed.argmax(axis=1)
+        has_data = self.counts > 0
+        rows = np.arange(len(matrix))
+        self.level[has_data] = matrix[rows[has_data], first[has_data]]
+
+        for day in range(self.n_days):
+            values = matrix[:, day]
+            observed = self.observed[:, day]
+            self.level = np.where(observed, self.alpha * values + (1 - self.alpha) * self.level, self.level)
+        self.trend = np.zeros(len(matrix))
+
+    def _forecast(self, steps):
+        return np.repeat(self.level[:, None], len(steps), axis=1)
+
+class HoltWintersForecaster(Forecaster):
+    """
+    Additive Holt-Winters with weekly seasonality. Series shorter than two
+    seasons, or a season_length of 1, are fitted without the seasonal
+    component (Holt's linear trend).
+    """
+    name = 'holt_winters'
+
+    def __init__(self, alpha=0.3, beta=0.1, gamma=0.2, season_length=7):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.season_length = season_length
+
+    def _fit(self, matrix):
+        m = self.season_length
+        count = len(matrix)
+        seasonal = m > 1 and self.n_days >= 2 * m
+
+        if seasonal:
+            first = matrix[:, :m]
+            second = matrix[:, m:2 * m]
+            first_mean = self._nanmean(first)
+            second_mean = self._nanmean(second)
+            both = ~np.isnan(first_mean) & ~np.isnan(second_mean)
+            self.level = np.where(np.isnan(first_mean), self.mean, first_mean)
+            self.trend = np.where(both, (second_mean - first_mean) / m, 0.0)
+            self.season = np.nan_to_num(first - self.level[:, None])
+        else:
+            self.level = self.mean.copy()
+            self.trend = np.zeros(count)
+            self.season = np.zeros((count, m))
+
+        for day in range(self.n_days):
+            values = matrix[:, day]
+            observed = self.observed[:, day]
+            slot = day % m
+            season = self.season[:, slot]
+            previous_level = self.level
+
+            level = self.alpha * (values - season) + (1 - self.alpha) * (previous_level + self.trend)
+            trend = self.beta * (level - previous_level) + (1 - self.beta) * self.trend
+            self.level = np.where(observed, level, previous_level + self.trend)
+            self.trend = np.where(observed, trend, self.trend)
+            if seasonal:
+                updated = self.gamma * (values - self.level) + (1 - self.gamma) * season
+                self.season[:, slot] = np.where(observed, updated, season)
+
+    def _nanmean(self, block):
+        observed = ~np.isnan(block)
+        counts = observed.sum(axis=1)
+        totals = np.where(observed, block, 0.0).sum(axis=1)
+        return np.divide(totals, counts, out=np.full(len(block), np.nan), where=counts > 0)
+
+    def _forecast(self, steps):
+        slots = (self.n_days - 1 + steps) % self.season_length
+        return self.level[:, None] + self.trend[:, None] * steps + self.season[:, slots]
+
+FORECASTERS = {
+    forecaster.name: forecaster
+    for forecaster in (OLSTrendForecaster, ExponentialSmoothingForecaster, HoltWintersForecaster)
+}
+
+def get_forecaster(name, seasonal=True):
+    """
+    Forecaster for the model name. Non-seasonal fits are for matrices whose
+    columns are weeks or months rather than days.
+    """
+    forecaster = FORECASTERS.get(name, OLSTrendForecaster)
+    if forecaster is HoltWintersForecaster and not seasonal:
+        return forecaster(season_length=1)
+    return forecaster()
+
+def model_version(name):
+    forecaster = FORECASTERS.get(name, OLSTrendForecaster)
+    return f"{forecaster.name}-v{forecaster.version}"
+
+def demand_matrix(rows, series, start_date, days):
+    """
+    Bin (medical item id, region, period start, demand count) rows into a
+    (series x days) matrix of daily demand, NaN where a day has no data.
+    `series` lists the (medical item id, region) keys in row order.
+    """
+    matrix = np.full((len(series), days), np.nan)
+    if not rows:
+        return matrix
+
+    positions = {key: index for index, key in enumerate(series)}
+    item_ids, regions, starts, counts = zip(*rows)
+    row_index = np.fromiter(
+        (positions.get(key, -1) for key in zip(item_ids, regions)), dtype=np.int64, count=len(rows)
+    )
+    day_index = (
+        np.array([period_start.date() for period_start in starts], dtype='datetime64[D]')
+        - np.datetime64(start_date, 'D')
+    ).astype(np.int64)
+    keep = (row_index >= 0) & (day_index >= 0) & (day_index < days)
+
+    row_index, day_index = row_index[keep], day_index[keep]
+    values = np.asarray(counts, dtype=float)[keep]
+    matrix[row_index, day_index] = 0.0
+    np.add.at(matrix, (row_index, day_index), values)
+    return matrix
+
+def fit_arrays(matrix, models, prediction_days, seasonal=True):
+    """
+    Fit each row of the demand matrix with its named model, one vectorized
+    fit per model. Returns (avg_demand, trend, daily_forecast) arrays, where
+    daily_forecast is the mean daily demand over the horizon.
+    """
+    models = np.asarray(models)
+    avg_demand, trend, daily_forecast = (np.zeros(len(matrix)) for _ in range(3))
+    for name in np.unique(models):
+        rows = np.flatnonzero(models == name)
+        forecaster = get_forecaster(name, seasonal).fit(matrix[rows])
+        avg_demand[rows] = forecaster.mean
+        trend[rows] = forecaster.trend
+        daily_forecast[rows] = forecaster.forecast(prediction_days).mean(axis=1)
+    return avg_demand, trend, daily_forecast
+
+def fit_forecasts(matrix, series, models, prediction_days, seasonal=True):
+    """
+    {series key: (avg_demand, trend, daily_forecast)} for the matrix rows
+    """
+    return {
+        key: (float(avg_demand), float(trend), float(forecast))
+        for key, avg_demand, trend, forecast in zip(series, *fit_arrays(matrix, models, prediction_days, seasonal))
+    }
+
+def partition_series(series, partitions):
+    """
+    Split (medical item id, region) series into row-index partitions. Whole
+    regions are packed onto the least loaded partition, largest first; with
+    fewer regions than partitions, series are dealt round-robin instead.
+    """
+    regions = {}
+    for row, (_, region) in enumerate(series):
+        regions.setdefault(region, []).append(row)
+
+    if len(regions) >= partitions:
+        parts = [[] for _ in range(partitions)]
+        loads = [0] * partitions
+        for rows in sorted(regions.values(), key=len, reverse=True):
+            target = loads.index(min(loads))
+            parts[target].extend(rows)
+            loads[target] += len(rows)
+    else:
+        parts = [list(range(offset, len(series), partitions)) for offset in range(partitions)]
+
+    return [np.asarray(sorted(rows)) for rows in parts if rows]
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def get_pool(workers):
+    """
+    The process pool shared by every parallel fit in this process, started
+    on first use and replaced when the worker count changes.
+    Starting spawn workers costs far more than a typical fit, so the pool
+    outlives calls.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            # spawn: workers import only this module, never Django, and do not
+            # inherit the parent's threads or database connections
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+def shutdown_pool(wait=True):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
+
+atexit.register(shutdown_pool)
+
+def fit_forecasts_parallel(matrix, series, models, prediction_days, workers=1, seasonal=True,
+                           min_cells=PARALLEL_MIN_CELLS):
+    """
+    fit_forecasts across the shared process pool, one partition per worker.
+    Workers receive only their slice of the matrix and return plain arrays;
+    the results are merged in the caller's process. Matrices under
+    `min_cells` (series x days) are fitted in-process, where the pool's
+    transfer overhead would outweigh the fit.
+    """
+    if workers <= 1 or len(series) < 2 or np.size(matrix) < min_cells:
+        return fit_forecasts(matrix, series, models, prediction_days, seasonal)
+
+    models = np.asarray(models)
+    avg_demand, trend, daily_forecast = (np.zeros(len(series)) for _ in range(3))
+    parts = partition_series(series, workers)
+    pool = get_pool(workers)
+    try:
+        futures = [(rows, pool.submit(fit_arrays, matrix[rows], models[rows], prediction_days, seasonal))
+                   for rows in parts]
+        for rows, future in futures:
+            avg_demand[rows], trend[rows], daily_forecast[rows] = future.result()
+    except BrokenProcessPool:
+        # A worker died; the next call starts a fresh pool
+        shutdown_pool(wait=False)
+        raise
+
+    return {
+        key: (float(avg), float(slope), float(forecast))
+        for key, avg, slope, forecast in zip(series, avg_demand, trend, daily_forecast)
+    }
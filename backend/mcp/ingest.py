@@ -0,0 +1,197 @@
+"""
+Bulk DemandData ingestion. Records arrive as an iterator of dicts (parsed
+JSON, or streamed CSV/NDJSON lines) and are handled in chunks: each chunk is
+validated with vectorized pandas operations, item references are resolved
+from an in-memory map, and rows are upserted with one bulk_create.
+
+bulk_create skips signals, so each chunk refreshes the demand rollups
+itself. Upserts set updated_at, which incremental prediction runs and the
+demand store use to find changed series.
+"""
+import csv
+import json
+import logging
+from itertools import islice
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from inventory.models import MedicalItem
+from .models import DemandData
+from .rollups import refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+# What happens to a row whose (medical item, region, period start) already exists
+DUPLICATE_POLICIES = ('replace', 'sum')
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+
+def read_csv(lines):
+    """
+    Records from CSV lines (bytes or str) with a header row
+    """
+    decoded = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in lines)
+    yield from csv.DictReader(decoded)
+
+def read_ndjson(lines):
+    """
+    Records from newline-delimited JSON; lines that do not parse to an
+    object are passed on as None and rejected during validation
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+class DemandIngestor:
+    """
+    Upserts demand records in chunks. `ingest` returns counts of rows
+    created, updated and rejected; the first DEMAND_INGEST_MAX_ERRORS
+    rejections are kept in `errors` with their 1-based record number.
+    """
+    def __init__(self, policy='replace', chunk_size=None):
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        self.policy = policy
+        self.chunk_size = chunk_size or settings.DEMAND_INGEST_CHUNK_SIZE
+        items = list(MedicalItem.objects.values_list('id', 'name'))
+        self.item_ids = {item_id for item_id, _ in items}
+        self.item_ids_by_name = {name.strip().lower(): item_id for item_id, name in items}
+        self.stats = {'total_processed': 0, 'created': 0, 'updated': 0, 'rejected': 0}
+        self.errors = []
+
+    def ingest(self, records):
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self.ingest_chunk(chunk, self.stats['total_processed'] + 1)
+            self.stats['total_processed'] += len(chunk)
+        logger.info(
+            f"Demand ingest ({self.policy}): {self.stats['created']} created, {self.stats['updated']} updated, "
+            f"{self.stats['rejected']} rejected of {self.stats['total_processed']}"
+        )
+        return self.stats
+
+    def reject(self, row_number, messages):
+        self.stats['rejected'] += 1
+        if len(self.errors) < settings.DEMAND_INGEST_MAX_ERRORS:
+            self.errors.append({'row': row_number, 'errors': messages})
+
+    def ingest_chunk(self, chunk, first_row):
+        rows = [record for record in chunk if record is not None]
+        for offset, record in enumerate(chunk):
+            if record is None:
+                self.reject(first_row + offset, ['Not a JSON object'])
+        numbers = np.array([first_row + offset for offset, record in enumerate(chunk) if record is not None])
+        if not rows:
+            return
+
+        frame = self.validate(pd.DataFrame.from_records(rows), numbers)
+        if len(frame):
+            self.write(frame)
+
+    def validate(self, frame, numbers):
+        """
+        Normalized valid rows; invalid ones are rejected with every problem found
+        """
+        def column(name):
+            return frame[name] if name in frame else pd.Series([None] * len(frame), index=frame.index)
+
+        def text(name):
+            values = column(name).astype('string').str.strip()
+            return values.mask(values == '')
+
+        item_ids = pd.to_numeric(column('medical_item'), errors='coerce')
+        item_ids = item_ids.where(item_ids.isin(self.item_ids))
+        item_ids = item_ids.fillna(text('medical_item_name').str.lower().map(self.item_ids_by_name))
+        region = text('region')
+        demand_count = pd.to_numeric(column('demand_count'), errors='coerce')
+        period_start = pd.to_datetime(column('period_start'), utc=True, errors='coerce', format='ISO8601')
+        period_end = pd.to_datetime(column('period_end'), utc=True, errors='coerce', format='ISO8601')
+        season = text('season')
+        outbreak_disease = text('outbreak_disease')
+
+        checks = [
+            (item_ids.isna(), 'Unknown medical item'),
+            (region.isna() | (region.str.len() > 100), 'region is required (at most 100 characters)'),
+            (demand_count.isna() | (demand_count < 0) | (demand_count % 1 != 0),
+             'demand_count must be a non-negative integer'),
+            (period_start.isna(), 'period_start must be an ISO 8601 datetime'),
+            (period_end.isna() | (period_end < period_start), 'period_end must be an ISO 8601 datetime after period_start'),
+            (season.str.len() > 50, 'season must be at most 50 characters'),
+            (outbreak_disease.str.len() > 100, 'outbreak_disease must be at most 100 characters'),
+        ]
+        failures = np.column_stack([failed.fillna(False).to_numpy(dtype=bool) for failed, _ in checks])
+        invalid = failures.any(axis=1)
+        for row in np.flatnonzero(invalid):
+            self.reject(int(numbers[row]), [
+                message for (_, message), failed in zip(checks, failures[row]) if failed
+            ])
+
+        valid = ~invalid
+        return pd.DataFrame({
+            'medical_item_id': item_ids[valid].astype(np.int64),
+            'region': region[valid].astype(object),
+            'demand_count': demand_count[valid].astype(np.int64),
+            'period_start': period_start[valid],
+            'period_end': period_end[valid],
+            'season': season[valid].astype(object).where(season[valid].notna(), None),
+            'disease_outbreak': column('disease_outbreak')[valid].astype(str).str.strip().str.lower().isin(TRUE_VALUES),
+            'outbreak_disease': outbreak_disease[valid].astype(object).where(outbreak_disease[valid].notna(), None),
+        })
+
+    def write(self, frame):
+        """
+        Upsert one chunk of valid rows. Repeats of a key within the chunk are
+        combined by the policy before touching the database.
+        """
+        key = ['medical_item_id', 'region', 'period_start']
+        if self.policy == 'sum':
+            frame = frame.groupby(key, as_index=False, sort=False).agg(
+                demand_count=('demand_count', 'sum'), period_end=('period_end', 'last'), season=('season', 'last'),
+                disease_outbreak=('disease_outbreak', 'last'), outbreak_disease=('outbreak_disease', 'last')
+            )
+        else:
+            frame = frame.drop_duplicates(key, keep='last')
+
+        item_ids = frame['medical_item_id'].tolist()
+        regions = frame['region'].tolist()
+        starts = list(frame['period_start'].dt.to_pydatetime())
+        ends = list(frame['period_end'].dt.to_pydatetime())
+        counts = frame['demand_count'].tolist()
+
+        with transaction.atomic():
+            existing = dict(
+                ((item_id, region, period_start), demand_count)
+                for item_id, region, period_start, demand_count in DemandData.objects.select_for_update().filter(
+                    medical_item_id__in=set(item_ids), region__in=set(regions), period_start__in=set(starts)
+                ).values_list('medical_item_id', 'region', 'period_start', 'demand_count')
+            )
+            keys = list(zip(item_ids, regions, starts))
+            if self.policy == 'sum':
+                counts = [count + existing.get(row_key, 0) for row_key, count in zip(keys, counts)]
+
+            DemandData.objects.bulk_create(
+                [DemandData(medical_item_id=item_id, region=region, period_start=period_start, period_end=period_end,
+                            demand_count=demand_count, season=season, disease_outbreak=disease_outbreak,
+                            outbreak_disease=outbreak_disease)
+                 for item_id, region, period_start, period_end, demand_count, season, disease_outbreak, outbreak_disease
+                 in zip(item_ids, regions, starts, ends, counts, frame['season'].tolist(),
+                        frame['disease_outbreak'].tolist(), frame['outbreak_disease'].tolist())],
+                update_conflicts=True,
+                unique_fields=['medical_item', 'region', 'period_start'],
+                update_fields=['demand_count', 'period_end', 'season', 'disease_outbreak', 'outbreak_disease',
+                               'updated_at']
+            )
+            refresh_rollups({(item_id, region, period_start.date()) for item_id, region, period_start in keys})
+
+        updated = sum(1 for row_key in keys if row_key in existing)
+        self.stats['updated'] += updated
+        self.stats['created'] += len(keys) - updated
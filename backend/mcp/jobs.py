@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import PredictionRun
+from .prediction_engine import MCPPredictionEngine
+
+logger = logging.getLogger(__name__)
+
+class RunCancelled(Exception):
+    pass
+
+class LeaseLost(Exception):
+    pass
+
+class RunAbandoned(Exception):
+    pass
+
+FINISH_FIELDS = (
+    'status', 'cancel_requested', 'error', 'started_at', 'finished_at', 'duration_seconds',
+    'series_done', 'series_count', 'series_recomputed', 'prediction_count', 'failure_count'
+)
+
+def start_heartbeat(run, heartbeat, lost):
+    """
+    Refresh the run's heartbeat_at (and call `heartbeat()`) every
+    PREDICTION_HEARTBEAT_SECONDS from a background thread, so a long fit or
+    save between progress updates is not taken for an abandoned run. Sets
+    `lost` once the run is no longer running or `heartbeat()` fails. Returns
+    the event that stops the thread.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.PREDICTION_HEARTBEAT_SECONDS):
+                alive = PredictionRun.objects.filter(id=run.id, status='running').update(
+                    heartbeat_at=timezone.now()
+                )
+                if not alive or (heartbeat is not None and not heartbeat()):
+                    lost.set()
+                    return
+        except Exception as e:
+            logger.error(f"Heartbeat for prediction run {run.id} failed: {str(e)}")
+        finally:
+            connection.close()
+
+    threading.Thread(target=beat, name=f'prediction-run-{run.id}-heartbeat', daemon=True).start()
+    return stop
+
+def execute_run(run, heartbeat=None):
+    """
+    Run and save predictions for a PredictionRun that is already marked
+    running, recording progress, counts and the outcome on the run.
+    `heartbeat()` is called with each progress update and on a timer, e.g.
+    to renew a scheduler lease; returning False stops the run as failed.
+    A run that was failed as abandoned meanwhile (fail_abandoned_jobs) keeps
+    that outcome, and its results are discarded if it had not saved them yet.
+    """
+    parameters = run.parameters
+    started = time.monotonic()
+    if run.started_at is None:
+        run.started_at = timezone.now()
+    lost = threading.Event()
+
+    def progress(series_done, series_count):
+        run.series_done, run.series_count = series_done, series_count
+        updated = PredictionRun.objects.filter(id=run.id, status='running', cancel_requested=False).update(
+            series_done=series_done, series_count=series_count, heartbeat_at=timezone.now()
+        )
+        if not updated:
+            if PredictionRun.objects.filter(id=run.id, status='running').exists():
+                raise RunCancelled()
+            raise RunAbandoned()
+        if lost.is_set() or (heartbeat is not None and not heartbeat()):
+            raise LeaseLost()
+
+    stop_heartbeat = start_heartbeat(run, heartbeat, lost)
+    try:
+        engine = MCPPredictionEngine(run.config.name)
+        predictions = engine.run_predictions(
+            regions=parameters.get('regions'),
+            medical_items=parameters.get('medical_item_ids'),
+            prediction_days=parameters.get('prediction_days', run.config.prediction_horizon_days),
+            progress=progress,
+            # Scheduled cycles only re-predict series whose inputs changed
+            incremental=parameters.get('incremental', run.trigger == 'schedule')
+        )
+        # Last chance to cancel, or to find the run abandoned, before anything is written
+        progress(run.series_count, run.series_count)
+        saved_predictions = engine.save_predictions(predictions, run=run)
+        run.status = 'succeeded'
+        run.failure_count = engine.run_stats['failures']
+        run.series_recomputed = engine.run_stats['recomputed']
+        run.prediction_count = len(saved_predictions)
+    except RunCancelled:
+        run.status = 'cancelled'
+        run.cancel_requested = True
+    except RunAbandoned:
+        pass
+    except LeaseLost:
+        # Another node may already be running this config
+        logger.warning(f"Prediction run {run.id} for {run.config.name} stopped: lease lost")
+        run.status = 'failed'
+        run.error = 'Stopped: lease lost before the run finished'
+    except Exception as e:
+        logger.error(f"Prediction run {run.id} for {run.config.name} failed: {str(e)}")
+        run.status = 'failed'
+        run.error = str(e)
+    finally:
+        stop_heartbeat.set()
+
+    run.finished_at = timezone.now()
+    run.duration_seconds = round(time.monotonic() - started, 3)
+    finished = run.status != 'running' and PredictionRun.objects.filter(id=run.id, status='running').update(
+        **{field: getattr(run, field) for field in FINISH_FIELDS}
+    )
+    if not finished:
+        logger.warning(f"Prediction run {run.id} for {run.config.name} was marked abandoned before it finished")
+        run.refresh_from_db()
+        return run
+
+    logger.info(
+        f"Prediction run {run.id} for {run.config.name} {run.status}: {run.prediction_count} predictions "
+        f"from {run.series_count} series, {run.failure_count} failures in {run.duration_seconds}s"
+    )
+    return run
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PREDICTION_JOB_THREADS, thread_name_prefix='prediction-job'
+            )
+    return _executor
+
+def enqueue_job(config, parameters, user=None):
+    """
+    Queue a prediction run requested through the API. run_prediction_scheduler
+    picks it up, unless PREDICTION_JOB_THREADS starts it on a background
+    thread of this process once the transaction commits.
+    """
+    run = PredictionRun.objects.create(
+        config=config,
+        trigger='api',
+        status='queued',
+        parameters=parameters,
+        requested_by=user
+    )
+    if settings.PREDICTION_JOB_THREADS:
+        transaction.on_commit(lambda: get_executor().submit(run_job_in_thread, run.id))
+    return run
+
+def claim_job(run_id, node=''):
+    """
+    Move a queued job to running. Returns the run, or None if another
+    worker claimed it first or it was cancelled.
+    """
+    now = timezone.now()
+    claimed = PredictionRun.objects.filter(id=run_id, status='queued').update(
+        status='running', node=node, started_at=now, heartbeat_at=now
+    )
+    return PredictionRun.objects.select_related('config').get(id=run_id) if claimed else None
+
+def run_job(run_id, node=''):
+    run = claim_job(run_id, node)
+    return execute_run(run) if run else None
+
+def run_job_in_thread(run_id):
+    try:
+        run_job(run_id, threading.current_thread().name)
+    finally:
+        connection.close()
+
+def run_queued_jobs(node='', limit=None):
+    """
+    Run queued jobs oldest first. Returns the runs this worker executed.
+    """
+    run_ids = PredictionRun.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)
+    runs = []
+    for run_id in list(run_ids[:limit] if limit else run_ids):
+        run = run_job(run_id, node)
+        if run is not None:
+            runs.append(run)
+    return runs
+
+def fail_abandoned_jobs(seconds=None):
+    """
+    Fail API jobs still marked running with no progress update for
+    PREDICTION_SCHEDULER_LEASE_SECONDS, the time a scheduled run may go
+    without renewing its lease; their worker died mid-run. Returns the
+    number of jobs failed.
+    """
+    seconds = seconds or settings.PREDICTION_SCHEDULER_LEASE_SECONDS
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=seconds)
+    failed = PredictionRun.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        trigger='api', status='running'
+    ).update(status='failed', finished_at=now, error='Abandoned: no progress from its worker')
+    if failed:
+        logger.warning(f"Failed {failed} abandoned prediction jobs")
+    return failed
+
+def cancel_job(run):
+    """
+    Cancel a queued job immediately, or ask a running one to stop at its
+    next progress update
+    """
+    now = timezone.now()
+    if not PredictionRun.objects.filter(id=run.id, status='queued').update(
+        status='cancelled', cancel_requested=True, finished_at=now
+    ):
+        PredictionRun.objects.filter(id=run.id, status='running').update(cancel_requested=True)
+    run.refresh_from_db()
+    return run
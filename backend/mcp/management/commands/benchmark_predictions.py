@@ -0,0 +1,79 @@
+import os
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mcp.forecasting import FORECASTERS, fit_forecasts_parallel
+
+class Command(BaseCommand):
+    help = (
+        'Time forecast fitting on synthetic daily demand series partitioned by region, '
+        'for each worker process count, and report how each compares with the first'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--series', type=int, default=100000)
+        parser.add_argument('--regions', type=int, default=37)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--horizon', type=int, default=14)
+        parser.add_argument('--model', choices=sorted(FORECASTERS), default='holt_winters')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs per worker count')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = np.random.default_rng(options['seed'])
+        days = np.arange(options['days'])
+        rates = generator.uniform(2, 50, (options['series'], 1)) * (1 + 0.3 * np.sin(2 * np.pi * days / 7))
+        matrix = generator.poisson(rates).astype(float)
+        matrix[generator.random(matrix.shape) < 0.05] = np.nan  # Missing days
+
+        regions = options['regions']
+        per_region = -(-options['series'] // regions)
+        series = [(row, f'Region {row // per_region}') for row in range(options['series'])]
+        models = [options['model']] * len(series)
+
+        self.stdout.write(
+            f"{len(series)} series x {options['days']} days, {regions} regions, "
+            f"model {options['model']}, {os.cpu_count()} CPUs"
+        )
+        if matrix.size < settings.PREDICTION_PARALLEL_MIN_CELLS:
+            self.stdout.write(
+                f"Prediction runs fit a matrix this size in-process (PREDICTION_PARALLEL_MIN_CELLS="
+                f"{settings.PREDICTION_PARALLEL_MIN_CELLS}); timings below force the pool"
+            )
+
+        baseline, reference = None, None
+        for workers in options['workers']:
+            if workers > 1:
+                # Starting the pool and importing into its workers is paid once
+                # per process, not per run; report it apart
+                started = time.perf_counter()
+                fit_forecasts_parallel(matrix, series, models, options['horizon'], workers, min_cells=0)
+                self.stdout.write(
+                    f"{workers:>3} workers: first run, starting the pool, {time.perf_counter() - started:.3f}s"
+                )
+
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                result = fit_forecasts_parallel(matrix, series, models, options['horizon'], workers, min_cells=0)
+                timings.append(time.perf_counter() - started)
+            seconds = min(timings)
+
+            if baseline is None:
+                baseline, reference = seconds, result
+            elif result != reference:
+                self.stderr.write(f"{workers} workers: results differ from {options['workers'][0]} worker(s)")
+
+            ratio = baseline / seconds
+            if result is reference:
+                comparison = 'baseline'
+            elif ratio >= 1:
+                comparison = f"{ratio:.2f}x faster than {options['workers'][0]} worker(s)"
+            else:
+                comparison = f"{1 / ratio:.2f}x slower than {options['workers'][0]} worker(s)"
+            self.stdout.write(
+                f"{workers:>3} workers: {seconds:.3f}s, "
+                f"{seconds * 1000 / len(series) * 1000:.2f} ms per 1k series, {comparison}"
+            )
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from mcp.webhooks import WebhookDispatcher
+
+class Command(BaseCommand):
+    help = 'Deliver pending prediction alerts to webhook subscriptions (once, or repeatedly with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        dispatcher = WebhookDispatcher()
+        while True:
+            result = dispatcher.dispatch()
+            self.stdout.write(
+                f"{result['delivered']} alert deliveries, {result['failed']} failed "
+                f"across {result['endpoints']} endpoints"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
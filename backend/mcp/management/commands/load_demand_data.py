@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from mcp.ingest import DemandIngestor, DUPLICATE_POLICIES, read_csv, read_ndjson
+
+class Command(BaseCommand):
+    help = 'Load demand history from a CSV or NDJSON file (e.g. a historical backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Default: from the file extension')
+        parser.add_argument('--policy', choices=DUPLICATE_POLICIES, default='replace',
+                            help='For rows whose medical item, region and period_start already exist')
+        parser.add_argument('--chunk-size', type=int, help='Rows per transaction (default DEMAND_INGEST_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        reader = read_csv if file_format == 'csv' else read_ndjson
+        ingestor = DemandIngestor(options['policy'], options['chunk_size'])
+
+        started = time.monotonic()
+        with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            stats = ingestor.ingest(reader(lines))
+        elapsed = time.monotonic() - started
+
+        for error in ingestor.errors:
+            self.stderr.write(f"Row {error['row']}: {'; '.join(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['created']} created, {stats['updated']} updated, {stats['rejected']} rejected "
+            f"of {stats['total_processed']} rows in {elapsed:.1f}s ({stats['total_processed'] / max(elapsed, 1e-9):.0f} rows/s)"
+        ))
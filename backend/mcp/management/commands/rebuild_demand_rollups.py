@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from mcp.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild the weekly and monthly demand rollups from the daily DemandData rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Daily rows read per refresh')
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} demand rollups"))
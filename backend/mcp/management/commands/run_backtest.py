@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from mcp.backtesting import Backtester, default_cutoffs
+from mcp.forecasting import FORECASTERS
+
+class Command(BaseCommand):
+    help = 'Backtest the prediction engine over past cutoffs and store the accuracy per model version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', default='default')
+        parser.add_argument('--cutoffs', type=int, default=4, help='Number of past cutoffs to replay')
+        parser.add_argument('--step-days', type=int, default=7, help='Days between cutoffs')
+        parser.add_argument('--horizon', type=int, help='Days predicted after each cutoff (default: config horizon)')
+        parser.add_argument('--days-back', type=int, help='History per fit (default: config history_days)')
+        parser.add_argument('--model', action='append', dest='models', choices=sorted(FORECASTERS),
+                            help="Model to replay for every item (repeatable; default: the config's models)")
+        parser.add_argument('--region', action='append', dest='regions')
+
+    def handle(self, *args, **options):
+        for model in options['models'] or [None]:
+            backtester = Backtester(options['config'])
+            horizon = options['horizon'] or backtester.config.prediction_horizon_days
+            cutoffs = default_cutoffs(options['cutoffs'], options['step_days'], horizon)
+            result = backtester.run(
+                cutoffs, horizon, options['days_back'], model=model, regions=options['regions']
+            )
+            self.stdout.write(
+                f"{result.model_version}: {result.series_count} series-cutoffs, MAPE {self.percent(result.mape)}, "
+                f"bias {self.percent(result.bias)}, hit rate {self.percent(result.hit_rate)}, "
+                f"miss rate {self.percent(result.miss_rate)}, false alarms {self.percent(result.false_alarm_rate)}, "
+                f"{result.runtime_per_1k_series:.3f}s per 1k series"
+            )
+
+    def percent(self, value):
+        return 'n/a' if value is None else f"{value:.1%}"
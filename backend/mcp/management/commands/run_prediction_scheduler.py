@@ -0,0 +1,27 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mcp.scheduler import PredictionScheduler
+
+class Command(BaseCommand):
+    help = 'Run prediction cycles for active MCP configs that are due (once, or repeatedly with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument(
+            '--interval', type=int, default=settings.PREDICTION_SCHEDULER_INTERVAL_SECONDS,
+            help='Seconds between checks with --loop'
+        )
+        parser.add_argument('--node', help='Name this scheduler holds leases under (default host:pid)')
+
+    def handle(self, *args, **options):
+        scheduler = PredictionScheduler(node=options['node'])
+        while True:
+            for run in scheduler.tick():
+                self.stdout.write(
+                    f"{run.config.name}: {run.status}, {run.prediction_count} predictions from "
+                    f"{run.series_count} series, {run.failure_count} failures in {run.duration_seconds}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
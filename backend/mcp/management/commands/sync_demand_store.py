@@ -0,0 +1,25 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mcp.demand_store import DemandStore
+
+class Command(BaseCommand):
+    help = 'Sync DemandData into the per-region memory-mapped demand store (DEMAND_STORE_DIR)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--region', action='append', dest='regions', help='Region to sync (repeatable; default all)')
+        parser.add_argument('--rebuild', action='store_true', help='Rewrite regions from scratch')
+        parser.add_argument('--dir', help='Store directory (default DEMAND_STORE_DIR)')
+
+    def handle(self, *args, **options):
+        root = options['dir'] or settings.DEMAND_STORE_DIR
+        if not root:
+            raise CommandError('Set DEMAND_STORE_DIR or pass --dir')
+
+        started = time.monotonic()
+        result = DemandStore(root).sync(options['regions'], options['rebuild'])
+        for region, reloaded in result.items():
+            self.stdout.write(f"{region}: {reloaded} items reloaded")
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {len(result)} regions in {time.monotonic() - started:.2f}s"
+        ))
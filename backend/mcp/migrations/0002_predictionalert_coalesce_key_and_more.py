@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionalert',
+            name='coalesce_key',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='predictionalert',
+            name='last_occurred_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='predictionalert',
+            name='occurrence_count',
+            field=models.IntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0003_predictionalert_delivered_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mcpconfig',
+            name='forecast_model',
+            field=models.CharField(choices=[('ols_trend', 'Least Squares Trend'), ('exponential_smoothing', 'Exponential Smoothing'), ('holt_winters', 'Holt-Winters (weekly)')], default='ols_trend', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='mcpconfig',
+            name='history_days',
+            field=models.IntegerField(default=30),
+        ),
+        migrations.AddField(
+            model_name='mcpconfig',
+            name='item_forecast_models',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0004_mcpconfig_forecast_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('holder', models.CharField(max_length=255)),
+                ('acquired_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PredictionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('node', models.CharField(blank=True, max_length=255)),
+                ('series_count', models.IntegerField(default=0)),
+                ('prediction_count', models.IntegerField(default=0)),
+                ('failure_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='mcp.mcpconfig')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['config', '-started_at'], name='mcp_predict_config__c088b2_idx')],
+            },
+        ),
+    ]
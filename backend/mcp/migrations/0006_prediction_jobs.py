@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0005_predictionrun_schedulerlease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionrun',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='predictionrun',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='predictionrun',
+            name='parameters',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='predictionrun',
+            name='requested_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prediction_runs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='predictionrun',
+            name='series_done',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='predictionrun',
+            name='trigger',
+            field=models.CharField(choices=[('schedule', 'Schedule'), ('api', 'API')], default='schedule', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='shortageprediction',
+            name='run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='predictions', to='mcp.predictionrun'),
+        ),
+        migrations.AlterField(
+            model_name='predictionrun',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='predictionrun',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='running', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='predictionrun',
+            index=models.Index(fields=['status', 'created_at'], name='mcp_predict_status_26770e_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('mcp', '0006_prediction_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtySeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('medical_item_id', models.IntegerField()),
+                ('region', models.CharField(max_length=100)),
+                ('reason', models.CharField(max_length=50)),
+                ('marked_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SeriesForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.CharField(max_length=100)),
+                ('config_updated_at', models.DateTimeField()),
+                ('window_start', models.DateField()),
+                ('prediction_days', models.IntegerField()),
+                ('avg_demand', models.FloatField()),
+                ('trend', models.FloatField()),
+                ('daily_forecast', models.FloatField()),
+                ('current_supply', models.IntegerField()),
+                ('context_impact', models.FloatField()),
+                ('as_of', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='demanddata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='predictionrun',
+            name='series_recomputed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='demanddata',
+            index=models.Index(fields=['updated_at'], name='mcp_demandd_updated_a8e142_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demanddata',
+            index=models.Index(fields=['period_end'], name='mcp_demandd_period__9b7cc6_idx'),
+        ),
+        migrations.AddField(
+            model_name='seriesforecast',
+            name='config',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series_forecasts', to='mcp.mcpconfig'),
+        ),
+        migrations.AddField(
+            model_name='seriesforecast',
+            name='medical_item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.medicalitem'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='seriesforecast',
+            unique_together={('config', 'medical_item', 'region')},
+        ),
+    ]
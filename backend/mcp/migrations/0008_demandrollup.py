@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('mcp', '0007_incremental_predictions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.CharField(max_length=100)),
+                ('grain', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('demand_count', models.IntegerField()),
+                ('days_observed', models.IntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medical_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.medicalitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['grain', 'region', 'period_start'], name='mcp_demandr_grain_45603d_idx')],
+                'unique_together': {('medical_item', 'region', 'grain', 'period_start')},
+            },
+        ),
+    ]
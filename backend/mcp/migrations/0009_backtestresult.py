@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0008_demandrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BacktestResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_version', models.CharField(db_index=True, max_length=100)),
+                ('cutoffs', models.JSONField(default=list)),
+                ('horizon_days', models.IntegerField()),
+                ('history_days', models.IntegerField()),
+                ('series_count', models.IntegerField(default=0)),
+                ('mape', models.FloatField(blank=True, null=True)),
+                ('bias', models.FloatField(blank=True, null=True)),
+                ('hit_rate', models.FloatField(blank=True, null=True)),
+                ('miss_rate', models.FloatField(blank=True, null=True)),
+                ('false_alarm_rate', models.FloatField(blank=True, null=True)),
+                ('actual_shortages', models.IntegerField(default=0)),
+                ('predicted_shortages', models.IntegerField(default=0)),
+                ('runtime_per_1k_series', models.FloatField(default=0.0)),
+                ('duration_seconds', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backtests', to='mcp.mcpconfig')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
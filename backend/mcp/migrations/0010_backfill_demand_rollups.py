@@ -0,0 +1,40 @@
+from django.db import migrations
+from mcp.rollups import ROLLUP_GRAINS, bucket_start, row_day
+
+def backfill_demand_rollups(apps, schema_editor):
+    """
+    Roll up the DemandData saved before the rollup table existed; later
+    writes keep it current through mcp.rollups.refresh_rollups
+    """
+    DemandData = apps.get_model('mcp', 'DemandData')
+    DemandRollup = apps.get_model('mcp', 'DemandRollup')
+
+    totals = {}
+    rows = DemandData.objects.values_list('medical_item_id', 'region', 'period_start', 'demand_count')
+    for item_id, region, period_start, demand_count in rows.iterator(chunk_size=5000):
+        day = row_day(period_start)
+        for grain in ROLLUP_GRAINS:
+            key = (item_id, region, grain, bucket_start(day, grain))
+            total, days = totals.get(key, (0, 0))
+            totals[key] = (total + demand_count, days + 1)
+
+    DemandRollup.objects.bulk_create(
+        [DemandRollup(medical_item_id=item_id, region=region, grain=grain, period_start=start,
+                      demand_count=total, days_observed=days)
+         for (item_id, region, grain, start), (total, days) in totals.items()],
+        batch_size=5000,
+        update_conflicts=True,
+        unique_fields=['medical_item', 'region', 'grain', 'period_start'],
+        update_fields=['demand_count', 'days_observed', 'updated_at']
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0009_backtestresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_demand_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcp', '0010_backfill_demand_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionrun',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,9 +1,16 @@
-from django.db import models
+import secrets
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 class MCPConfig(models.Model):
+    FORECAST_MODEL_CHOICES = (
+        ('ols_trend', 'Least Squares Trend'),
+        ('exponential_smoothing', 'Exponential Smoothing'),
+        ('holt_winters', 'Holt-Winters (weekly)'),
+    )
+
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
     
@@ -19,6 +26,11 @@ class MCPConfig(models.Model):
     prediction_horizon_days = models.IntegerField(default=14)  # Predict 14 days ahead
     retraining_frequency_hours = models.IntegerField(default=24)  # Retrain every 24 hours
     
+    # Demand forecasting
+    forecast_model = models.CharField(max_length=30, choices=FORECAST_MODEL_CHOICES, default='ols_trend')
+    item_forecast_models = models.JSONField(default=dict, blank=True)  # {medical item id: forecast model}
+    history_days = models.IntegerField(default=30)  # Demand history used to fit the models
+    
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -26,6 +38,21 @@ class MCPConfig(models.Model):
     def __str__(self):
         return self.name
 
+    def forecast_model_for(self, medical_item_id):
+        return self.item_forecast_models.get(str(medical_item_id), self.forecast_model)
+
+class DemandDataQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Delete the rows, then mark their series dirty and refresh their
+        rollups once for the whole batch
+        """
+        with transaction.atomic(using=self.db):
+            keys = list(self.values_list('medical_item_id', 'region', 'period_start'))
+            deleted = super().delete()
+            DemandData.demand_deleted(keys)
+        return deleted
+
 class DemandData(models.Model):
     medical_item = models.ForeignKey('inventory.MedicalItem', on_delete=models.CASCADE)
     region = models.CharField(max_length=100)  # e.g., "Lagos", "Nairobi"
@@ -40,9 +67,75 @@ class DemandData(models.Model):
     outbreak_disease = models.CharField(max_length=100, blank=True, null=True)
     
     collected_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Change watermark for incremental predictions
+
+    objects = DemandDataQuerySet.as_manager()
 
     class Meta:
         unique_together = ['medical_item', 'region', 'period_start']
+        indexes = [
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['period_end']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Loaded rows remember their series and day, so a save that moves
+        # them also refreshes the bucket they left (see mcp.signals)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_key = tuple(loaded.get(name) for name in ('medical_item_id', 'region', 'period_start'))
+        return instance
+
+    def delete(self, *args, **kwargs):
+        key = (self.medical_item_id, self.region, self.period_start)
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            DemandData.demand_deleted([key])
+        return deleted
+
+    @staticmethod
+    def demand_deleted(keys):
+        """
+        Record deleted (medical item id, region, period_start) rows: their
+        series in DirtySeries, as deletes leave no watermark behind, and a
+        refresh of their rollup buckets. Deletes run no signal receivers, so
+        cascades from MedicalItem, which take the rollups and series with
+        them, stay fast deletes.
+        """
+        from .rollups import refresh_rollups, row_day
+        series = {(item_id, region) for item_id, region, _ in keys}
+        DirtySeries.objects.bulk_create([
+            DirtySeries(medical_item_id=item_id, region=region, reason='demand_deleted')
+            for item_id, region in series
+        ])
+        refresh_rollups({(item_id, region, row_day(period_start)) for item_id, region, period_start in keys})
+
+class DemandRollup(models.Model):
+    """
+    DemandData summed per week (starting Monday) or calendar month, UTC.
+    Kept in step with daily rows by mcp.rollups.
+    """
+    GRAIN_CHOICES = (
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+    
+    medical_item = models.ForeignKey('inventory.MedicalItem', on_delete=models.CASCADE)
+    region = models.CharField(max_length=100)
+    grain = models.CharField(max_length=10, choices=GRAIN_CHOICES)
+    period_start = models.DateField()
+    
+    demand_count = models.IntegerField()
+    days_observed = models.IntegerField()  # Daily rows summed into demand_count
+    
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['medical_item', 'region', 'grain', 'period_start']
+        indexes = [
+            models.Index(fields=['grain', 'region', 'period_start']),
+        ]
 
 class ContextData(models.Model):
     DATA_TYPE_CHOICES = (
@@ -101,6 +194,9 @@ class ShortagePrediction(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Run that last wrote this prediction
+    run = models.ForeignKey('PredictionRun', on_delete=models.SET_NULL, null=True, blank=True, related_name='predictions')
+    
     class Meta:
         unique_together = ['medical_item', 'region', 'predicted_shortage_date']
 
@@ -125,5 +221,207 @@ class PredictionAlert(models.Model):
     sent_at = models.DateTimeField(auto_now_add=True)
     is_sent = models.BooleanField(default=False)
     
+    # Webhook delivery state (see mcp.webhooks); is_sent is set once every
+    # matching subscription has received the alert
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    delivery_attempts = models.IntegerField(default=0)
+    last_delivery_error = models.TextField(blank=True, null=True)
+    
+    # Repeated alerts for the same item and region update this row instead of creating new ones
+    coalesce_key = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    occurrence_count = models.IntegerField(default=1)
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.alert_type} - {self.prediction.medical_item.name}"
+
+def generate_webhook_secret():
+    return secrets.token_hex(32)
+
+class WebhookSubscription(models.Model):
+    """
+    An external vendor or health-authority endpoint receiving prediction
+    alerts as signed, batched JSON POSTs
+    """
+    AUDIENCE_CHOICES = (
+        ('vendor', 'Vendor'),
+        ('health_authority', 'Health Authority'),
+    )
+    
+    name = models.CharField(max_length=255)
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES)
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=128, default=generate_webhook_secret)
+    regions = models.JSONField(default=list, blank=True)  # Empty for every region
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhook_subscriptions')
+    is_active = models.BooleanField(default=True)
+    
+    # Per-endpoint backoff after failed deliveries
+    consecutive_failures = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.audience})"
+
+class WebhookDelivery(models.Model):
+    """
+    Delivery state of one alert to one subscription
+    """
+    STATUS_CHOICES = (
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    )
+    
+    subscription = models.ForeignKey(WebhookSubscription, on_delete=models.CASCADE, related_name='deliveries')
+    alert = models.ForeignKey(PredictionAlert, on_delete=models.CASCADE, related_name='webhook_deliveries')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['subscription', 'alert']
+
+    def __str__(self):
+        return f"Alert {self.alert_id} -> {self.subscription_id}: {self.status}"
+
+class SchedulerLease(models.Model):
+    """
+    Named lease held by one scheduler node at a time until it expires
+    """
+    name = models.CharField(max_length=255, unique=True)
+    holder = models.CharField(max_length=255)
+    acquired_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} ({self.holder})"
+
+class PredictionRun(models.Model):
+    """
+    One prediction cycle for an MCP configuration, started by the scheduler
+    or queued as a job through the API
+    """
+    TRIGGER_CHOICES = (
+        ('schedule', 'Schedule'),
+        ('api', 'API'),
+    )
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    )
+    
+    config = models.ForeignKey(MCPConfig, on_delete=models.CASCADE, related_name='runs')
+    trigger = models.CharField(max_length=20, choices=TRIGGER_CHOICES, default='schedule')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    node = models.CharField(max_length=255, blank=True)
+    
+    # Job parameters (regions, medical_item_ids, prediction_days) and requester
+    parameters = models.JSONField(default=dict, blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='prediction_runs')
+    cancel_requested = models.BooleanField(default=False)
+    
+    series_count = models.IntegerField(default=0)
+    series_done = models.IntegerField(default=0)
+    series_recomputed = models.IntegerField(default=0)
+    prediction_count = models.IntegerField(default=0)
+    failure_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last progress update while running
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['config', '-started_at']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    @property
+    def progress(self):
+        if self.status == 'succeeded':
+            return 1.0
+        return round(self.series_done / self.series_count, 4) if self.series_count else 0.0
+
+    def __str__(self):
+        return f"{self.config.name} run {self.id} ({self.status})"
+
+class SeriesForecast(models.Model):
+    """
+    Inputs and fitted forecast behind the last prediction for one
+    (item, region) series of a config. Incremental runs skip series whose
+    demand, supply and context still match.
+    """
+    config = models.ForeignKey(MCPConfig, on_delete=models.CASCADE, related_name='series_forecasts')
+    medical_item = models.ForeignKey('inventory.MedicalItem', on_delete=models.CASCADE)
+    region = models.CharField(max_length=100)
+    
+    # Fit settings; any difference makes the series dirty
+    config_updated_at = models.DateTimeField()
+    window_start = models.DateField()
+    prediction_days = models.IntegerField()
+    
+    avg_demand = models.FloatField()
+    trend = models.FloatField()
+    daily_forecast = models.FloatField()
+    current_supply = models.IntegerField()
+    context_impact = models.FloatField()
+    
+    as_of = models.DateTimeField()  # Demand changes after this are not reflected
+
+    class Meta:
+        unique_together = ['config', 'medical_item', 'region']
+
+class DirtySeries(models.Model):
+    """
+    Series changes the DemandData watermark cannot see (deleted rows),
+    recorded by DemandData.demand_deleted
+    """
+    medical_item_id = models.IntegerField()
+    region = models.CharField(max_length=100)
+    reason = models.CharField(max_length=50)
+    marked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class BacktestResult(models.Model):
+    """
+    Accuracy of one forecast model version replayed over past cutoffs
+    (mcp.backtesting). Rates are fractions; null when nothing was measurable.
+    """
+    config = models.ForeignKey(MCPConfig, on_delete=models.CASCADE, related_name='backtests')
+    model_version = models.CharField(max_length=100, db_index=True)
+    cutoffs = models.JSONField(default=list)  # ISO datetimes
+    horizon_days = models.IntegerField()
+    history_days = models.IntegerField()
+    series_count = models.IntegerField(default=0)  # (series, cutoff) pairs evaluated
+    
+    mape = models.FloatField(null=True, blank=True)
+    bias = models.FloatField(null=True, blank=True)  # Signed forecast error relative to actual demand
+    hit_rate = models.FloatField(null=True, blank=True)  # Share of actual shortages predicted
+    miss_rate = models.FloatField(null=True, blank=True)
+    false_alarm_rate = models.FloatField(null=True, blank=True)  # Share of predicted shortages that did not happen
+    actual_shortages = models.IntegerField(default=0)
+    predicted_shortages = models.IntegerField(default=0)
+    
+    runtime_per_1k_series = models.FloatField(default=0.0)  # Seconds to fit and predict 1,000 series
+    duration_seconds = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def accuracy(self):
+        return None if self.mape is None else max(0.0, 1.0 - self.mape)
+
     def __str__(self):
-        return f"{self.alert_type} - {self.prediction.medical_item.name}"
\ No newline at end of file
+        return f"{self.model_version} backtest {self.id}"
@@ -1,58 +1,194 @@
 import logging
+import math
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
 from django.db.models import Sum, Avg, Count, Q
 from django.db import transaction
-from .models import MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert
+from .models import (
+    MCPConfig, DemandData, DemandRollup, ContextData, ShortagePrediction, PredictionAlert, SeriesForecast,
+    DirtySeries
+)
+from .demand_store import DemandStore
+from .rollups import GRAIN_DAYS, bucket_end, bucket_start, choose_grain, utc_datetime
 from inventory.models import MedicalItem, Inventory
 from .external_apis import ExternalDataManager
+from notifications.coalescing import coalesce_key, window_start
+from notifications.message_templates import registry as message_templates
+from .forecasting import (
+    Forecaster, OLSTrendForecaster, ExponentialSmoothingForecaster, HoltWintersForecaster,
+    FORECASTERS, get_forecaster, demand_matrix, fit_forecasts, fit_forecasts_parallel
+)
 
 logger = logging.getLogger(__name__)
 
 class MCPPredictionEngine:
     def __init__(self, config_name="default"):
+        self.config = self.get_config(config_name)
+
+        # Initialize external data manager for live API calls
+        self.external_data = ExternalDataManager()
+        
+        # Series counts from the last run_predictions call, and the series
+        # states it computed, written by save_predictions
+        self.run_stats = {'series': 0, 'recomputed': 0, 'failures': 0}
+        self.pending_states = []
+    
+    @staticmethod
+    def get_config(config_name="default"):
         try:
-            self.config = MCPConfig.objects.get(name=config_name, is_active=True)
+            return MCPConfig.objects.get(name=config_name, is_active=True)
         except MCPConfig.DoesNotExist:
             # Create default config if none exists
-            self.config = MCPConfig.objects.create(
+            return MCPConfig.objects.create(
                 name=config_name,
                 description="Default MCP Configuration"
             )
-
-        # Initialize external data manager for live API calls
-        self.external_data = ExternalDataManager()
     
-    def calculate_demand_trend(self, medical_item, region, days_back=30):
+    def load_demand_history(self, series, days_back, end_date=None):
         """
-        Calculate demand trend for a medical item in a region
+        Daily demand matrix for (medical item id, region) series over the
+        `days_back` days to `end_date` (now), loaded with one query
         """
-        end_date = timezone.now()
+        end_date = end_date or timezone.now()
         start_date = end_date - timedelta(days=days_back)
+        if DemandStore.enabled():
+            return self.load_stored_history(series, start_date, end_date, days_back + 1)
         
-        demand_data = DemandData.objects.filter(
-            medical_item=medical_item,
-            region=region,
+        rows = list(DemandData.objects.filter(
+            medical_item_id__in={item_id for item_id, _ in series},
+            region__in={region for _, region in series},
             period_start__gte=start_date,
             period_end__lte=end_date
-        ).order_by('period_start')
-        
-        if not demand_data:
-            return 0, 0  # No trend data
-        
-        # Calculate trend using linear regression (simplified)
-        demands = [data.demand_count for data in demand_data]
-        if len(demands) > 1:
-            trend = (demands[-1] - demands[0]) / len(demands)
-        else:
-            trend = 0
-        
-        avg_demand = sum(demands) / len(demands)
+        ).values_list('medical_item_id', 'region', 'period_start', 'demand_count'))
         
+        return demand_matrix(rows, series, start_date.date(), days_back + 1)
+    
+    def load_stored_history(self, series, start_date, end_date, days):
+        """
+        The demand matrix read from the memory-mapped DemandStore as of its
+        last sync. Keeps the whole days inside the window, as the DemandData
+        query does for daily rows.
+        """
+        first_day = start_date.date()
+        matrix = DemandStore().history(series, first_day, days)
+
+        day_starts = [utc_datetime(first_day + timedelta(days=day)) for day in range(days + 1)]
+        inside = np.array([
+            day_starts[day] >= start_date and day_starts[day + 1] <= end_date for day in range(days)
+        ])
+        matrix[:, ~inside] = np.nan
+        return matrix
+
+    def load_rollup_history(self, series, grain, days_back, end_date=None):
+        """
+        (totals, days observed) matrices, one column per week or month bucket
+        lying wholly inside the window, read from DemandRollup, plus a last
+        column summing the daily rows after the final whole bucket
+        """
+        end_date = end_date or timezone.now()
+        first_day = (end_date - timedelta(days=days_back)).date()
+        start = bucket_start(first_day, grain)
+        if start < first_day:
+            start = bucket_end(start, grain)
+
+        starts = []
+        while bucket_end(start, grain) <= end_date.date():
+            starts.append(start)
+            start = bucket_end(start, grain)
+        tail_start = start
+
+        item_ids = {item_id for item_id, _ in series}
+        regions = {region for _, region in series}
+        positions = {key: index for index, key in enumerate(series)}
+        columns = {period_start: index for index, period_start in enumerate(starts)}
+        totals = np.zeros((len(series), len(starts) + 1))
+        days = np.zeros((len(series), len(starts) + 1))
+
+        rollups = DemandRollup.objects.filter(
+            medical_item_id__in=item_ids, region__in=regions, grain=grain, period_start__in=starts
+        ).values_list('medical_item_id', 'region', 'period_start', 'demand_count', 'days_observed')
+        for item_id, region, period_start, demand_count, days_observed in rollups:
+            row = positions.get((item_id, region))
+            if row is not None:
+                totals[row, columns[period_start]] = demand_count
+                days[row, columns[period_start]] = days_observed
+
+        tail = DemandData.objects.filter(
+            medical_item_id__in=item_ids,
+            region__in=regions,
+            period_start__gte=utc_datetime(tail_start),
+            period_end__lte=end_date
+        ).values('medical_item_id', 'region').annotate(total=Sum('demand_count'), observed=Count('id'))
+        for entry in tail:
+            row = positions.get((entry['medical_item_id'], entry['region']))
+            if row is not None:
+                totals[row, -1] = entry['total']
+                days[row, -1] = entry['observed']
+
+        return totals, days
+
+    def forecast_demand(self, series, prediction_days=14, days_back=None, workers=1, end_date=None):
+        """
+        Fit every series with the model configured for its item, across
+        `workers` processes. Returns {(medical item id, region): (avg_demand,
+        trend, daily_forecast)} where daily_forecast is the mean daily demand
+        over the horizon.
+
+        Windows long enough for choose_grain to pick weeks or months are read
+        from the rollups and fitted on each bucket's mean daily demand, without
+        weekly seasonality; the trend is still reported per day.
+        """
+        days_back = days_back or self.config.history_days
+        models = [self.config.forecast_model_for(item_id) for item_id, _ in series]
+        grain = choose_grain(days_back)
+        if grain == 'day':
+            matrix = self.load_demand_history(series, days_back, end_date)
+            return fit_forecasts_parallel(
+                matrix, series, models, prediction_days, workers, min_cells=settings.PREDICTION_PARALLEL_MIN_CELLS
+            )
+
+        totals, days = self.load_rollup_history(series, grain, days_back, end_date)
+        matrix = np.divide(totals, days, out=np.full(totals.shape, np.nan), where=days > 0)
+        steps = math.ceil(prediction_days / GRAIN_DAYS[grain])
+        forecasts = fit_forecasts_parallel(
+            matrix, series, models, steps, workers, seasonal=False, min_cells=settings.PREDICTION_PARALLEL_MIN_CELLS
+        )
+
+        observed = days.sum(axis=1)
+        avg_demand = np.divide(totals.sum(axis=1), observed, out=np.zeros(len(series)), where=observed > 0)
+        return {
+            key: (float(avg), trend / GRAIN_DAYS[grain], daily_forecast)
+            for (key, (_, trend, daily_forecast)), avg in zip(forecasts.items(), avg_demand)
+        }
+    
+    def calculate_demand_trend(self, medical_item, region, days_back=30):
+        """
+        Calculate demand trend for a medical item in a region
+        """
+        series = (medical_item.id, region)
+        avg_demand, trend, _ = self.forecast_demand([series], days_back=days_back)[series]
         return avg_demand, trend
     
+    def recent_demand(self, medical_item, region, days_back=30, limit=10):
+        """
+        (grain, [(period start, demand count)]) for the latest `limit` periods,
+        newest first, at the grain forecast_demand would read for the window
+        """
+        grain = choose_grain(days_back)
+        if grain == 'day':
+            rows = DemandData.objects.filter(
+                medical_item=medical_item, region=region
+            ).order_by('-period_end').values_list('period_end', 'demand_count')[:limit]
+            return grain, [(period_end.date(), demand_count) for period_end, demand_count in rows]
+
+        rows = DemandRollup.objects.filter(
+            medical_item=medical_item, region=region, grain=grain
+        ).order_by('-period_start').values_list('period_start', 'demand_count')[:limit]
+        return grain, list(rows)
+
     def get_current_supply(self, medical_item, region):
         """
         Get current supply levels for a medical item in a region
@@ -102,52 +238,58 @@ class MCPPredictionEngine:
         Predict shortage for a specific medical item in a region
         """
         try:
-            # Get demand data
-            avg_demand, demand_trend = self.calculate_demand_trend(medical_item, region)
-            
-            # Get current supply
+            series = (medical_item.id, region)
+            forecast = self.forecast_demand([series], prediction_days)[series]
             current_supply = self.get_current_supply(medical_item, region)
-            
-            # Get context impact
             context_impact = self.get_context_factors(region, prediction_days)
             
-            # Calculate predicted demand
-            predicted_demand = (avg_demand + demand_trend * prediction_days) * context_impact
-            
-            # Calculate days until shortage
-            if current_supply <= 0:
-                days_until_shortage = 0
-            elif predicted_demand <= 0:
-                days_until_shortage = float('inf')
-            else:
-                days_until_shortage = current_supply / (predicted_demand / prediction_days)
-            
-            # Calculate confidence score
-            confidence_score = self.calculate_confidence(
-                avg_demand, demand_trend, context_impact
+            return self.build_prediction(
+                medical_item, region, forecast, current_supply, context_impact, prediction_days
             )
             
-            # Determine severity level
-            severity_level = self.determine_severity(days_until_shortage, confidence_score)
-            
-            return {
-                'medical_item': medical_item,
-                'region': region,
-                'predicted_demand': predicted_demand,
-                'current_supply': current_supply,
-                'days_until_shortage': days_until_shortage,
-                'confidence_score': confidence_score,
-                'severity_level': severity_level,
-                'predicted_shortage_date': timezone.now() + timedelta(days=min(days_until_shortage, 365)),
-                'predicted_shortage_duration': max(1, int(predicted_demand - current_supply) // max(1, int(avg_demand))),
-                'demand_increase_reason': self.get_demand_increase_reason(context_impact, demand_trend),
-                'supply_constraint_reason': self.get_supply_constraint_reason(current_supply)
-            }
-            
         except Exception as e:
             logger.error(f"Error predicting shortage for {medical_item.name} in {region}: {str(e)}")
             return None
     
+    def build_prediction(self, medical_item, region, forecast, current_supply, context_impact, prediction_days):
+        """
+        Shortage prediction from a fitted demand forecast and current supply
+        """
+        avg_demand, demand_trend, daily_forecast = forecast
+        
+        # Calculate predicted demand
+        predicted_demand = daily_forecast * context_impact
+        
+        # Calculate days until shortage
+        if current_supply <= 0:
+            days_until_shortage = 0
+        elif predicted_demand <= 0:
+            days_until_shortage = float('inf')
+        else:
+            days_until_shortage = current_supply / (predicted_demand / prediction_days)
+        
+        # Calculate confidence score
+        confidence_score = self.calculate_confidence(
+            avg_demand, demand_trend, context_impact
+        )
+        
+        # Determine severity level
+        severity_level = self.determine_severity(days_until_shortage, confidence_score)
+        
+        return {
+            'medical_item': medical_item,
+            'region': region,
+            'predicted_demand': predicted_demand,
+            'current_supply': current_supply,
+            'days_until_shortage': days_until_shortage,
+            'confidence_score': confidence_score,
+            'severity_level': severity_level,
+            'predicted_shortage_date': timezone.now() + timedelta(days=min(days_until_shortage, 365)),
+            'predicted_shortage_duration': max(1, int(predicted_demand - current_supply) // max(1, int(avg_demand))),
+            'demand_increase_reason': self.get_demand_increase_reason(context_impact, demand_trend),
+            'supply_constraint_reason': self.get_supply_constraint_reason(current_supply)
+        }
+    
     def calculate_confidence(self, avg_demand, demand_trend, context_impact):
         """
         Calculate prediction confidence score (0.0 to 1.0)
@@ -197,89 +339,334 @@ class MCPPredictionEngine:
         else:
             return "Adequate current stock"
     
-    def run_predictions(self, regions=None, medical_items=None, prediction_days=14):
+    def get_supply_levels(self, medical_item_ids, regions):
+        """
+        Current supply for every (medical item id, region) pair in one query
+        """
+        rows = Inventory.objects.filter(
+            medical_item_id__in=medical_item_ids,
+            vendor__city__in=regions,
+            current_stock__gt=0,
+            is_available=True
+        ).values('medical_item_id', 'vendor__city').annotate(total_stock=Sum('current_stock'))
+        
+        return {(row['medical_item_id'], row['vendor__city']): row['total_stock'] for row in rows}
+    
+    def load_series_state(self, series):
+        states = SeriesForecast.objects.filter(
+            config=self.config,
+            medical_item_id__in={item_id for item_id, _ in series},
+            region__in={region for _, region in series}
+        )
+        return {(state.medical_item_id, state.region): state for state in states}
+    
+    def dirty_demand_series(self, series, states, prediction_days, as_of):
         """
-        Run shortage predictions for multiple regions and items
+        Series whose demand forecast may differ from their stored state: no
+        state yet, different fit settings, DemandData written since the state
+        was computed, rows entering or leaving the history window, or deleted
+        rows. Watermarks are widened by PREDICTION_DIRTY_MARGIN_SECONDS to
+        cover transactions in flight.
+
+        The window sliding forward with no rows entering or leaving it does
+        not make a series dirty, as the fitted data is the same; only the
+        forecast horizon moves with it, so states older than
+        PREDICTION_STATE_MAX_AGE_DAYS are refitted regardless.
+        """
+        history_days = self.config.history_days
+        history = timedelta(days=history_days)
+        margin = timedelta(seconds=settings.PREDICTION_DIRTY_MARGIN_SECONDS)
+        max_age = timedelta(days=settings.PREDICTION_STATE_MAX_AGE_DAYS)
+        dirty = set()
+        since = {}
+        for key in series:
+            state = states.get(key)
+            if (state is None or state.as_of <= as_of - max_age
+                    or state.config_updated_at != self.config.updated_at
+                    or state.prediction_days != prediction_days):
+                dirty.add(key)
+            else:
+                since[key] = state.as_of - margin
+        
+        if not since:
+            return dirty
+        
+        # Candidates from the oldest watermark, then checked per series
+        oldest = min(since.values())
+        item_ids = {item_id for item_id, _ in since}
+        regions = {region for _, region in since}
+        changed = DemandData.objects.filter(
+            Q(updated_at__gt=oldest)
+            | Q(period_end__gt=oldest, period_end__lte=as_of)
+            | Q(period_start__gte=oldest - history, period_start__lt=as_of - history),
+            medical_item_id__in=item_ids,
+            region__in=regions
+        ).values_list('medical_item_id', 'region', 'updated_at', 'period_start', 'period_end')
+        for item_id, region, updated_at, period_start, period_end in changed:
+            key = (item_id, region)
+            if key in since and (
+                updated_at > since[key]
+                or since[key] < period_end <= as_of
+                or since[key] - history <= period_start < as_of - history
+            ):
+                dirty.add(key)
+        
+        deleted = DirtySeries.objects.filter(
+            marked_at__gt=oldest, medical_item_id__in=item_ids, region__in=regions
+        ).values_list('medical_item_id', 'region', 'marked_at')
+        dirty.update(
+            (item_id, region) for item_id, region, marked_at in deleted
+            if (item_id, region) in since and marked_at > since[item_id, region]
+        )
+        
+        # States past the maximum age are refitted anyway, so older marks can
+        # never make a difference
+        DirtySeries.objects.filter(marked_at__lt=as_of - max_age - margin).delete()
+        return dirty
+    
+    def run_predictions(self, regions=None, medical_items=None, prediction_days=14, progress=None, workers=None,
+                        incremental=False):
+        """
+        Run shortage predictions for multiple regions and items. All series
+        are fitted together, partitioned across PREDICTION_WORKERS processes
+        (or `workers`); supply and context are read once per run and once per
+        region respectively. `progress(series_done, series_count)` is called
+        after each region and may raise to stop the run.
+        
+        With `incremental`, only series whose demand, supply or context
+        changed since their stored SeriesForecast are fitted and predicted;
+        the rest keep their existing predictions. Stored states are written
+        by save_predictions.
         """
         predictions = []
         
         # Get regions to analyze
         if not regions:
             regions = DemandData.objects.values_list('region', flat=True).distinct()
+        elif isinstance(regions, str):
+            regions = [regions]
+        regions = list(regions)
         
         # Get medical items to analyze
         if not medical_items:
             medical_items = MedicalItem.objects.filter(
                 inventory__current_stock__gt=0
             ).distinct()
+        elif isinstance(medical_items, int):
+            medical_items = MedicalItem.objects.filter(id=medical_items)
+        elif all(isinstance(item, int) for item in medical_items):
+            medical_items = MedicalItem.objects.filter(id__in=medical_items)
+        medical_items = list(medical_items)
+        
+        series = [(medical_item.id, region) for region in regions for medical_item in medical_items]
+        self.run_stats = {'series': len(series), 'recomputed': 0, 'failures': 0}
+        self.pending_states = []
+        if not series:
+            return predictions
+        
+        as_of = timezone.now()
+        if DemandStore.enabled():
+            # History is read as of the store's last sync, so demand written
+            # since must stay newer than the stored states' watermark
+            synced_at = DemandStore().synced_at(regions)
+            if synced_at:
+                as_of = min(as_of, synced_at)
+        window_start = (as_of - timedelta(days=self.config.history_days)).date()
+        states = self.load_series_state(series) if incremental else {}
+        dirty = self.dirty_demand_series(series, states, prediction_days, as_of) if incremental else set(series)
         
-        for region in regions:
+        forecasts = self.forecast_demand(
+            [key for key in series if key in dirty], prediction_days,
+            workers=workers or settings.PREDICTION_WORKERS, end_date=as_of
+        )
+        supply = self.get_supply_levels([medical_item.id for medical_item in medical_items], regions)
+        
+        for done, region in enumerate(regions):
+            if progress:
+                progress(done * len(medical_items), len(series))
+            context_impact = self.get_context_factors(region, prediction_days)
             for medical_item in medical_items:
-                prediction = self.predict_shortage(medical_item, region, prediction_days)
-                if prediction and prediction['confidence_score'] >= 0.5:  # Only store reasonable predictions
+                key = (medical_item.id, region)
+                current_supply = supply.get(key, 0)
+                if key in dirty:
+                    forecast = forecasts[key]
+                else:
+                    state = states[key]
+                    if state.current_supply == current_supply and state.context_impact == context_impact:
+                        continue
+                    forecast = (state.avg_demand, state.trend, state.daily_forecast)
+                
+                try:
+                    prediction = self.build_prediction(
+                        medical_item, region, forecast, current_supply, context_impact, prediction_days
+                    )
+                except Exception as e:
+                    logger.error(f"Error predicting shortage for {medical_item.name} in {region}: {str(e)}")
+                    self.run_stats['failures'] += 1
+                    continue
+                
+                self.run_stats['recomputed'] += 1
+                self.pending_states.append(SeriesForecast(
+                    config=self.config,
+                    medical_item_id=medical_item.id,
+                    region=region,
+                    config_updated_at=self.config.updated_at,
+                    window_start=window_start if key in dirty else states[key].window_start,
+                    prediction_days=prediction_days,
+                    avg_demand=forecast[0],
+                    trend=forecast[1],
+                    daily_forecast=forecast[2],
+                    current_supply=current_supply,
+                    context_impact=context_impact,
+                    as_of=as_of if key in dirty else states[key].as_of
+                ))
+                if prediction['confidence_score'] >= 0.5:  # Only store reasonable predictions
                     predictions.append(prediction)
         
+        if progress:
+            progress(len(series), len(series))
         return predictions
     
-    @transaction.atomic
-    def save_predictions(self, predictions):
+    def save_predictions(self, predictions, run=None):
         """
-        Save predictions to database and create alerts if needed
+        Save predictions to database and create alerts if needed. Rows are
+        upserted in chunks of PREDICTION_SAVE_CHUNK_SIZE, each chunk with its
+        alerts in its own transaction, so locks are held per chunk rather
+        than for the whole run.
         """
         saved_predictions = []
+        chunk_size = settings.PREDICTION_SAVE_CHUNK_SIZE
         
-        for prediction_data in predictions:
-            # Create or update prediction
-            prediction, created = ShortagePrediction.objects.update_or_create(
-                medical_item=prediction_data['medical_item'],
-                region=prediction_data['region'],
-                predicted_shortage_date=prediction_data['predicted_shortage_date'],
-                defaults={
-                    'confidence_score': prediction_data['confidence_score'],
-                    'severity_level': prediction_data['severity_level'],
-                    'predicted_shortage_duration': prediction_data['predicted_shortage_duration'],
-                    'demand_increase_reason': prediction_data['demand_increase_reason'],
-                    'supply_constraint_reason': prediction_data['supply_constraint_reason'],
-                    'is_active': True
-                }
-            )
-            
-            # Create alert if threshold met
-            if prediction_data['confidence_score'] >= self.config.shortage_alert_threshold:
-                self.create_prediction_alert(prediction)
+        for start in range(0, len(predictions), chunk_size):
+            chunk = predictions[start:start + chunk_size]
+            with transaction.atomic():
+                saved = ShortagePrediction.objects.bulk_create(
+                    [
+                        ShortagePrediction(
+                            medical_item=prediction_data['medical_item'],
+                            region=prediction_data['region'],
+                            predicted_shortage_date=prediction_data['predicted_shortage_date'],
+                            confidence_score=prediction_data['confidence_score'],
+                            severity_level=prediction_data['severity_level'],
+                            predicted_shortage_duration=prediction_data['predicted_shortage_duration'],
+                            demand_increase_reason=prediction_data['demand_increase_reason'],
+                            supply_constraint_reason=prediction_data['supply_constraint_reason'],
+                            is_active=True,
+                            run=run
+                        )
+                        for prediction_data in chunk
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['medical_item', 'region', 'predicted_shortage_date'],
+                    update_fields=[
+                        'confidence_score', 'severity_level', 'predicted_shortage_duration',
+                        'demand_increase_reason', 'supply_constraint_reason', 'is_active', 'run'
+                    ]
+                )
+                
+                # Create alerts where threshold met
+                self.create_prediction_alerts([
+                    prediction for prediction in saved
+                    if prediction.confidence_score >= self.config.shortage_alert_threshold
+                ])
             
-            saved_predictions.append(prediction)
+            saved_predictions.extend(saved)
+        
+        # States follow the predictions they describe, never ahead of them
+        if self.pending_states:
+            with transaction.atomic():
+                SeriesForecast.objects.bulk_create(
+                    self.pending_states,
+                    batch_size=chunk_size,
+                    update_conflicts=True,
+                    unique_fields=['config', 'medical_item', 'region'],
+                    update_fields=[
+                        'config_updated_at', 'window_start', 'prediction_days', 'avg_demand', 'trend',
+                        'daily_forecast', 'current_supply', 'context_impact', 'as_of'
+                    ]
+                )
+            self.pending_states = []
         
         return saved_predictions
     
+    def alert_fields(self, prediction):
+        alert_type = 'shortage_imminent' if prediction.severity_level in ['high', 'critical'] else 'shortage_predicted'
+        
+        return {
+            'prediction': prediction,
+            'alert_type': alert_type,
+            'message': self.generate_alert_message(prediction),
+            'recommended_actions': self.generate_recommended_actions(prediction),
+            'notify_vendors': True,
+            'notify_health_authorities': prediction.severity_level in ['high', 'critical'],
+            'notify_public': prediction.severity_level == 'critical',
+        }
+    
     def create_prediction_alert(self, prediction):
         """
         Create alert for a prediction
         """
-        alert_type = 'shortage_imminent' if prediction.severity_level in ['high', 'critical'] else 'shortage_predicted'
+        return self.create_prediction_alerts([prediction])[0]
+    
+    def create_prediction_alerts(self, predictions):
+        """
+        Create or coalesce alerts for a batch of predictions with one read,
+        one bulk insert and one bulk update. Repeats for the same item and
+        region within the coalescing window update the latest existing alert,
+        including repeats within the batch. Returns the alerts in order.
+        """
+        if not predictions:
+            return []
         
-        message = self.generate_alert_message(prediction)
-        recommended_actions = self.generate_recommended_actions(prediction)
-        
-        alert = PredictionAlert.objects.create(
-            prediction=prediction,
-            alert_type=alert_type,
-            message=message,
-            recommended_actions=recommended_actions,
-            notify_vendors=True,
-            notify_health_authorities=prediction.severity_level in ['high', 'critical'],
-            notify_public=prediction.severity_level == 'critical'
-        )
+        keys = [coalesce_key('shortage_alert', prediction.medical_item_id, prediction.region) for prediction in predictions]
+        now = timezone.now()
+        
+        with transaction.atomic():
+            existing = {}
+            for alert in PredictionAlert.objects.select_for_update().filter(
+                coalesce_key__in=set(keys),
+                sent_at__gte=window_start()
+            ).order_by('sent_at'):
+                existing[alert.coalesce_key] = alert  # Latest per key wins
+            
+            alerts, created, updated = [], {}, {}
+            for key, prediction in zip(keys, predictions):
+                fields = self.alert_fields(prediction)
+                alert = created.get(key) or existing.get(key)
+                
+                if alert is None:
+                    alert = PredictionAlert(coalesce_key=key, **fields)
+                    created[key] = alert
+                else:
+                    for field, value in fields.items():
+                        # Never downgrade who is notified within the window
+                        if field.startswith('notify_'):
+                            value = value or getattr(alert, field)
+                        setattr(alert, field, value)
+                    alert.occurrence_count += 1
+                    alert.last_occurred_at = now
+                    if alert.pk:
+                        updated[key] = alert
+                alerts.append(alert)
+            
+            PredictionAlert.objects.bulk_create(list(created.values()))
+            if updated:
+                PredictionAlert.objects.bulk_update(
+                    list(updated.values()),
+                    ['prediction', 'alert_type', 'message', 'recommended_actions', 'notify_vendors',
+                     'notify_health_authorities', 'notify_public', 'occurrence_count', 'last_occurred_at']
+                )
         
-        return alert
+        return alerts
     
     def generate_alert_message(self, prediction):
         """Generate alert message based on prediction"""
-        return (
-            f"Potential {prediction.medical_item.name} shortage predicted in {prediction.region}. "
-            f"Severity: {prediction.severity_level}. "
-            f"Confidence: {prediction.confidence_score:.1%}"
-        )
+        return message_templates.render('prediction_alert', {
+            'item_name': prediction.medical_item.name,
+            'region': prediction.region,
+            'severity': prediction.severity_level,
+            'confidence_percent': prediction.confidence_score * 100,
+        })['message']
     
     def generate_recommended_actions(self, prediction):
         """Generate recommended actions based on prediction"""
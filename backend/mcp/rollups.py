@@ -0,0 +1,123 @@
+"""
+Weekly and monthly DemandData rollups. Saving a DemandData row refreshes the
+buckets it falls in (see mcp.signals) and deletes refresh theirs once per
+batch (DemandData.demand_deleted); bulk writes that skip signals call
+refresh_rollups with the keys they touched.
+"""
+import logging
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import DemandData, DemandRollup
+
+logger = logging.getLogger(__name__)
+
+GRAIN_DAYS = {'day': 1, 'week': 7, 'month': 30.4375}
+ROLLUP_GRAINS = ('week', 'month')
+
+def bucket_start(day, grain):
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    return day
+
+def bucket_end(start, grain):
+    """
+    First day after the bucket
+    """
+    if grain == 'week':
+        return start + timedelta(days=7)
+    if grain == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+def choose_grain(days_back):
+    """
+    Coarsest grain that still gives DEMAND_ROLLUP_MIN_PERIODS buckets over
+    the window
+    """
+    for grain in reversed(ROLLUP_GRAINS):
+        if days_back / GRAIN_DAYS[grain] >= settings.DEMAND_ROLLUP_MIN_PERIODS:
+            return grain
+    return 'day'
+
+def row_day(period_start):
+    """
+    UTC day of a DemandData period_start, which rollups and the demand
+    matrix both bucket by
+    """
+    period_start = DemandData._meta.get_field('period_start').to_python(period_start)
+    if timezone.is_naive(period_start):
+        period_start = timezone.make_aware(period_start)
+    return period_start.astimezone(dt_timezone.utc).date()
+
+def utc_datetime(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+def refresh_rollups(keys):
+    """
+    Recompute the week and month buckets containing the given (medical item
+    id, region, day) keys from the daily rows. Returns the number of buckets
+    written or removed.
+    """
+    buckets = {
+        (item_id, region, grain, bucket_start(day, grain))
+        for item_id, region, day in keys
+        for grain in ROLLUP_GRAINS
+    }
+    if not buckets:
+        return 0
+
+    first = min(start for _, _, _, start in buckets)
+    last = max(bucket_end(start, grain) for _, _, grain, start in buckets)
+    rows = DemandData.objects.filter(
+        medical_item_id__in={item_id for item_id, _, _, _ in buckets},
+        region__in={region for _, region, _, _ in buckets},
+        period_start__gte=utc_datetime(first),
+        period_start__lt=utc_datetime(last)
+    ).values_list('medical_item_id', 'region', 'period_start', 'demand_count')
+
+    totals = {}
+    for item_id, region, period_start, demand_count in rows:
+        day = row_day(period_start)
+        for grain in ROLLUP_GRAINS:
+            key = (item_id, region, grain, bucket_start(day, grain))
+            if key in buckets:
+                total, days = totals.get(key, (0, 0))
+                totals[key] = (total + demand_count, days + 1)
+
+    empty = buckets - totals.keys()
+    with transaction.atomic():
+        if totals:
+            DemandRollup.objects.bulk_create(
+                [DemandRollup(medical_item_id=item_id, region=region, grain=grain, period_start=start,
+                              demand_count=total, days_observed=days)
+                 for (item_id, region, grain, start), (total, days) in totals.items()],
+                update_conflicts=True,
+                unique_fields=['medical_item', 'region', 'grain', 'period_start'],
+                update_fields=['demand_count', 'days_observed', 'updated_at']
+            )
+        for item_id, region, grain, start in empty:
+            DemandRollup.objects.filter(
+                medical_item_id=item_id, region=region, grain=grain, period_start=start
+            ).delete()
+    return len(buckets)
+
+def rebuild_rollups(batch_size=5000):
+    """
+    Rebuild every rollup from the daily rows
+    """
+    DemandRollup.objects.all().delete()
+    keys = set()
+    refreshed = 0
+    rows = DemandData.objects.values_list('medical_item_id', 'region', 'period_start').iterator(chunk_size=batch_size)
+    for item_id, region, period_start in rows:
+        keys.add((item_id, region, row_day(period_start)))
+        if len(keys) >= batch_size:
+            refreshed += refresh_rollups(keys)
+            keys = set()
+    refreshed += refresh_rollups(keys)
+    logger.info(f"Rebuilt demand rollups: {refreshed} buckets refreshed")
+    return DemandRollup.objects.count()
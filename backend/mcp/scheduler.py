@@ -0,0 +1,115 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import MCPConfig, PredictionRun, SchedulerLease
+from .demand_store import DemandStore
+from .jobs import execute_run, fail_abandoned_jobs, run_queued_jobs
+
+logger = logging.getLogger(__name__)
+
+def default_node_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def acquire_lease(name, holder, seconds):
+    """
+    Take the named lease if it is free, expired or already ours. The
+    conditional UPDATE makes this safe across nodes sharing the database.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=seconds)
+    lease, created = SchedulerLease.objects.get_or_create(
+        name=name, defaults={'holder': holder, 'expires_at': expires_at}
+    )
+    if created:
+        return True
+    return SchedulerLease.objects.filter(
+        Q(expires_at__lte=now) | Q(holder=holder), name=name
+    ).update(holder=holder, expires_at=expires_at, acquired_at=now) == 1
+
+def renew_lease(name, holder, seconds):
+    """
+    Extend a lease we still hold. Fails once it has expired, since another
+    node may have taken it over since.
+    """
+    now = timezone.now()
+    return SchedulerLease.objects.filter(name=name, holder=holder, expires_at__gt=now).update(
+        expires_at=now + timedelta(seconds=seconds)
+    ) == 1
+
+def release_lease(name, holder):
+    SchedulerLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now())
+
+class PredictionScheduler:
+    """
+    Runs a prediction cycle for each active MCPConfig every
+    retraining_frequency_hours. A cycle holds the config's lease, so one node
+    runs it even when several schedulers poll the same database. Meant to run
+    in its own process (run_prediction_scheduler), never in API workers; it
+    also runs prediction jobs queued through the API.
+    """
+    def __init__(self, node=None, lease_seconds=None):
+        self.node = node or default_node_name()
+        self.lease_seconds = lease_seconds or settings.PREDICTION_SCHEDULER_LEASE_SECONDS
+
+    def lease_name(self, config):
+        return f"predictions:{config.name}"
+
+    def is_due(self, config, now):
+        if config.retraining_frequency_hours <= 0:
+            return False
+        last_run = config.runs.filter(trigger='schedule').order_by('-started_at').first()
+        return last_run is None or last_run.started_at + timedelta(hours=config.retraining_frequency_hours) <= now
+
+    def due_configs(self, now):
+        return [config for config in MCPConfig.objects.filter(is_active=True) if self.is_due(config, now)]
+
+    def run_cycle(self, config, force=False):
+        """
+        Run predictions for the config if it is due and the lease is free.
+        Returns the PredictionRun, or None when the cycle was skipped.
+        """
+        lease = self.lease_name(config)
+        if not acquire_lease(lease, self.node, self.lease_seconds):
+            return None
+
+        try:
+            # Holding the lease means no other node is running this config;
+            # runs still marked running were abandoned by a node that died
+            PredictionRun.objects.filter(config=config, trigger='schedule', status='running').update(
+                status='failed', finished_at=timezone.now(), error='Abandoned: lease expired before the run finished'
+            )
+            if not force and not self.is_due(config, timezone.now()):
+                return None
+            # Renewed with every progress update; the run stops if it lapses
+            return self.execute(config, heartbeat=lambda: renew_lease(lease, self.node, self.lease_seconds))
+        finally:
+            release_lease(lease, self.node)
+
+    def execute(self, config, heartbeat=None):
+        now = timezone.now()
+        run = PredictionRun.objects.create(config=config, node=self.node, started_at=now, heartbeat_at=now)
+        return execute_run(run, heartbeat)
+
+    def tick(self):
+        """
+        Run every due config once, then any queued jobs. Returns the runs
+        executed by this node.
+        """
+        fail_abandoned_jobs(self.lease_seconds)
+        if DemandStore.enabled():
+            # Prediction runs read the store as of its last sync
+            try:
+                DemandStore().sync()
+            except Exception as e:
+                logger.error(f"Demand store sync failed: {str(e)}")
+        runs = []
+        for config in self.due_configs(timezone.now()):
+            run = self.run_cycle(config)
+            if run is not None:
+                runs.append(run)
+        runs.extend(run_queued_jobs(self.node))
+        return runs
@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from .models import MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert
+from .models import (
+    MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert, WebhookSubscription, PredictionRun,
+    BacktestResult
+)
 from inventory.models import MedicalItem
 
 class MCPConfigSerializer(serializers.ModelSerializer):
@@ -7,6 +10,15 @@ class MCPConfigSerializer(serializers.ModelSerializer):
         model = MCPConfig
         fields = '__all__'
 
+    def validate_item_forecast_models(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Expected a mapping of medical item id to forecast model")
+        models = dict(MCPConfig.FORECAST_MODEL_CHOICES)
+        invalid = {item_id: model for item_id, model in value.items() if model not in models}
+        if invalid:
+            raise serializers.ValidationError(f"Unknown forecast models: {invalid}")
+        return {str(item_id): model for item_id, model in value.items()}
+
 class DemandDataSerializer(serializers.ModelSerializer):
     medical_item_name = serializers.CharField(source='medical_item.name', read_only=True)
     medical_item_category = serializers.CharField(source='medical_item.category', read_only=True)
@@ -36,6 +48,14 @@ class ShortagePredictionSerializer(serializers.ModelSerializer):
             return max(0, delta.days)
         return None
 
+class WebhookSubscriptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookSubscription
+        fields = '__all__'
+        read_only_fields = (
+            'secret', 'consecutive_failures', 'next_attempt_at', 'last_success_at', 'last_error', 'created_at'
+        )
+
 class PredictionAlertSerializer(serializers.ModelSerializer):
     prediction_details = ShortagePredictionSerializer(source='prediction', read_only=True)
     
@@ -44,13 +64,27 @@ class PredictionAlertSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Input serializers for prediction requests
+class PredictionRunSerializer(serializers.ModelSerializer):
+    config_name = serializers.CharField(source='config.name', read_only=True)
+    progress = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = PredictionRun
+        fields = '__all__'
+
+class BacktestResultSerializer(serializers.ModelSerializer):
+    config_name = serializers.CharField(source='config.name', read_only=True)
+    accuracy = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = BacktestResult
+        fields = '__all__'
+
 class PredictionRequestSerializer(serializers.Serializer):
     medical_item_id = serializers.IntegerField(required=False)
     region = serializers.CharField(max_length=100, required=False)
     prediction_days = serializers.IntegerField(default=14, min_value=1, max_value=90)
-
-class BulkDemandDataSerializer(serializers.Serializer):
-    demand_data = DemandDataSerializer(many=True)
+    incremental = serializers.BooleanField(default=False)  # Only re-predict series whose inputs changed
 
 class BulkContextDataSerializer(serializers.Serializer):
     context_data = ContextDataSerializer(many=True)
\ No newline at end of file
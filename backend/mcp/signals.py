@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import DemandData
+from .rollups import refresh_rollups, row_day
+
+def rollup_key(medical_item_id, region, period_start):
+    if medical_item_id is None or period_start is None:
+        return None
+    return (medical_item_id, region, row_day(period_start))
+
+@receiver(post_save, sender=DemandData)
+def refresh_rollups_on_demand_save(sender, instance, raw=False, **kwargs):
+    """
+    Refresh the buckets a saved row falls in, and the one it left if the
+    save moved it. Deletes are handled by DemandData.demand_deleted.
+    """
+    if raw:
+        return
+    current = (instance.medical_item_id, instance.region, instance.period_start)
+    loaded = getattr(instance, '_loaded_key', (None, None, None))
+    refresh_rollups({rollup_key(*current), rollup_key(*loaded)} - {None})
+    instance._loaded_key = current
@@ -1,16 +1,37 @@
 import json
-from django.test import TestCase
+import tempfile
+import threading
+from importlib import import_module
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
 from datetime import timedelta
 from decimal import Decimal
+import numpy as np
 
-from inventory.models import Vendor, MedicalItem, Inventory
+from inventory.models import Vendor, MedicalItem, Inventory, StockTransaction
 from ehr.models import Patient, MedicalRecord, Prescription
-from mcp.models import MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert
-from mcp.prediction_engine import MCPPredictionEngine
+from mcp.models import (
+    MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert,
+    WebhookSubscription, WebhookDelivery, PredictionRun, SeriesForecast, DemandRollup, BacktestResult,
+    SchedulerLease, DirtySeries
+)
+from mcp.prediction_engine import (
+    MCPPredictionEngine, OLSTrendForecaster, ExponentialSmoothingForecaster, HoltWintersForecaster, demand_matrix
+)
+from mcp.forecasting import fit_forecasts, fit_forecasts_parallel, get_pool, partition_series
+from mcp.rollups import choose_grain, rebuild_rollups
+from mcp.demand_store import DemandStore
+from mcp.backtesting import Backtester, accuracy_metrics, default_cutoffs, supply_at
+from mcp.jobs import run_job, claim_job, execute_run, fail_abandoned_jobs
+from mcp.scheduler import PredictionScheduler, acquire_lease, release_lease
+from mcp.webhooks import WebhookDispatcher, verify_signature, SIGNATURE_HEADER, TIMESTAMP_HEADER
 
 User = get_user_model()
 
@@ -175,6 +196,147 @@ class MCPPredictionEngineTestCase(TestCase):
         alerts_count = PredictionAlert.objects.count()
         self.assertGreater(alerts_count, 0)
 
+    def test_repeated_runs_coalesce_alerts(self):
+        """Test that re-running predictions updates alerts instead of duplicating them"""
+        engine = MCPPredictionEngine('test_config')
+        engine.save_predictions(engine.run_predictions(regions=['Lagos'], prediction_days=14))
+        alerts_count = PredictionAlert.objects.count()
+
+        engine.save_predictions(engine.run_predictions(regions=['Lagos'], prediction_days=14))
+
+        self.assertEqual(PredictionAlert.objects.count(), alerts_count)
+        self.assertEqual(PredictionAlert.objects.first().occurrence_count, 2)
+
+    def build_predictions(self, engine, regions):
+        return [
+            engine.build_prediction(self.insulin, region, (8.0, 0.5, 9.0), 20, 1.0, 14)
+            for region in regions
+        ]
+
+    def test_save_predictions_bulk_query_count(self):
+        """Test saving costs the same number of queries for 4 or 8 predictions per chunk"""
+        engine = MCPPredictionEngine('test_config')
+        query_counts = []
+        for regions in (['A', 'B', 'C', 'D'], ['E', 'F', 'G', 'H', 'I', 'J', 'K', 'L']):
+            predictions = self.build_predictions(engine, regions)
+            with CaptureQueriesContext(connection) as queries:
+                saved = engine.save_predictions(predictions)
+            query_counts.append(len(queries))
+            self.assertEqual(len(saved), len(regions))
+            self.assertTrue(all(prediction.pk for prediction in saved))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(PredictionAlert.objects.count(), 12)
+
+    @override_settings(PREDICTION_SAVE_CHUNK_SIZE=2)
+    def test_save_predictions_chunks_and_coalesces_within_batch(self):
+        """Test chunked saves coalesce repeats for the same item and region"""
+        engine = MCPPredictionEngine('test_config')
+        predictions = self.build_predictions(engine, ['Lagos', 'Abuja', 'Kano'])
+        repeat = dict(predictions[0], predicted_shortage_date=predictions[0]['predicted_shortage_date'] + timedelta(days=1))
+
+        engine.save_predictions(predictions + [repeat])
+
+        self.assertEqual(ShortagePrediction.objects.count(), 4)
+        self.assertEqual(PredictionAlert.objects.count(), 3)
+        self.assertEqual(PredictionAlert.objects.get(prediction__region='Lagos').occurrence_count, 2)
+
+    def test_per_item_forecast_model(self):
+        """Test that items use the model configured for them"""
+        config = MCPConfig.objects.get(name='test_config')
+        config.item_forecast_models = {str(self.insulin.id): 'exponential_smoothing'}
+        config.save()
+
+        engine = MCPPredictionEngine('test_config')
+        avg_demand, trend = engine.calculate_demand_trend(self.insulin, 'Lagos', days_back=30)
+
+        self.assertGreater(avg_demand, 0)
+        self.assertEqual(trend, 0)
+
+class ForecasterTestCase(TestCase):
+    """Test cases for the vectorized demand forecasters"""
+
+    def test_ols_recovers_linear_trends(self):
+        """Test least squares fits every series at once, skipping missing days"""
+        days = np.arange(28, dtype=float)
+        matrix = np.vstack([10 + 2 * days, 50 - 0.5 * days, np.full(28, 7.0)])
+        matrix[0, 5:9] = np.nan
+
+        forecaster = OLSTrendForecaster().fit(matrix)
+
+        np.testing.assert_allclose(forecaster.trend, [2, -0.5, 0], atol=1e-9)
+        np.testing.assert_allclose(forecaster.forecast(2)[0], [10 + 2 * 28, 10 + 2 * 29])
+
+    def test_exponential_smoothing_converges_to_level(self):
+        """Test smoothing tracks a level shift and ignores empty series"""
+        matrix = np.vstack([np.r_[np.full(10, 5.0), np.full(30, 20.0)], np.full(40, np.nan)])
+
+        forecast = ExponentialSmoothingForecaster(alpha=0.5).fit(matrix).forecast(3)
+
+        np.testing.assert_allclose(forecast[0], [20, 20, 20], atol=1e-3)
+        np.testing.assert_array_equal(forecast[1], [0, 0, 0])
+
+    def test_holt_winters_weekly_seasonality(self):
+        """Test Holt-Winters reproduces a weekly pattern"""
+        week = np.array([10, 12, 14, 30, 14, 12, 10], dtype=float)
+        matrix = np.tile(week, (3, 8))
+
+        forecast = HoltWintersForecaster().fit(matrix).forecast(7)
+
+        np.testing.assert_allclose(forecast[0], week, atol=0.5)
+
+    def test_demand_matrix_bins_rows_by_day(self):
+        """Test demand rows land in their series and day, summing duplicates"""
+        start = timezone.now() - timedelta(days=3)
+        rows = [
+            (1, 'Lagos', start, 4),
+            (1, 'Lagos', start + timedelta(days=2), 6),
+            (2, 'Abuja', start + timedelta(days=1), 3),
+            (2, 'Abuja', start + timedelta(days=1), 2),
+            (3, 'Lagos', start, 9),  # Not a requested series
+        ]
+
+        matrix = demand_matrix(rows, [(1, 'Lagos'), (2, 'Abuja')], start.date(), 4)
+
+        np.testing.assert_array_equal(matrix[0, :3], [4, np.nan, 6])
+        self.assertEqual(matrix[1, 1], 5)
+
+    def test_partition_series_keeps_regions_together(self):
+        """Test regions are packed whole when there are enough of them"""
+        series = [(item, region) for region in ('Lagos', 'Abuja', 'Kano') for item in range(4)]
+
+        parts = partition_series(series, 2)
+
+        self.assertEqual(sorted(np.concatenate(parts).tolist()), list(range(12)))
+        regions_per_part = [{series[row][1] for row in rows} for rows in parts]
+        self.assertEqual(sum(len(regions) for regions in regions_per_part), 3)  # No region split
+        self.assertEqual(len(partition_series(series[:4], 3)), 3)  # One region dealt round-robin
+
+    def test_parallel_fit_matches_serial(self):
+        """Test fitting across processes returns the same forecasts"""
+        generator = np.random.default_rng(1)
+        matrix = generator.poisson(10, (40, 28)).astype(float)
+        series = [(item, f'Region {item % 3}') for item in range(40)]
+        models = ['ols_trend', 'holt_winters'] * 20
+
+        self.assertEqual(
+            fit_forecasts_parallel(matrix, series, models, 14, workers=2, min_cells=0),
+            fit_forecasts(matrix, series, models, 14)
+        )
+        # The pool outlives the call
+        self.assertIs(get_pool(2), get_pool(2))
+
+    def test_small_parallel_fit_stays_in_process(self):
+        """Test matrices under the size threshold never reach the process pool"""
+        matrix = np.random.default_rng(2).poisson(10, (40, 28)).astype(float)
+        series = [(item, f'Region {item % 3}') for item in range(40)]
+
+        with mock.patch('mcp.forecasting.get_pool') as get_pool_mock:
+            forecasts = fit_forecasts_parallel(matrix, series, ['ols_trend'] * 40, 14, workers=2, min_cells=40 * 28 + 1)
+
+        get_pool_mock.assert_not_called()
+        self.assertEqual(forecasts, fit_forecasts(matrix, series, ['ols_trend'] * 40, 14))
+
 class MCPAPITestCase(TestCase):
     """Test cases for MCP API endpoints"""
 
@@ -266,11 +428,60 @@ class MCPAPITestCase(TestCase):
             'prediction_days': 14
         }
         response = self.client.post('/api/mcp/predictions/run/', prediction_request, format='json')
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
         response_data = response.json()
-        self.assertIn('predictions', response_data)
+        self.assertIn('job_id', response_data)
         self.assertIn('message', response_data)
+        self.assertEqual(response_data['status'], 'queued')
+
+    def test_prediction_job_lifecycle(self):
+        """Test a queued job reports progress and serves paginated and NDJSON results"""
+        response = self.client.post('/api/mcp/predictions/run/', {'region': 'Lagos'}, format='json')
+        job_id = response.json()['job_id']
+
+        run_job(job_id)
+
+        response = self.client.get(f'/api/mcp/predictions/jobs/{job_id}/')
+        self.assertEqual(response.json()['status'], 'succeeded')
+        self.assertEqual(response.json()['progress'], 1.0)
+        prediction_count = response.json()['prediction_count']
+        self.assertGreater(prediction_count, 0)
+
+        response = self.client.get(f'/api/mcp/predictions/jobs/{job_id}/results/')
+        self.assertEqual(response.json()['count'], prediction_count)
+
+        response = self.client.get(f'/api/mcp/predictions/jobs/{job_id}/results/?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), prediction_count)
+        self.assertEqual(json.loads(lines[0])['region'], 'Lagos')
+
+    def test_prediction_job_cancellation(self):
+        """Test queued jobs cancel immediately and running jobs stop at the next progress update"""
+        queued_id = self.client.post('/api/mcp/predictions/run/', {}, format='json').json()['job_id']
+        response = self.client.post(f'/api/mcp/predictions/jobs/{queued_id}/cancel/')
+        self.assertEqual(response.json()['status'], 'cancelled')
+        self.assertIsNone(run_job(queued_id))
+        response = self.client.post(f'/api/mcp/predictions/jobs/{queued_id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        running_id = self.client.post('/api/mcp/predictions/run/', {}, format='json').json()['job_id']
+        job = claim_job(running_id)
+        self.client.post(f'/api/mcp/predictions/jobs/{running_id}/cancel/')
+        job = execute_run(job)
+
+        self.assertEqual(job.status, 'cancelled')
+        self.assertFalse(ShortagePrediction.objects.filter(run=job).exists())
+
+    def test_prediction_jobs_private_to_requester(self):
+        """Test other users cannot see a job"""
+        job_id = self.client.post('/api/mcp/predictions/run/', {}, format='json').json()['job_id']
+        other = User.objects.create_user(username='other', password='otherpass123', user_type='vendor')
+        self.client.force_authenticate(user=other)
+
+        response = self.client.get(f'/api/mcp/predictions/jobs/{job_id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_predictions_list_endpoint(self):
         """Test predictions list endpoint"""
@@ -452,3 +663,705 @@ class MCPIntegrationTestCase(TestCase):
             self.assertIn('shortage', alert.alert_type)
             self.assertIsNotNone(alert.message)
             self.assertIsNotNone(alert.recommended_actions)
+
+class WebhookReceiver:
+    """Local HTTP endpoint recording webhook POSTs"""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                receiver.requests.append((dict(self.headers), body))
+                self.send_response(receiver.status_code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/hook'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class WebhookDispatchTestCase(TestCase):
+    """Test cases for signed, batched webhook delivery of prediction alerts"""
+
+    def setUp(self):
+        """Set up three alerts in two regions and a local receiver"""
+        self.receiver = WebhookReceiver()
+        self.addCleanup(self.receiver.close)
+
+        item = MedicalItem.objects.create(name='Insulin', category='medication', unit_of_measure='vials')
+        self.alerts = []
+        for region, severity in (('Lagos', 'high'), ('Lagos', 'critical'), ('Abuja', 'medium')):
+            prediction = ShortagePrediction.objects.create(
+                medical_item=item,
+                region=region,
+                predicted_shortage_date=timezone.now() + timedelta(days=5),
+                confidence_score=0.9,
+                severity_level=severity,
+                predicted_shortage_duration=5
+            )
+            self.alerts.append(PredictionAlert.objects.create(
+                prediction=prediction,
+                alert_type='shortage_predicted',
+                message=f'{region} shortage',
+                notify_health_authorities=severity != 'medium'
+            ))
+        # Subscriptions only receive alerts raised after they were created
+        PredictionAlert.objects.update(sent_at=timezone.now() + timedelta(seconds=1))
+
+        self.vendor_hook = WebhookSubscription.objects.create(
+            name='Lagos vendors', audience='vendor', url=self.receiver.url, regions=['Lagos']
+        )
+
+    def test_batched_signed_delivery(self):
+        """Alerts go out in signed batches and are marked sent"""
+        result = WebhookDispatcher(batch_size=2).dispatch()
+
+        self.assertEqual(result['delivered'], 2)
+        self.assertEqual(len(self.receiver.requests), 1)
+        headers, body = self.receiver.requests[0]
+        self.assertTrue(verify_signature(
+            self.vendor_hook.secret, headers[TIMESTAMP_HEADER], body, headers[SIGNATURE_HEADER]
+        ))
+        payload = json.loads(body)
+        self.assertEqual([alert['id'] for alert in payload['alerts']], [self.alerts[0].id, self.alerts[1].id])
+
+        self.assertEqual(
+            set(PredictionAlert.objects.filter(is_sent=True).values_list('id', flat=True)),
+            {self.alerts[0].id, self.alerts[1].id}
+        )
+        # Nothing left to send
+        self.assertEqual(WebhookDispatcher().dispatch()['endpoints'], 0)
+
+    def test_alert_waits_for_every_audience(self):
+        """An alert for vendors and authorities is sent once both have it"""
+        authority_receiver = WebhookReceiver(status_code=503)
+        self.addCleanup(authority_receiver.close)
+        authority = WebhookSubscription.objects.create(
+            name='Ministry', audience='health_authority', url=authority_receiver.url
+        )
+
+        result = WebhookDispatcher().dispatch()
+
+        self.assertEqual(result['endpoints'], 2)
+        self.assertFalse(PredictionAlert.objects.filter(is_sent=True).exists())
+
+        authority_receiver.status_code = 200
+        WebhookSubscription.objects.filter(id=authority.id).update(next_attempt_at=None)
+        WebhookDispatcher().dispatch()
+
+        self.assertEqual(
+            set(PredictionAlert.objects.filter(is_sent=True).values_list('id', flat=True)),
+            {self.alerts[0].id, self.alerts[1].id}
+        )
+        self.assertEqual(len(self.receiver.requests), 1)
+
+    def test_coalesced_update_is_sent_again(self):
+        """An alert that recurs after delivery is queued again with its new occurrence count"""
+        WebhookDispatcher().dispatch()
+        PredictionAlert.objects.filter(id=self.alerts[0].id).update(
+            occurrence_count=2, last_occurred_at=timezone.now()
+        )
+
+        result = WebhookDispatcher().dispatch()
+
+        self.assertEqual(result['delivered'], 1)
+        payload = json.loads(self.receiver.requests[-1][1])
+        self.assertEqual([(alert['id'], alert['occurrence_count']) for alert in payload['alerts']],
+                         [(self.alerts[0].id, 2)])
+        self.assertEqual(WebhookDispatcher().dispatch()['endpoints'], 0)
+
+    def test_failure_backs_off_endpoint(self):
+        """A failing endpoint records the error and is skipped until its backoff expires"""
+        self.receiver.status_code = 500
+
+        result = WebhookDispatcher().dispatch()
+
+        self.assertEqual(result['failed'], 2)
+        self.vendor_hook.refresh_from_db()
+        self.assertEqual(self.vendor_hook.consecutive_failures, 1)
+        self.assertGreater(self.vendor_hook.next_attempt_at, timezone.now())
+        alert = PredictionAlert.objects.get(id=self.alerts[0].id)
+        self.assertFalse(alert.is_sent)
+        self.assertEqual(alert.delivery_attempts, 1)
+        self.assertEqual(alert.last_delivery_error, 'HTTP 500')
+
+        self.receiver.status_code = 200
+        self.assertEqual(WebhookDispatcher().dispatch()['endpoints'], 0)
+        self.assertEqual(len(self.receiver.requests), 1)
+
+class PredictionSchedulerTestCase(TestCase):
+    """Test cases for scheduled prediction cycles"""
+
+    def setUp(self):
+        """Set up one stocked item with demand history in Lagos"""
+        user = User.objects.create_user(username='vendor', password='testpass123', user_type='vendor')
+        vendor = Vendor.objects.create(
+            user=user, vendor_type='pharmacy', business_name='Test Pharmacy', business_license='TEST001',
+            address='123 Test St', city='Lagos', country='Nigeria', contact_person='Test Contact',
+            contact_email='contact@test.com', contact_phone='+234123456789'
+        )
+        item = MedicalItem.objects.create(name='Insulin', category='medication', unit_of_measure='vials')
+        Inventory.objects.create(
+            vendor=vendor, medical_item=item, current_stock=20, minimum_stock=5, maximum_stock=100,
+            unit_price=Decimal('15.00'), expiry_date=timezone.now().date() + timedelta(days=365)
+        )
+        for i in range(14):
+            day = timezone.now() - timedelta(days=14 - i)
+            DemandData.objects.create(
+                medical_item=item, region='Lagos', demand_count=5 + i,
+                period_start=day.replace(hour=0, minute=0, second=0),
+                period_end=day.replace(hour=23, minute=59, second=59)
+            )
+        self.config = MCPConfig.objects.create(name='default', retraining_frequency_hours=6)
+
+    def test_lease_is_exclusive_until_released(self):
+        """Only one node holds a lease at a time"""
+        self.assertTrue(acquire_lease('predictions:default', 'node-a', 60))
+        self.assertFalse(acquire_lease('predictions:default', 'node-b', 60))
+        self.assertTrue(acquire_lease('predictions:default', 'node-a', 60))
+
+        release_lease('predictions:default', 'node-a')
+
+        self.assertTrue(acquire_lease('predictions:default', 'node-b', 60))
+
+    def test_tick_runs_due_configs_at_their_cadence(self):
+        """Due configs run once and record metadata; the next tick waits for the cadence"""
+        scheduler = PredictionScheduler(node='node-a')
+
+        runs = scheduler.tick()
+
+        self.assertEqual(len(runs), 1)
+        run = PredictionRun.objects.get()
+        self.assertEqual(run.status, 'succeeded')
+        self.assertEqual(run.series_count, 1)
+        self.assertEqual(run.prediction_count, ShortagePrediction.objects.count())
+        self.assertIsNotNone(run.duration_seconds)
+        self.assertEqual(scheduler.tick(), [])
+
+        PredictionRun.objects.update(started_at=timezone.now() - timedelta(hours=7))
+        self.assertEqual(len(scheduler.tick()), 1)
+
+    def test_cycle_skipped_while_another_node_holds_lease(self):
+        """A node skips configs leased by another node"""
+        acquire_lease('predictions:default', 'node-b', 60)
+
+        self.assertIsNone(PredictionScheduler(node='node-a').run_cycle(self.config))
+        self.assertFalse(PredictionRun.objects.exists())
+
+    def test_abandoned_runs_marked_failed(self):
+        """Runs left running by a dead node are failed when the lease is next taken"""
+        stale = PredictionRun.objects.create(config=self.config, node='node-b')
+        PredictionRun.objects.update(started_at=timezone.now() - timedelta(hours=7))
+
+        run = PredictionScheduler(node='node-a').run_cycle(self.config)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertEqual(run.status, 'succeeded')
+
+    def test_abandoned_api_jobs_marked_failed(self):
+        """API jobs whose worker stopped reporting progress are failed by the next tick"""
+        stale = PredictionRun.objects.create(config=self.config, trigger='api', node='api-1')
+        live = PredictionRun.objects.create(config=self.config, trigger='api', node='api-2')
+        PredictionRun.objects.filter(id=stale.id).update(heartbeat_at=timezone.now() - timedelta(hours=3))
+        PredictionRun.objects.filter(id=live.id).update(heartbeat_at=timezone.now())
+
+        PredictionScheduler(node='node-a', lease_seconds=3600).tick()
+
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertEqual(live.status, 'running')
+
+    def test_run_failed_as_abandoned_keeps_its_outcome(self):
+        """A slow run failed as abandoned meanwhile neither saves its results nor reports success"""
+        def abandon_mid_run(engine, *args, progress=None, **kwargs):
+            fail_abandoned_jobs(seconds=1)
+            return [{'medical_item': None}]
+
+        run = PredictionRun.objects.create(config=self.config, trigger='api', node='api-1')
+        PredictionRun.objects.filter(id=run.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        with mock.patch.object(MCPPredictionEngine, 'run_predictions', abandon_mid_run), \
+                mock.patch.object(MCPPredictionEngine, 'save_predictions') as save_predictions:
+            run = execute_run(run)
+
+        save_predictions.assert_not_called()
+        self.assertEqual(run.status, 'failed')
+        self.assertIn('Abandoned', run.error)
+
+        def abandon_while_saving(engine, predictions, run=None):
+            PredictionRun.objects.filter(id=run.id).update(status='failed', error='Abandoned')
+            return []
+
+        run = PredictionRun.objects.create(config=self.config, trigger='api', node='api-1')
+        with mock.patch.object(MCPPredictionEngine, 'save_predictions', abandon_while_saving):
+            run = execute_run(run)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'failed')
+
+    def test_progress_renews_lease(self):
+        """Each progress update extends the lease held for the cycle"""
+        expiries = []
+
+        def report_progress(engine, *args, progress=None, **kwargs):
+            SchedulerLease.objects.update(expires_at=timezone.now() + timedelta(seconds=5))
+            progress(0, 1)
+            expiries.append(SchedulerLease.objects.get().expires_at)
+            return []
+
+        with mock.patch.object(MCPPredictionEngine, 'run_predictions', report_progress):
+            run = PredictionScheduler(node='node-a', lease_seconds=600).run_cycle(self.config)
+
+        self.assertEqual(run.status, 'succeeded')
+        self.assertGreater(expiries[0], timezone.now() + timedelta(seconds=500))
+
+    def test_run_stops_when_lease_expires_mid_run(self):
+        """A run whose lease lapsed stops before saving, and another node can take over"""
+        def expire_lease_mid_run(engine, *args, progress=None, **kwargs):
+            SchedulerLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+            progress(0, 1)
+            return []
+
+        with mock.patch.object(MCPPredictionEngine, 'run_predictions', expire_lease_mid_run):
+            run = PredictionScheduler(node='node-a').run_cycle(self.config)
+
+        self.assertEqual(run.status, 'failed')
+        self.assertIn('lease lost', run.error)
+        self.assertFalse(ShortagePrediction.objects.exists())
+        self.assertTrue(acquire_lease('predictions:default', 'node-b', 60))
+
+
+@override_settings(PREDICTION_DIRTY_MARGIN_SECONDS=0)
+class IncrementalPredictionTestCase(TestCase):
+    """Test cases for re-predicting only series whose inputs changed"""
+
+    FORECAST_FIELDS = ('avg_demand', 'trend', 'daily_forecast', 'current_supply', 'context_impact')
+
+    def setUp(self):
+        """Set up two stocked items in Lagos and Abuja with two weeks of demand"""
+        self.items = [
+            MedicalItem.objects.create(name=name, category='medication', unit_of_measure='units')
+            for name in ('Insulin', 'Amoxicillin')
+        ]
+        self.inventory = {}
+        for city in ('Lagos', 'Abuja'):
+            user = User.objects.create_user(username=f'vendor-{city}', password='testpass123', user_type='vendor')
+            vendor = Vendor.objects.create(
+                user=user, vendor_type='pharmacy', business_name=f'{city} Pharmacy', business_license=city,
+                address='1 Test St', city=city, country='Nigeria', contact_person='Contact',
+                contact_email=f'{city}@test.com', contact_phone='+234123456789'
+            )
+            for item in self.items:
+                self.inventory[item.id, city] = Inventory.objects.create(
+                    vendor=vendor, medical_item=item, current_stock=40,
+                    expiry_date=timezone.now().date() + timedelta(days=365)
+                )
+                for i in range(14):
+                    self.add_demand(item, city, days_ago=14 - i, count=5 + i % 4)
+        MCPConfig.objects.create(name='default')
+        self.regions = ['Lagos', 'Abuja']
+
+    def add_demand(self, item, region, days_ago, count):
+        day = timezone.now() - timedelta(days=days_ago)
+        return DemandData.objects.create(
+            medical_item=item, region=region, demand_count=count,
+            period_start=day.replace(hour=0, minute=0, second=0, microsecond=0),
+            period_end=day.replace(hour=23, minute=59, second=59, microsecond=0)
+        )
+
+    def run_cycle(self, incremental=True):
+        engine = MCPPredictionEngine()
+        engine.save_predictions(engine.run_predictions(regions=self.regions, incremental=incremental))
+        return engine.run_stats['recomputed']
+
+    def stored_forecasts(self):
+        return {
+            (state.medical_item_id, state.region): tuple(getattr(state, field) for field in self.FORECAST_FIELDS)
+            for state in SeriesForecast.objects.all()
+        }
+
+    def full_recompute(self):
+        engine = MCPPredictionEngine()
+        engine.run_predictions(regions=self.regions)
+        return {
+            (state.medical_item_id, state.region): tuple(getattr(state, field) for field in self.FORECAST_FIELDS)
+            for state in engine.pending_states
+        }
+
+    def test_unchanged_series_are_skipped(self):
+        """A second cycle with no input changes re-predicts nothing"""
+        self.assertEqual(self.run_cycle(), 4)
+        self.assertEqual(self.run_cycle(), 0)
+
+    def test_window_moving_alone_keeps_fits_until_max_age(self):
+        """A later day with no demand entering or leaving the window re-predicts nothing"""
+        self.run_cycle()
+        now = timezone.now()
+
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(days=1)):
+            self.assertEqual(self.run_cycle(), 0)
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(days=8)):
+            self.assertEqual(self.run_cycle(), 4)
+
+    def test_new_demand_recomputes_only_its_series(self):
+        """New demand re-predicts its series and matches a full recompute"""
+        self.run_cycle()
+        demand = DemandData.objects.filter(medical_item=self.items[0], region='Lagos').first()
+        demand.demand_count = 30
+        demand.save()
+
+        self.assertEqual(self.run_cycle(), 1)
+        self.assertEqual(self.stored_forecasts(), self.full_recompute())
+
+    def test_supply_change_recomputes_series(self):
+        """A stock transaction re-predicts the item in the vendor's region"""
+        self.run_cycle()
+        StockTransaction.objects.create(
+            inventory=self.inventory[self.items[1].id, 'Abuja'], transaction_type='out', quantity=25
+        )
+
+        self.assertEqual(self.run_cycle(), 1)
+        self.assertEqual(self.stored_forecasts(), self.full_recompute())
+
+    def test_deleted_demand_and_new_context_recompute_series(self):
+        """Deleted demand rows and new context data are picked up"""
+        self.run_cycle()
+        DemandData.objects.filter(medical_item=self.items[1], region='Lagos').last().delete()
+        self.assertEqual(self.run_cycle(), 1)
+
+        ContextData.objects.create(
+            region='Abuja', data_type='weather', rainfall=80.0,
+            effective_date=timezone.now(), expiry_date=timezone.now() + timedelta(days=2)
+        )
+        self.assertEqual(self.run_cycle(), 2)
+        self.assertEqual(self.stored_forecasts(), self.full_recompute())
+
+
+class DemandRollupTestCase(TestCase):
+    """Test cases for weekly and monthly demand rollups"""
+
+    def setUp(self):
+        self.item = MedicalItem.objects.create(name='Insulin', category='medication', unit_of_measure='units')
+        MCPConfig.objects.create(name='default')
+        self.today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def add_demand(self, days_ago, count):
+        day = self.today - timedelta(days=days_ago)
+        return DemandData.objects.create(
+            medical_item=self.item, region='Lagos', demand_count=count,
+            period_start=day, period_end=day + timedelta(hours=23, minutes=59)
+        )
+
+    def rollups(self):
+        return set(DemandRollup.objects.values_list('grain', 'period_start', 'demand_count', 'days_observed'))
+
+    def test_rollups_follow_daily_rows(self):
+        """Saves, moves and deletes of daily rows keep the buckets equal to a rebuild"""
+        rows = [self.add_demand(days_ago, 10) for days_ago in range(1, 40)]
+        rows[0].demand_count = 25
+        rows[0].save()
+        rows[1].period_start -= timedelta(days=60)
+        rows[1].period_end -= timedelta(days=60)
+        rows[1].save()
+        rows[2].delete()
+
+        incremental = self.rollups()
+        self.assertEqual(sum(count for grain, _, count, _ in incremental if grain == 'week'), 10 * 37 + 25)
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_batch_delete_refreshes_once(self):
+        """Queryset deletes refresh rollups and mark series dirty once per batch, not per row"""
+        rows = [self.add_demand(days_ago, 10) for days_ago in range(1, 60)]
+
+        with CaptureQueriesContext(connection) as few:
+            DemandData.objects.filter(pk=rows[0].pk).delete()
+        with CaptureQueriesContext(connection) as many:
+            DemandData.objects.filter(pk__in=[row.pk for row in rows[1::2]]).delete()
+
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(DirtySeries.objects.count(), 2)
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_migration_backfills_existing_rows(self):
+        """Daily rows saved before the rollup table existed are rolled up by the data migration"""
+        from django.apps import apps
+        backfill = import_module('mcp.migrations.0010_backfill_demand_rollups')
+        for days_ago in range(1, 40):
+            self.add_demand(days_ago, days_ago)
+        expected = self.rollups()
+        DemandRollup.objects.all().delete()
+
+        backfill.backfill_demand_rollups(apps, None)
+        self.assertEqual(self.rollups(), expected)
+
+    def test_choose_grain(self):
+        self.assertEqual(choose_grain(30), 'day')
+        self.assertEqual(choose_grain(120), 'week')
+        self.assertEqual(choose_grain(400), 'month')
+
+    def test_long_window_forecast_matches_daily_fit(self):
+        """A window read from weekly rollups gives the daily fit's average and trend"""
+        for days_ago in range(1, 141):
+            self.add_demand(days_ago, 10 + (140 - days_ago) // 7)
+
+        engine = MCPPredictionEngine()
+        series = (self.item.id, 'Lagos')
+        avg_demand, trend, daily_forecast = engine.forecast_demand([series], days_back=120)[series]
+        with override_settings(DEMAND_ROLLUP_MIN_PERIODS=1000):
+            daily_avg, daily_trend, daily_daily_forecast = engine.forecast_demand([series], days_back=120)[series]
+
+        self.assertAlmostEqual(trend, 1 / 7, places=2)
+        self.assertAlmostEqual(trend, daily_trend, places=2)
+        self.assertAlmostEqual(avg_demand, daily_avg, delta=1)
+        self.assertAlmostEqual(daily_forecast, daily_daily_forecast, delta=1)
+
+        grain, recent = engine.recent_demand(self.item, 'Lagos', days_back=120, limit=3)
+        self.assertEqual(grain, 'week')
+        self.assertEqual(len(recent), 3)
+
+
+class DemandStoreTestCase(TestCase):
+    """Test cases for the memory-mapped per-region demand store"""
+
+    def setUp(self):
+        self.items = [
+            MedicalItem.objects.create(name=name, category='medication', unit_of_measure='units')
+            for name in ('Insulin', 'Amoxicillin')
+        ]
+        MCPConfig.objects.create(name='default')
+        self.today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.rows = {}
+        for item in self.items:
+            for days_ago in range(1, 21):
+                self.rows[item.id, days_ago] = self.add_demand(item, 'Lagos', days_ago, days_ago % 5 + 3)
+        self.add_demand(self.items[0], 'Abuja', 3, 7)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.series = [(item.id, region) for item in self.items for region in ('Lagos', 'Abuja')]
+
+    def add_demand(self, item, region, days_ago, count):
+        day = self.today - timedelta(days=days_ago)
+        return DemandData.objects.create(
+            medical_item=item, region=region, demand_count=count,
+            period_start=day, period_end=day + timedelta(hours=23, minutes=59)
+        )
+
+    def assert_matches_orm(self):
+        engine = MCPPredictionEngine()
+        expected = engine.load_demand_history(self.series, 30)
+        DemandStore(self.directory.name).sync()
+        with override_settings(DEMAND_STORE_DIR=self.directory.name):
+            stored = engine.load_demand_history(self.series, 30)
+        np.testing.assert_array_equal(stored, expected)
+        return expected
+
+    def test_store_matches_orm_history(self):
+        self.assertEqual(np.count_nonzero(~np.isnan(self.assert_matches_orm())), 41)
+        history = DemandStore(self.directory.name).load('Lagos')
+        self.assertIsInstance(history.matrix, np.memmap)
+        self.assertEqual(history.matrix.shape, (2, 20))
+
+    @override_settings(PREDICTION_DIRTY_MARGIN_SECONDS=0)
+    def test_incremental_sync_reloads_changed_items(self):
+        """Writes and deletes reload only their items, and the store stays equal to the ORM"""
+        store = DemandStore(self.directory.name)
+        store.sync()
+        self.assertEqual(store.sync(), {'Abuja': 0, 'Lagos': 0})
+
+        self.rows[self.items[0].id, 4].delete()
+        self.add_demand(self.items[0], 'Lagos', 25, 9)
+        self.assertEqual(store.sync(['Lagos']), {'Lagos': 1})
+        self.assertEqual(len(list(store.region_path('Lagos').glob('matrix-*.npy'))), 2)
+
+        row = self.rows[self.items[1].id, 2]
+        row.demand_count = 40
+        row.save()
+        self.assertEqual(store.sync(['Lagos']), {'Lagos': 1})
+        self.assert_matches_orm()
+
+    @override_settings(PREDICTION_DIRTY_MARGIN_SECONDS=0)
+    def test_incremental_runs_read_as_of_the_sync(self):
+        """Demand written after the store's last sync stays dirty until a sync picks it up"""
+        store = DemandStore(self.directory.name)
+        store.sync()
+        synced_at = store.load('Lagos').synced_at
+        row = self.rows[self.items[0].id, 2]
+        row.demand_count = 40
+        row.save()
+
+        item_ids = [item.id for item in self.items]
+        with override_settings(DEMAND_STORE_DIR=self.directory.name):
+            engine = MCPPredictionEngine()
+            engine.save_predictions(engine.run_predictions(regions=['Lagos'], medical_items=item_ids, incremental=True))
+            self.assertEqual(set(SeriesForecast.objects.values_list('as_of', flat=True)), {synced_at})
+
+            store.sync(['Lagos'])
+            engine = MCPPredictionEngine()
+            engine.run_predictions(regions=['Lagos'], medical_items=item_ids, incremental=True)
+            self.assertEqual(engine.run_stats['recomputed'], 1)
+
+    def test_previous_version_outlives_one_sync(self):
+        """A reader holding the meta.json from before a sync can still open its files"""
+        store = DemandStore(self.directory.name)
+        store.sync()
+        path = store.region_path('Lagos')
+        first = json.loads((path / 'meta.json').read_text())['version']
+
+        self.add_demand(self.items[0], 'Lagos', 25, 9)
+        store.sync(['Lagos'])
+        np.load(path / f"matrix-{first}.npy", mmap_mode='r')
+
+        self.add_demand(self.items[0], 'Lagos', 26, 9)
+        store.sync(['Lagos'])
+        self.assertFalse((path / f"matrix-{first}.npy").exists())
+        self.assertEqual(store.load('Lagos').matrix.shape, (2, 26))
+
+    def test_reads_do_not_sync(self):
+        """Prediction reads see the store as of the scheduler's last sync"""
+        engine = MCPPredictionEngine()
+        with override_settings(DEMAND_STORE_DIR=self.directory.name):
+            self.assertTrue(np.isnan(engine.load_demand_history(self.series, 30)).all())
+            PredictionScheduler(node='node-a').tick()
+            self.assertEqual(np.count_nonzero(~np.isnan(engine.load_demand_history(self.series, 30))), 41)
+
+
+class DemandIngestTestCase(TestCase):
+    """Test cases for bulk demand uploads"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ingest', password='testpass123', user_type='admin')
+        self.client.force_authenticate(user=self.user)
+        self.item = MedicalItem.objects.create(name='Insulin', category='medication', unit_of_measure='units')
+        self.url = '/api/mcp/bulk/demand-data/'
+
+    def csv_body(self, rows):
+        lines = ['medical_item,medical_item_name,region,demand_count,period_start,period_end,disease_outbreak']
+        lines += [','.join(str(value) for value in row) for row in rows]
+        return '\n'.join(lines) + '\n'
+
+    def test_csv_upload_upserts_and_reports_invalid_rows(self):
+        body = self.csv_body([
+            (self.item.id, '', 'Lagos', 5, '2025-01-06T00:00:00Z', '2025-01-06T23:59:59Z', 'true'),
+            ('', 'insulin', 'Lagos', 7, '2025-01-07T00:00:00Z', '2025-01-07T23:59:59Z', ''),
+            (999, '', 'Lagos', 3, '2025-01-08T00:00:00Z', '2025-01-08T23:59:59Z', ''),
+            (self.item.id, '', '', -1, 'yesterday', '2025-01-08T23:59:59Z', ''),
+        ])
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['rejected']), (2, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertEqual(len(response.data['errors'][1]['errors']), 3)
+        self.assertTrue(DemandData.objects.get(demand_count=5).disease_outbreak)
+
+        # Rollups are kept in step although bulk_create skips signals
+        rollup = DemandRollup.objects.get(grain='week')
+        self.assertEqual((rollup.demand_count, rollup.days_observed), (12, 2))
+
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 2))
+        self.assertEqual(DemandData.objects.count(), 2)
+
+    def test_ndjson_sum_policy(self):
+        """Duplicates within and across uploads are added together"""
+        record = {
+            'medical_item': self.item.id, 'region': 'Lagos', 'demand_count': 4,
+            'period_start': '2025-01-06T00:00:00Z', 'period_end': '2025-01-06T23:59:59Z'
+        }
+        body = '\n'.join([json.dumps(record), json.dumps(record), 'not json']) + '\n'
+        response = self.client.post(
+            f'{self.url}?policy=sum', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual((response.data['created'], response.data['rejected']), (1, 1))
+        self.client.post(f'{self.url}?policy=sum', {'demand_data': [record]}, format='json')
+        self.assertEqual(DemandData.objects.get().demand_count, 12)
+
+        response = self.client.post(f'{self.url}?policy=merge', {'demand_data': [record]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BacktestTestCase(TestCase):
+    """Test cases for replaying the prediction engine over past cutoffs"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='vendor', password='testpass123', user_type='admin',
+                                             is_staff=True)
+        vendor = Vendor.objects.create(
+            user=self.user, vendor_type='pharmacy', business_name='Lagos Pharmacy', business_license='L1',
+            address='1 Test St', city='Lagos', country='Nigeria', contact_person='Contact',
+            contact_email='lagos@test.com', contact_phone='+234123456789'
+        )
+        self.scarce = MedicalItem.objects.create(name='Insulin', category='medication', unit_of_measure='units')
+        self.stocked = MedicalItem.objects.create(name='Amoxicillin', category='medication', unit_of_measure='units')
+        self.today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Insulin had 5 units until a restock yesterday; Amoxicillin always had plenty
+        scarce_inventory = Inventory.objects.create(vendor=vendor, medical_item=self.scarce, current_stock=5)
+        Inventory.objects.create(vendor=vendor, medical_item=self.stocked, current_stock=1000)
+        restock = StockTransaction.objects.create(
+            inventory=scarce_inventory, transaction_type='in', quantity=95, previous_stock=0, new_stock=0
+        )
+        StockTransaction.objects.filter(id=restock.id).update(transaction_date=self.today - timedelta(days=1))
+        Inventory.objects.update(created_at=self.today - timedelta(days=90))
+
+        for item in (self.scarce, self.stocked):
+            for days_ago in range(1, 61):
+                day = self.today - timedelta(days=days_ago)
+                DemandData.objects.create(
+                    medical_item=item, region='Lagos', demand_count=12,
+                    period_start=day, period_end=day + timedelta(hours=23, minutes=59)
+                )
+        MCPConfig.objects.create(name='default')
+
+    def test_accuracy_metrics(self):
+        metrics = accuracy_metrics(
+            forecast=[12, 8, 5, 3],
+            actual=[10, 10, np.nan, 0],
+            predicted_shortage=[True, True, False, False],
+            actual_shortage=[True, False, True, False]
+        )
+        self.assertAlmostEqual(metrics['mape'], 0.2)
+        self.assertAlmostEqual(metrics['bias'], 0.0)
+        self.assertEqual((metrics['hit_rate'], metrics['miss_rate'], metrics['false_alarm_rate']), (0.5, 0.5, 0.5))
+
+    def test_supply_is_reconstructed_at_the_cutoff(self):
+        supply = supply_at(self.today - timedelta(days=7), [self.scarce.id, self.stocked.id], ['Lagos'])
+        self.assertEqual(supply, {(self.scarce.id, 'Lagos'): 5, (self.stocked.id, 'Lagos'): 1000})
+        self.assertEqual(supply_at(timezone.now(), [self.scarce.id], ['Lagos']), {(self.scarce.id, 'Lagos'): 100})
+
+    def test_backtest_is_stored_and_reported(self):
+        cutoffs = default_cutoffs(3, 7, 7, end=self.today)
+        result = Backtester().run(cutoffs, horizon_days=7, days_back=30)
+
+        self.assertEqual(result.model_version, 'ols_trend-v1')
+        self.assertEqual(result.series_count, 6)
+        self.assertAlmostEqual(result.mape, 0.0)
+        self.assertEqual((result.actual_shortages, result.hit_rate, result.false_alarm_rate), (3, 1.0, 0.0))
+        self.assertGreater(result.runtime_per_1k_series, 0)
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/mcp/stats/')
+        self.assertEqual(response.data['prediction_accuracy'], '100%')
+        self.assertEqual(response.data['backtest']['id'], result.id)
+
+        # Another model's backtest is kept apart from the configured model's accuracy
+        Backtester().run(cutoffs, horizon_days=7, days_back=30, model='holt_winters')
+        self.assertEqual(BacktestResult.objects.filter(model_version='holt_winters-v1').count(), 1)
+        self.assertEqual(client.get('/api/mcp/stats/').data['backtest']['id'], result.id)
+        self.assertEqual(len(client.get('/api/mcp/predictions/backtests/').data['results']), 2)
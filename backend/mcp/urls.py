@@ -19,10 +19,17 @@ urlpatterns = [
     path('predictions/<int:pk>/', views.ShortagePredictionDetailView.as_view(), name='prediction-detail'),
     path('predictions/run/', views.run_predictions, name='run-predictions'),
     path('predictions/critical/', views.get_critical_shortages, name='critical-shortages'),
+    path('predictions/runs/', views.PredictionRunListView.as_view(), name='prediction-run-list'),
+    path('predictions/backtests/', views.BacktestResultListView.as_view(), name='backtest-result-list'),
+    path('predictions/jobs/<int:pk>/', views.prediction_job_detail, name='prediction-job-detail'),
+    path('predictions/jobs/<int:pk>/cancel/', views.cancel_prediction_job, name='prediction-job-cancel'),
+    path('predictions/jobs/<int:pk>/results/', views.PredictionJobResultsView.as_view(), name='prediction-job-results'),
     
     # Alert endpoints
     path('alerts/', views.PredictionAlertListView.as_view(), name='alert-list'),
     path('alerts/<int:pk>/', views.PredictionAlertDetailView.as_view(), name='alert-detail'),
+    path('webhooks/', views.WebhookSubscriptionListView.as_view(), name='webhook-list'),
+    path('webhooks/<int:pk>/', views.WebhookSubscriptionDetailView.as_view(), name='webhook-detail'),
     
     # Bulk operations
     path('bulk/demand-data/', views.bulk_upload_demand_data, name='bulk-demand-data'),
@@ -2,20 +2,37 @@ import logging
 from rest_framework import generics, permissions, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
-from .models import MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert
+from .models import (
+    MCPConfig, DemandData, ContextData, ShortagePrediction, PredictionAlert, WebhookSubscription, PredictionRun,
+    BacktestResult
+)
 from .serializers import (
     MCPConfigSerializer, DemandDataSerializer, ContextDataSerializer,
     ShortagePredictionSerializer, PredictionAlertSerializer,
-    PredictionRequestSerializer, BulkDemandDataSerializer, BulkContextDataSerializer
+    PredictionRequestSerializer, BulkContextDataSerializer,
+    WebhookSubscriptionSerializer, PredictionRunSerializer, BacktestResultSerializer
 )
 from .prediction_engine import MCPPredictionEngine
+from .jobs import enqueue_job, cancel_job
+from .backtesting import config_model_version
+from .ingest import DemandIngestor, DUPLICATE_POLICIES, read_csv, read_ndjson
 
 logger = logging.getLogger(__name__)
 
+STREAMED_DEMAND_FORMATS = {
+    'text/csv': read_csv,
+    'application/x-ndjson': read_ndjson,
+    'application/jsonl': read_ndjson,
+}
+
 # MCP Configuration Views
 class MCPConfigListView(generics.ListCreateAPIView):
     queryset = MCPConfig.objects.all()
@@ -107,35 +124,125 @@ class PredictionAlertDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = PredictionAlertSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+# Webhook subscriptions for vendor and health-authority systems
+class WebhookSubscriptionListView(generics.ListCreateAPIView):
+    queryset = WebhookSubscription.objects.all()
+    serializer_class = WebhookSubscriptionSerializer
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+class WebhookSubscriptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+    queryset = WebhookSubscription.objects.all()
+    serializer_class = WebhookSubscriptionSerializer
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+class PredictionRunListView(generics.ListAPIView):
+    queryset = PredictionRun.objects.select_related('config').order_by('-created_at')
+    serializer_class = PredictionRunSerializer
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['config', 'status']
+
+class BacktestResultListView(generics.ListAPIView):
+    queryset = BacktestResult.objects.select_related('config')
+    serializer_class = BacktestResultSerializer
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['config', 'model_version']
+
 # Prediction Operations
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def run_predictions(request):
     """
-    Run shortage predictions based on request parameters
+    Queue a shortage prediction job based on request parameters. Poll the
+    job for progress and fetch its results once it has succeeded.
     """
     serializer = PredictionRequestSerializer(data=request.data)
     
     if serializer.is_valid():
-        engine = MCPPredictionEngine()
+        region = serializer.validated_data.get('region')
+        medical_item_id = serializer.validated_data.get('medical_item_id')
         
-        predictions = engine.run_predictions(
-            regions=serializer.validated_data.get('region'),
-            medical_items=serializer.validated_data.get('medical_item_id'),
-            prediction_days=serializer.validated_data.get('prediction_days', 14)
+        job = enqueue_job(
+            MCPPredictionEngine.get_config(),
+            {
+                'regions': [region] if region else None,
+                'medical_item_ids': [medical_item_id] if medical_item_id else None,
+                'prediction_days': serializer.validated_data.get('prediction_days', 14),
+                'incremental': serializer.validated_data.get('incremental', False),
+            },
+            user=request.user
         )
         
-        saved_predictions = engine.save_predictions(predictions)
-        
-        result_serializer = ShortagePredictionSerializer(saved_predictions, many=True)
-        
         return Response({
-            'message': f'Generated {len(saved_predictions)} predictions',
-            'predictions': result_serializer.data
-        })
+            'message': 'Prediction job queued',
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': reverse('prediction-job-detail', args=[job.id]),
+            'results_url': reverse('prediction-job-results', args=[job.id]),
+        }, status=status.HTTP_202_ACCEPTED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def get_job_for_user(request, pk):
+    jobs = PredictionRun.objects.select_related('config')
+    if not request.user.is_staff:
+        jobs = jobs.filter(requested_by=request.user)
+    return get_object_or_404(jobs, pk=pk)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def prediction_job_detail(request, pk):
+    """
+    Status and progress of a prediction job
+    """
+    job = get_job_for_user(request, pk)
+    return Response(PredictionRunSerializer(job).data)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def cancel_prediction_job(request, pk):
+    """
+    Cancel a queued job, or stop a running one at its next progress update
+    """
+    job = get_job_for_user(request, pk)
+    if job.status not in ('queued', 'running'):
+        return Response({'error': f'Job already {job.status}'}, status=status.HTTP_409_CONFLICT)
+    
+    job = cancel_job(job)
+    return Response(PredictionRunSerializer(job).data)
+
+def stream_predictions(predictions):
+    encoder = JSONEncoder()
+    for prediction in predictions.iterator(chunk_size=500):
+        yield encoder.encode(ShortagePredictionSerializer(prediction).data) + "\n"
+
+class PredictionJobResultsView(generics.ListAPIView):
+    """
+    Predictions saved by a job: paginated JSON, or newline-delimited JSON
+    streamed row by row with ?stream=ndjson
+    """
+    serializer_class = ShortagePredictionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return ShortagePrediction.objects.filter(run=self.job).select_related('medical_item').order_by('id')
+    
+    def list(self, request, *args, **kwargs):
+        self.job = get_job_for_user(request, kwargs['pk'])
+        if self.job.status in ('queued', 'running'):
+            return Response(
+                {'error': f'Job is {self.job.status}', 'progress': self.job.progress},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        if request.query_params.get('stream') == 'ndjson':
+            return StreamingHttpResponse(
+                stream_predictions(self.get_queryset()),
+                content_type='application/x-ndjson'
+            )
+        return super().list(request, *args, **kwargs)
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_critical_shortages(request):
@@ -155,33 +262,34 @@ def get_critical_shortages(request):
 @permission_classes([permissions.IsAuthenticated])
 def bulk_upload_demand_data(request):
     """
-    Bulk upload demand data
+    Bulk upload demand data as JSON ({"demand_data": [...]}), or as a CSV
+    (text/csv) or NDJSON (application/x-ndjson) body read as a stream.
+    ?policy=replace (default) or sum decides what happens to rows whose
+    medical item, region and period_start already exist.
     """
-    serializer = BulkDemandDataSerializer(data=request.data)
-    
-    if serializer.is_valid():
-        demand_data_list = serializer.validated_data['demand_data']
-        created_count = 0
-        errors = []
-        
-        for demand_data in demand_data_list:
-            try:
-                serializer_instance = DemandDataSerializer(data=demand_data)
-                if serializer_instance.is_valid():
-                    serializer_instance.save()
-                    created_count += 1
-                else:
-                    errors.append(serializer_instance.errors)
-            except Exception as e:
-                errors.append(str(e))
-        
-        return Response({
-            'message': f'Successfully created {created_count} demand records',
-            'errors': errors,
-            'total_processed': len(demand_data_list)
-        })
-    
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    policy = request.query_params.get('policy', 'replace')
+    if policy not in DUPLICATE_POLICIES:
+        return Response(
+            {'policy': [f"Must be one of: {', '.join(DUPLICATE_POLICIES)}"]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    content_type = request.content_type.split(';')[0].strip()
+    if content_type in STREAMED_DEMAND_FORMATS:
+        records = STREAMED_DEMAND_FORMATS[content_type](request.stream or [])
+    else:
+        records = request.data.get('demand_data') if isinstance(request.data, dict) else None
+        if not isinstance(records, list):
+            return Response({'demand_data': ['Expected a list of demand records.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    ingestor = DemandIngestor(policy)
+    stats = ingestor.ingest(records)
+    return Response({
+        'message': f"Successfully created {stats['created']} and updated {stats['updated']} demand records",
+        'policy': policy,
+        'errors': ingestor.errors,
+        **stats
+    })
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -231,11 +339,16 @@ def prediction_stats(request):
         sent_at__gte=timezone.now() - timedelta(days=7)
     ).count()
     
+    # Accuracy measured by the latest backtest of the default config's model
+    config = MCPPredictionEngine.get_config()
+    backtest = config.backtests.filter(model_version=config_model_version(config)).first()
+    
     return Response({
         'total_predictions': total_predictions,
         'active_predictions': active_predictions,
         'critical_predictions': critical_predictions,
         'high_predictions': high_predictions,
         'recent_alerts': recent_alerts,
-        'prediction_accuracy': '85%'  # This would come from historical data analysis
+        'prediction_accuracy': f"{backtest.accuracy:.0%}" if backtest and backtest.accuracy is not None else None,
+        'backtest': BacktestResultSerializer(backtest).data if backtest else None
     })
\ No newline at end of file
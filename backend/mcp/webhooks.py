@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import timedelta
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db.models import Exists, OuterRef, F, Q
+from django.utils import timezone
+from .models import PredictionAlert, WebhookSubscription, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-MedVault-Signature'
+TIMESTAMP_HEADER = 'X-MedVault-Timestamp'
+
+AUDIENCE_FLAGS = {
+    'vendor': 'notify_vendors',
+    'health_authority': 'notify_health_authorities',
+}
+
+def sign_payload(secret, timestamp, body):
+    """
+    HMAC-SHA256 over "<timestamp>.<body>". Receivers recompute it with the
+    shared secret and reject stale timestamps to prevent replays.
+    """
+    message = f"{timestamp}.".encode() + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+def verify_signature(secret, timestamp, body, signature, tolerance_seconds=300):
+    if abs(time.time() - int(timestamp)) > tolerance_seconds:
+        return False
+    return hmac.compare_digest(sign_payload(secret, timestamp, body), signature)
+
+def alert_payload(alert):
+    """
+    An alert is sent again each time it coalesces or escalates; receivers
+    keep the copy with the highest occurrence_count
+    """
+    prediction = alert.prediction
+    return {
+        'id': alert.id,
+        'alert_type': alert.alert_type,
+        'message': alert.message,
+        'recommended_actions': alert.recommended_actions,
+        'occurrence_count': alert.occurrence_count,
+        'created_at': alert.sent_at.isoformat(),
+        'last_occurred_at': (alert.last_occurred_at or alert.sent_at).isoformat(),
+        'prediction': {
+            'id': prediction.id,
+            'medical_item': prediction.medical_item.name,
+            'medical_item_id': prediction.medical_item_id,
+            'region': prediction.region,
+            'severity_level': prediction.severity_level,
+            'confidence_score': prediction.confidence_score,
+            'predicted_shortage_date': prediction.predicted_shortage_date.isoformat(),
+        },
+    }
+
+def is_current(alert, delivered_at):
+    """
+    Whether a delivery at delivered_at carried the alert's latest occurrence
+    """
+    return alert.last_occurred_at is None or delivered_at >= alert.last_occurred_at
+
+def backoff_seconds(consecutive_failures):
+    """
+    Exponential backoff per endpoint, capped
+    """
+    delay = settings.WEBHOOK_BACKOFF_BASE_SECONDS * 2 ** max(consecutive_failures - 1, 0)
+    return min(delay, settings.WEBHOOK_BACKOFF_MAX_SECONDS)
+
+class WebhookDispatcher:
+    """
+    Delivers undelivered prediction alerts to webhook subscriptions.
+
+    Database work runs synchronously before and after the network phase.
+    The network phase posts to all due endpoints concurrently over one pooled
+    httpx.AsyncClient, with batches sent in order per endpoint. An endpoint's
+    first failure stops its remaining batches and schedules a backoff.
+    """
+    def __init__(self, batch_size=None, timeout=None, max_connections=None):
+        self.batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+        self.timeout = timeout or settings.WEBHOOK_TIMEOUT_SECONDS
+        self.max_connections = max_connections or settings.WEBHOOK_MAX_CONNECTIONS
+
+    def pending_alerts(self, subscription):
+        """
+        Alerts for the subscription's audience and regions, raised since it
+        was created, that it has not received since they last occurred
+        """
+        delivered = WebhookDelivery.objects.filter(subscription=subscription, alert=OuterRef('pk'), status='delivered')
+        alerts = PredictionAlert.objects.filter(
+            **{AUDIENCE_FLAGS[subscription.audience]: True},
+            sent_at__gte=subscription.created_at
+        ).exclude(
+            Q(Exists(delivered), last_occurred_at__isnull=True)
+            | Exists(delivered.filter(delivered_at__gte=OuterRef('last_occurred_at')))
+        )
+        if subscription.regions:
+            alerts = alerts.filter(prediction__region__in=subscription.regions)
+        return list(alerts.select_related('prediction__medical_item').order_by('id'))
+
+    def collect(self, now):
+        """
+        [(subscription, [[alert, ...], ...])] for every endpoint that is due
+        """
+        subscriptions = WebhookSubscription.objects.filter(is_active=True).exclude(next_attempt_at__gt=now)
+        work = []
+        for subscription in subscriptions:
+            alerts = self.pending_alerts(subscription)
+            if alerts:
+                batches = [alerts[i:i + self.batch_size] for i in range(0, len(alerts), self.batch_size)]
+                work.append((subscription, batches))
+        return work
+
+    def encode(self, subscription, alerts):
+        body = json.dumps({
+            'subscription': subscription.id,
+            'audience': subscription.audience,
+            'alerts': [alert_payload(alert) for alert in alerts],
+        }).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign_payload(subscription.secret, timestamp, body),
+        }
+        return body, headers
+
+    async def post_batches(self, client, subscription, requests):
+        """
+        Post an endpoint's batches in order. Returns [(alert ids, error)] for
+        the batches attempted; error is None on success.
+        """
+        results = []
+        for alert_ids, body, headers in requests:
+            try:
+                response = await client.post(subscription.url, content=body, headers=headers)
+                error = None if response.is_success else f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            results.append((alert_ids, error))
+            if error:
+                break
+        return results
+
+    async def send(self, work):
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout) as client:
+            return await asyncio.gather(*[
+                self.post_batches(client, subscription, requests) for subscription, requests in work
+            ])
+
+    def record(self, subscription, results, now):
+        delivered_ids, failed_ids, error = [], [], None
+        for alert_ids, batch_error in results:
+            if batch_error:
+                failed_ids, error = alert_ids, batch_error
+            else:
+                delivered_ids.extend(alert_ids)
+
+        if delivered_ids:
+            WebhookDelivery.objects.bulk_create(
+                [WebhookDelivery(subscription=subscription, alert_id=alert_id, status='delivered', delivered_at=now)
+                 for alert_id in delivered_ids],
+                update_conflicts=True,
+                unique_fields=['subscription', 'alert'],
+                update_fields=['status', 'delivered_at', 'last_error', 'updated_at']
+            )
+        if failed_ids:
+            WebhookDelivery.objects.bulk_create(
+                [WebhookDelivery(subscription=subscription, alert_id=alert_id, status='failed', last_error=error)
+                 for alert_id in failed_ids],
+                update_conflicts=True,
+                unique_fields=['subscription', 'alert'],
+                update_fields=['status', 'last_error', 'updated_at']
+            )
+            PredictionAlert.objects.filter(id__in=failed_ids).update(last_delivery_error=error)
+
+        if error:
+            subscription.consecutive_failures += 1
+            subscription.next_attempt_at = now + timedelta(seconds=backoff_seconds(subscription.consecutive_failures))
+            subscription.last_error = error
+            logger.warning(
+                f"Webhook {subscription.name} failed ({error}); "
+                f"retrying after {subscription.next_attempt_at}"
+            )
+        else:
+            subscription.consecutive_failures = 0
+            subscription.next_attempt_at = None
+            subscription.last_success_at = now
+        subscription.save(update_fields=['consecutive_failures', 'next_attempt_at', 'last_error', 'last_success_at'])
+
+        return delivered_ids, failed_ids
+
+    def mark_sent(self, alert_ids, now):
+        """
+        Set is_sent and delivered_at on alerts every matching active
+        subscription has received since they last occurred
+        """
+        alerts = PredictionAlert.objects.filter(id__in=alert_ids).select_related('prediction')
+        subscriptions = list(WebhookSubscription.objects.filter(is_active=True))
+        delivered = {
+            (alert_id, subscription_id): delivered_at
+            for alert_id, subscription_id, delivered_at in WebhookDelivery.objects.filter(
+                alert_id__in=alert_ids, status='delivered'
+            ).values_list('alert_id', 'subscription_id', 'delivered_at')
+        }
+
+        sent_ids = [
+            alert.id for alert in alerts
+            if all(
+                (alert.id, subscription.id) in delivered
+                and is_current(alert, delivered[alert.id, subscription.id])
+                for subscription in subscriptions
+                if getattr(alert, AUDIENCE_FLAGS[subscription.audience])
+                and (not subscription.regions or alert.prediction.region in subscription.regions)
+                and alert.sent_at >= subscription.created_at
+            )
+        ]
+        PredictionAlert.objects.filter(id__in=sent_ids).update(
+            is_sent=True, delivered_at=now, last_delivery_error=None
+        )
+        return sent_ids
+
+    def dispatch(self):
+        """
+        Deliver everything due. Returns counts of alerts delivered and failed
+        and the endpoints attempted.
+        """
+        now = timezone.now()
+        work = self.collect(now)
+        if not work:
+            return {'endpoints': 0, 'delivered': 0, 'failed': 0}
+
+        requests = [
+            (subscription, [(
+                [alert.id for alert in batch], *self.encode(subscription, batch)
+            ) for batch in batches])
+            for subscription, batches in work
+        ]
+        attempted_ids = {alert.id for _, batches in work for batch in batches for alert in batch}
+        PredictionAlert.objects.filter(id__in=attempted_ids).update(delivery_attempts=F('delivery_attempts') + 1)
+
+        results = async_to_sync(self.send)(requests)
+
+        delivered, failed = 0, 0
+        touched = set()
+        for (subscription, _), subscription_results in zip(work, results):
+            delivered_ids, failed_ids = self.record(subscription, subscription_results, now)
+            delivered += len(delivered_ids)
+            failed += len(failed_ids)
+            touched.update(delivered_ids)
+
+        self.mark_sent(touched, now)
+        logger.info(f"Webhooks: {delivered} alert deliveries, {failed} failed across {len(work)} endpoints")
+        return {'endpoints': len(work), 'delivered': delivered, 'failed': failed}
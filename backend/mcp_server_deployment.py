@@ -209,11 +209,8 @@ async def analyze_demand_trends(
             days_back=days_back
         )
 
-        # Get recent demand data
-        recent_demand = DemandData.objects.filter(
-            medical_item=medical_item,
-            region=region
-        ).order_by('-period_end')[:10]
+        # Recent demand at the grain the analysis read (daily rows, or weekly/monthly rollups)
+        grain, recent_demand = engine.recent_demand(medical_item, region, days_back=days_back)
 
         response = f"""
 **Demand Trend Analysis**
@@ -226,11 +223,11 @@ async def analyze_demand_trends(
 - Average Daily Demand: {avg_demand:.1f} units
 - Demand Trend: {'INCREASING' if trend > 0 else 'DECREASING'} ({trend:.2f} units/day)
 
-**Recent Demand Data:**
+**Recent Demand Data:**{'' if grain == 'day' else f' ({grain}ly totals)'}
         """
 
-        for demand in recent_demand:
-            response += f"\n- {demand.period_end.date()}: {demand.demand_count} units"
+        for period, demand_count in recent_demand:
+            response += f"\n- {period}: {demand_count} units"
 
         # Add insights
         if trend > 5:
@@ -355,6 +352,7 @@ async def generate_shortage_alert(
 
 **Alert Details:**
 - ID: {alert.id}
+- Occurrences in window: {alert.occurrence_count}
 - Type: {alert.alert_type}
 - Item: {medical_item.name}
 - Region: {region}
@@ -371,7 +369,7 @@ async def generate_shortage_alert(
 - Health Authorities: {'Yes' if alert.notify_health_authorities else 'No'}
 - Public: {'Yes' if alert.notify_public else 'No'}
 
-**Status:** Alert created and ready for sending
+**Status:** {'Alert created and ready for sending' if alert.occurrence_count == 1 else 'Repeat folded into existing alert'}
         """
 
         return response.strip()
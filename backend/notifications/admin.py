@@ -6,8 +6,8 @@ from .models import (
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'notification_type', 'priority', 'is_sent', 'created_at')
-    list_filter = ('notification_type', 'priority', 'is_sent', 'created_at')
+    list_display = ('title', 'notification_type', 'priority', 'delivery_mode', 'is_sent', 'created_at')
+    list_filter = ('notification_type', 'priority', 'delivery_mode', 'is_sent', 'created_at')
     search_fields = ('title', 'message')
     readonly_fields = ('sent_at',)
 
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+
+PRIORITY_RANK = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+
+def coalesce_key(notification_type, medical_item_id, regions):
+    """
+    Key identifying repeats of the same alert: (type, medical item, region)
+    """
+    region = ','.join(sorted(regions)) if isinstance(regions, (list, tuple, set)) else (regions or '')
+    return f"{notification_type}:{medical_item_id or ''}:{region.lower()}"
+
+def window_start():
+    """
+    Earliest creation time of an alert that repeats may still be folded into
+    """
+    return timezone.now() - timedelta(minutes=settings.NOTIFICATION_COALESCE_WINDOW_MINUTES)
+
+def is_escalation(old_priority, new_priority):
+    return PRIORITY_RANK.get(new_priority, 0) > PRIORITY_RANK.get(old_priority, 0)
@@ -0,0 +1,54 @@
+import random
+import threading
+import time
+
+class FakeGateway:
+    """
+    Local stand-in for a push/SMS/email provider, used for load testing.
+    Each send sleeps for the configured latency (plus jitter) and fails with
+    the configured probability. Completion times are recorded so callers can
+    compute time-to-deliver.
+    """
+    def __init__(self, channel, latency_ms=0, jitter_ms=0, failure_rate=0.0, seed=None):
+        self.channel = channel
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.sent = 0
+            self.failed = 0
+            self.delivered_at = []
+
+    def send(self, address, content):
+        with self.lock:
+            delay = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+            failed = self.random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay / 1000)
+        with self.lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.sent += 1
+                self.delivered_at.append(time.monotonic())
+        return not failed
+
+# channel -> gateway; channels without a gateway keep the logging placeholders
+gateways = {}
+
+def install_fake_gateways(latency_ms=0, jitter_ms=0, failure_rate=0.0, seed=None,
+                          channels=('push', 'sms', 'email')):
+    for channel in channels:
+        gateways[channel] = FakeGateway(channel, latency_ms, jitter_ms, failure_rate, seed)
+    return gateways
+
+def uninstall_gateways():
+    gateways.clear()
+
+def get_gateway(channel):
+    return gateways.get(channel)
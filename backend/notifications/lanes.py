@@ -0,0 +1,333 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Highest priority first
+LANES = ('critical', 'high', 'normal', 'bulk')
+
+PRIORITY_LANES = {
+    'critical': 'critical',
+    'high': 'high',
+    'medium': 'normal',
+    'low': 'bulk',
+}
+
+URGENCY_LANES = {
+    'life_threatening': 'critical',
+    'critical': 'critical',
+    'warning': 'high',
+    'info': 'normal',
+}
+
+def lane_for(notification, broadcast=None):
+    """
+    Pick the delivery lane from the broadcast urgency level, or from the
+    notification priority for everything else
+    """
+    if broadcast is not None:
+        return URGENCY_LANES.get(broadcast.urgency_level, 'critical')
+    return PRIORITY_LANES.get(notification.priority, 'normal')
+
+def id_chunks(queryset, chunk_size):
+    """
+    Yield the queryset's ids in ascending chunks using keyset pagination, so
+    a job never holds its whole audience in memory
+    """
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        chunk = list(ids.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+class LatencyStats:
+    """
+    Rolling window of latency samples in seconds
+    """
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def summary(self):
+        if not self.samples:
+            return {'count': 0, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        ordered = sorted(self.samples)
+        def percentile(fraction):
+            return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+        return {
+            'count': len(ordered),
+            'p50_ms': percentile(0.50),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(ordered[-1] * 1000, 2),
+        }
+
+class DeliveryJob:
+    """
+    One notification's fan-out. Workers pull chunks of recipient ids from
+    the job one at a time, so a job can be interrupted between any two chunks.
+    """
+    def __init__(self, lane, chunks, handler, on_complete=None, label=''):
+        self.lane = lane
+        self.chunks = iter(chunks)
+        self.handler = handler
+        self.on_complete = on_complete
+        self.label = label
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.active = 0
+        self.exhausted = False
+        self.completed = False
+        self.lock = threading.Lock()
+
+    def next_chunk(self):
+        with self.lock:
+            if self.exhausted:
+                return None
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self.exhausted = True
+                return None
+            except Exception as e:
+                logger.error(f"Error reading recipients for {self.label}: {str(e)}")
+                self.exhausted = True
+                return None
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            self.active += 1
+            return chunk
+
+    def chunk_done(self):
+        """Returns True for exactly one caller once the whole job has finished"""
+        with self.lock:
+            self.active -= 1
+            return self.finish_if_idle()
+
+    def finish_if_idle(self):
+        if self.exhausted and self.active == 0 and not self.completed:
+            self.completed = True
+            return True
+        return False
+
+class DeliveryDispatcher:
+    """
+    Priority lanes for notification delivery.
+
+    Shared workers always take the next chunk from the highest non-empty lane,
+    so a running bulk job is preempted at its next chunk boundary as soon as
+    critical work arrives. Reserved workers serve only the critical lane and
+    stay free for it while bulk jobs are running.
+
+    With workers=0, jobs run inline in the caller (the default, and what the
+    test suite uses). At least one worker always serves every lane, so
+    reserved workers are capped at workers - 1.
+    """
+    def __init__(self, workers=0, reserved_critical_workers=0):
+        self.workers = workers
+        self.reserved_critical_workers = min(reserved_critical_workers, max(workers - 1, 0))
+        if self.reserved_critical_workers < reserved_critical_workers and workers > 0:
+            logger.warning(
+                f"Reserving {self.reserved_critical_workers} of {workers} delivery workers for the critical lane "
+                f"instead of {reserved_critical_workers}, so the other lanes keep a worker"
+            )
+        self.queues = {lane: deque() for lane in LANES}
+        self.wait_latency = {lane: LatencyStats() for lane in LANES}
+        self.total_latency = {lane: LatencyStats() for lane in LANES}
+        self.condition = threading.Condition()
+        self.threads = []
+        self.stopping = False
+        self.pending_jobs = set()
+        # connection.execute_wrapper hooks applied to the worker threads' queries
+        self.execute_wrappers = []
+
+    def submit(self, lane, chunks, handler, on_complete=None, label=''):
+        """
+        Queue a job. Threaded dispatch waits for the surrounding transaction to
+        commit so workers see the notification and its audience.
+        """
+        job = DeliveryJob(lane, chunks, handler, on_complete, label)
+        if self.workers <= 0:
+            self.run_inline(job)
+        else:
+            transaction.on_commit(lambda: self.enqueue(job))
+        return job
+
+    def run_inline(self, job):
+        while True:
+            chunk = job.next_chunk()
+            if chunk is None:
+                break
+            self.run_chunk(job, chunk)
+            job.active -= 1
+        job.completed = True
+        self.finish(job)
+
+    def enqueue(self, job):
+        self.start()
+        with self.condition:
+            self.queues[job.lane].append(job)
+            self.pending_jobs.add(job)
+            self.condition.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until every queued job has finished. Returns False on timeout.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending_jobs, timeout)
+
+    @contextmanager
+    def execute_wrapper(self, wrapper):
+        """
+        Install a database execute wrapper, as connection.execute_wrapper
+        does, on the worker threads' connections for the duration of the block
+        """
+        self.execute_wrappers.append(wrapper)
+        try:
+            yield
+        finally:
+            self.execute_wrappers.remove(wrapper)
+
+    def wrapped_connection(self):
+        stack = ExitStack()
+        for wrapper in list(self.execute_wrappers):
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        return stack
+
+    def start(self):
+        with self.condition:
+            if self.threads:
+                return
+            self.stopping = False
+            for index in range(self.workers):
+                lanes = ('critical',) if index < self.reserved_critical_workers else LANES
+                thread = threading.Thread(
+                    target=self.work, args=(lanes,), name=f'notification-lane-{index}', daemon=True
+                )
+                self.threads.append(thread)
+                thread.start()
+
+    def stop(self, timeout=None):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def next_task(self, lanes):
+        """
+        Block until a chunk is available in one of the lanes, highest first.
+        Chunks are read outside the dispatcher lock.
+        """
+        while True:
+            with self.condition:
+                job = None
+                while job is None:
+                    if self.stopping:
+                        return None, None
+                    for lane in lanes:
+                        if self.queues[lane]:
+                            job = self.queues[lane][0]
+                            break
+                    else:
+                        self.condition.wait()
+
+            chunk = job.next_chunk()
+            if chunk is not None:
+                return job, chunk
+
+            # No chunks left; whichever chunk finishes last completes the job
+            with self.condition:
+                queue = self.queues[job.lane]
+                if queue and queue[0] is job:
+                    queue.popleft()
+            with job.lock:
+                finished = job.finish_if_idle()
+            if finished:
+                with self.wrapped_connection():
+                    self.finish(job)
+
+    def work(self, lanes):
+        try:
+            while True:
+                job, chunk = self.next_task(lanes)
+                if job is None:
+                    return
+                close_old_connections()
+                with self.wrapped_connection():
+                    self.run_chunk(job, chunk)
+                    if job.chunk_done():
+                        self.finish(job)
+        finally:
+            connections.close_all()
+
+    def run_chunk(self, job, chunk):
+        try:
+            job.handler(chunk)
+        except Exception as e:
+            logger.error(f"Error delivering chunk of {job.label}: {str(e)}")
+
+    def finish(self, job):
+        now = time.monotonic()
+        self.wait_latency[job.lane].record((job.started_at or now) - job.enqueued_at)
+        self.total_latency[job.lane].record(now - job.enqueued_at)
+        if job.on_complete is not None:
+            try:
+                job.on_complete()
+            except Exception as e:
+                logger.error(f"Error completing {job.label}: {str(e)}")
+        with self.condition:
+            self.pending_jobs.discard(job)
+            self.condition.notify_all()
+
+    def metrics(self):
+        """
+        Per-lane backlog and latency (enqueue to first chunk, enqueue to done)
+        """
+        with self.condition:
+            queued = {lane: len(queue) for lane, queue in self.queues.items()}
+        return {
+            lane: {
+                'queued_jobs': queued[lane],
+                'wait': self.wait_latency[lane].summary(),
+                'total': self.total_latency[lane].summary(),
+            }
+            for lane in LANES
+        }
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    """
+    Process-wide dispatcher configured from settings
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = DeliveryDispatcher(
+                workers=settings.NOTIFICATION_DELIVERY_WORKERS,
+                reserved_critical_workers=settings.NOTIFICATION_CRITICAL_WORKERS
+            )
+        return _dispatcher
+
+def set_dispatcher(dispatcher):
+    """
+    Replace the process-wide dispatcher, e.g. with a differently sized one
+    for a load test. Returns the one it replaced.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        previous, _dispatcher = _dispatcher, dispatcher
+        return previous
@@ -0,0 +1,210 @@
+import threading
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from .models import (
+    Notification, NotificationRecipient, EmergencyBroadcast, UserNotificationPreference,
+    DeviceToken, UserNotificationCounter, AudienceSegmentMember
+)
+from .services import NotificationService, EmergencyBroadcastService
+from .gateways import gateways
+from .lanes import DeliveryDispatcher, get_dispatcher, set_dispatcher
+from .throttling import throttle
+
+User = get_user_model()
+
+LOAD_USER_PREFIX = 'loadtest'
+SCENARIOS = ('broadcast', 'bulk', 'critical_during_bulk')
+# Load users in the small region receiving critical sends during a bulk job
+CRITICAL_AUDIENCE = 10
+
+class QueryCounter:
+    """
+    connection.execute_wrapper hook counting statements without keeping them
+    (CaptureQueriesContext stops at 9000 queries). Safe to install on the
+    delivery workers' connections as well as the caller's.
+    """
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+def load_users(region):
+    return User.objects.filter(username__startswith=f'{LOAD_USER_PREFIX}-{region}-', city=region)
+
+def generate_users(count, region, batch_size=5000):
+    """
+    Create load-test patients in a region with preferences, a device token,
+    counters and segment memberships, using bulk inserts (signals are not
+    sent). Existing load users in the region are kept. Returns the number
+    created.
+    """
+    existing = load_users(region).count()
+    password = make_password(None)
+    created = 0
+
+    for start in range(existing, count, batch_size):
+        indexes = range(start, min(start + batch_size, count))
+        users = User.objects.bulk_create([
+            User(
+                username=f'{LOAD_USER_PREFIX}-{region}-{index}',
+                email=f'{LOAD_USER_PREFIX}-{index}@{region.lower()}.example.com',
+                phone_number=f'+234{index:011d}'[:15],
+                user_type='patient',
+                city=region,
+                password=password
+            )
+            for index in indexes
+        ])
+        if any(user.pk is None for user in users):
+            users = list(load_users(region).filter(username__in=[user.username for user in users]))
+
+        UserNotificationPreference.objects.bulk_create([
+            UserNotificationPreference(user=user, digest_frequency='off') for user in users
+        ])
+        DeviceToken.objects.bulk_create([
+            DeviceToken(user=user, token=f'{user.username}-token', device_type='android') for user in users
+        ])
+        UserNotificationCounter.objects.bulk_create([UserNotificationCounter(user=user) for user in users])
+        AudienceSegmentMember.objects.bulk_create([
+            AudienceSegmentMember(user=user, user_type='patient', region=region) for user in users
+        ])
+        created += len(users)
+
+    return created
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def send_bulk(region):
+    return NotificationService.create_notification({
+        'title': f'Load test {region}',
+        'message': 'Load test bulk notification',
+        'notification_type': 'system_alert',
+        'priority': 'low',
+        'target_regions': [region],
+    })
+
+def send_broadcast(region):
+    broadcast = EmergencyBroadcast.objects.create(
+        title=f'Load test {region}',
+        message='Load test broadcast',
+        emergency_type='health_advisory',
+        urgency_level='critical',
+        regions=[region],
+        expires_at=timezone.now() + timedelta(hours=1)
+    )
+    EmergencyBroadcastService.activate_broadcast(broadcast)
+    return Notification.objects.filter(related_broadcast=broadcast).first()
+
+def send_critical_during_bulk(dispatcher, region, critical_region, sends, interval):
+    """
+    Start a bulk notification to the region, then send critical
+    notifications to the (small) critical region every `interval` seconds
+    while the bulk job runs
+    """
+    notification = send_bulk(region)
+    for index in range(sends):
+        if index and dispatcher.metrics()['bulk']['total']['count']:
+            break  # The bulk job finished; later sends would not overlap it
+        NotificationService.create_notification({
+            'title': f'Load test critical {index}',
+            'message': 'Load test critical notification',
+            'notification_type': 'system_alert',
+            'priority': 'critical',
+            'target_regions': [critical_region],
+        })
+        time.sleep(interval)
+    return notification
+
+def run_benchmark(scenario, region, fanout_on_read=False, workers=None, critical_workers=0,
+                  critical_sends=20, critical_interval=0.5, timeout=None):
+    """
+    Deliver one emergency broadcast ('broadcast') or regional bulk
+    notification ('bulk') to every load user in the region, or send
+    critical notifications to a small region while a bulk notification to
+    the region is delivered ('critical_during_bulk'), and measure it until
+    the dispatcher has finished. Queries are counted on the caller's and the
+    delivery workers' connections.
+
+    `workers` delivers on a dispatcher with that many threads (and
+    `critical_workers` of them reserved for the critical lane) instead of
+    the process dispatcher; critical_during_bulk needs at least one.
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    if scenario == 'critical_during_bulk' and not workers:
+        raise ValueError("critical_during_bulk needs delivery workers")
+
+    audience = load_users(region).count()
+    critical_region = f'{region}Critical'
+    if scenario == 'critical_during_bulk':
+        generate_users(CRITICAL_AUDIENCE, critical_region)
+    throttle.clear()
+    for gateway in gateways.values():
+        gateway.reset()
+
+    previous = None
+    if workers is not None:
+        previous = set_dispatcher(DeliveryDispatcher(workers=workers, reserved_critical_workers=critical_workers))
+    dispatcher = get_dispatcher()
+
+    threshold = audience + 1 if not fanout_on_read else 0
+    queries = QueryCounter()
+    try:
+        with override_settings(NOTIFICATION_FANOUT_ON_READ_THRESHOLD=threshold), \
+                connection.execute_wrapper(queries), dispatcher.execute_wrapper(queries):
+            started = time.monotonic()
+            if scenario == 'broadcast':
+                notification = send_broadcast(region)
+            elif scenario == 'bulk':
+                notification = send_bulk(region)
+            else:
+                notification = send_critical_during_bulk(
+                    dispatcher, region, critical_region, critical_sends, critical_interval
+                )
+            submitted = time.monotonic() - started
+            finished = dispatcher.wait_idle(timeout)
+            elapsed = time.monotonic() - started
+        metrics = dispatcher.metrics()
+    finally:
+        if workers is not None:
+            set_dispatcher(previous)
+            dispatcher.stop(timeout=timeout)
+
+    delivered = NotificationRecipient.objects.filter(notification=notification).count()
+    latencies = [
+        delivered_at - started
+        for gateway in gateways.values()
+        for delivered_at in gateway.delivered_at
+    ]
+    p99 = percentile(latencies, 0.99)
+
+    result = {
+        'scenario': scenario,
+        'audience': audience,
+        'recipients': delivered,
+        'finished': finished,
+        'submit_seconds': round(submitted, 3),
+        'seconds': round(elapsed, 3),
+        'recipients_per_second': round(delivered / elapsed, 1) if elapsed else None,
+        'p99_time_to_deliver_ms': round(p99 * 1000, 1) if p99 is not None else None,
+        'queries': queries.count,
+        'queries_per_recipient': round(queries.count / delivered, 2) if delivered else None,
+        'gateway_failures': sum(gateway.failed for gateway in gateways.values()),
+    }
+    if scenario == 'critical_during_bulk':
+        # Enqueue to done for each critical send, while the bulk job ran
+        result['critical_latency'] = metrics['critical']['total']
+    return result
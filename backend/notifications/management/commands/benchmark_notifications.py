@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from notifications.gateways import install_fake_gateways, uninstall_gateways
+from notifications.loadtest import SCENARIOS, generate_users, run_benchmark
+
+class Command(BaseCommand):
+    help = (
+        'Measure notification fan-out against fake gateways until delivery finishes: recipients per second, '
+        'p99 time-to-deliver, query counts across delivery workers, and critical-send latency during a '
+        'bulk job (critical_during_bulk, needs --workers). Use a disposable database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=['broadcast', 'bulk'])
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Delivery worker threads (default NOTIFICATION_DELIVERY_WORKERS)')
+        parser.add_argument('--critical-workers', type=int, default=0)
+        parser.add_argument('--critical-sends', type=int, default=20)
+        parser.add_argument('--critical-interval', type=float, default=0.5, help='Seconds between critical sends')
+        parser.add_argument('--latency-ms', type=float, default=0)
+        parser.add_argument('--jitter-ms', type=float, default=0)
+        parser.add_argument('--failure-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--fanout-on-read', action='store_true',
+                            help='Let large audiences use segment delivery instead of direct fan-out')
+
+    def handle(self, *args, **options):
+        install_fake_gateways(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            failure_rate=options['failure_rate'],
+            seed=options['seed']
+        )
+        try:
+            for size in options['sizes']:
+                region = f'LoadTest{size}'
+                created = generate_users(size, region)
+                if created:
+                    self.stdout.write(f'Generated {created} users in {region}')
+
+                for scenario in options['scenarios']:
+                    result = run_benchmark(
+                        scenario, region,
+                        fanout_on_read=options['fanout_on_read'],
+                        workers=options['workers'],
+                        critical_workers=options['critical_workers'],
+                        critical_sends=options['critical_sends'],
+                        critical_interval=options['critical_interval']
+                    )
+                    self.stdout.write(
+                        f"{scenario:>20} {size:>8}: {result['recipients']} recipients in {result['seconds']}s "
+                        f"(submitted in {result['submit_seconds']}s), "
+                        f"{result['recipients_per_second']} recipients/s, "
+                        f"p99 time-to-deliver {result['p99_time_to_deliver_ms']} ms, "
+                        f"{result['queries']} queries ({result['queries_per_recipient']}/recipient), "
+                        f"{result['gateway_failures']} gateway failures"
+                    )
+                    if 'critical_latency' in result:
+                        latency = result['critical_latency']
+                        self.stdout.write(
+                            f"{'':>20} {latency['count']} critical sends during the bulk job: "
+                            f"p50 {latency['p50_ms']} ms, p99 {latency['p99_ms']} ms, max {latency['max_ms']} ms"
+                        )
+        finally:
+            uninstall_gateways()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from notifications.services import DigestService
+
+class Command(BaseCommand):
+    help = 'Send pending notification digests (schedule hourly and daily runs, e.g. with cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frequency', choices=['hourly', 'daily'], default='hourly')
+
+    def handle(self, *args, **options):
+        sent = DigestService.flush_digests(options['frequency'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} {options['frequency']} digests"))
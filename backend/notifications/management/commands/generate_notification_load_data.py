@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from notifications.loadtest import generate_users, load_users
+
+class Command(BaseCommand):
+    help = 'Create load-test users with notification preferences and device tokens in a region'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000)
+        parser.add_argument('--region', default='LoadTest')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--delete', action='store_true', help='Delete the region\'s load-test users instead')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            deleted, _ = load_users(options['region']).delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} rows'))
+            return
+
+        created = generate_users(options['count'], options['region'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} users in {options["region"]}'))
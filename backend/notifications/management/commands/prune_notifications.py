@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from notifications.services import NotificationRetentionService
+
+class Command(BaseCommand):
+    help = 'Move expired and old read notification recipients to the archive (run nightly, e.g. with cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--read-retention-days', type=int, default=None)
+
+    def handle(self, *args, **options):
+        archived = NotificationRetentionService.prune(
+            batch_size=options['batch_size'],
+            read_retention_days=options['read_retention_days']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} recipient rows'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from notifications.segments import index_user
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Rebuild (user_type x region) audience segment memberships for all users'
+
+    def handle(self, *args, **options):
+        count = 0
+        for user in User.objects.iterator(chunk_size=1000):
+            index_user(user)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} users'))
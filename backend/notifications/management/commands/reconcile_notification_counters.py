@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from notifications.services import NotificationCounterService
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Recompute per-user notification counters from NotificationRecipient (run periodically, e.g. nightly cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+
+        reconciled = 0
+        batch = []
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                reconciled += NotificationCounterService.reconcile_users(batch)
+                batch = []
+        if batch:
+            reconciled += NotificationCounterService.reconcile_users(batch)
+        # Repairs drift the per-user adjustments cannot see, e.g. deleted users
+        NotificationCounterService.reconcile_totals()
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters for {reconciled} users'))
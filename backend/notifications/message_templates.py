@@ -0,0 +1,163 @@
+import math
+from django.template import Context, Engine
+from inventory.models import Inventory
+from mcp.external_apis import GPSService
+
+DEFAULT_CHANNEL = 'default'
+DEFAULT_LOCALE = 'en'
+CHANNELS = ('push', 'sms', 'email')
+PARTS = ('title', 'message')
+
+# (notification type, channel, locale) -> template source per part. Lookups
+# fall back to the base language, then DEFAULT_LOCALE, and within a locale
+# from the channel to DEFAULT_CHANNEL, one part at a time.
+MESSAGE_TEMPLATES = {
+    ('shortage_alert', 'default', 'en'): {
+        'title': "Shortage Alert: {{ item_name }}",
+        'message': (
+            "Potential shortage predicted in {{ region }}. Severity: {{ severity }}"
+            "{% if nearest_vendor %}. Nearest stock: {{ nearest_vendor }} "
+            "({{ distance_km|floatformat:1 }} km){% endif %}"
+        ),
+    },
+    ('shortage_alert', 'sms', 'en'): {
+        'message': (
+            "{{ item_name }} shortage likely in {{ region }} ({{ severity }})."
+            "{% if nearest_vendor %} Nearest: {{ nearest_vendor }}, {{ distance_km|floatformat:1 }} km{% endif %}"
+        ),
+    },
+    ('emergency_broadcast', 'default', 'en'): {
+        'title': "EMERGENCY: {{ title }}",
+        'message': "{{ message }}",
+    },
+    ('emergency_broadcast', 'sms', 'en'): {
+        'message': "EMERGENCY - {{ title }}: {{ message }}",
+    },
+    ('prediction_alert', 'default', 'en'): {
+        'message': (
+            "Potential {{ item_name }} shortage predicted in {{ region }}. "
+            "Severity: {{ severity }}. Confidence: {{ confidence_percent|floatformat:1 }}%"
+        ),
+    },
+}
+
+class TemplateRegistry:
+    """
+    Message templates compiled on first use and cached per
+    (notification type, channel, locale) for the life of the process
+    """
+    def __init__(self, templates):
+        self.templates = templates
+        self.engine = Engine(autoescape=False)
+        self.compiled = {}
+        self.by_source = {}
+
+    def candidates(self, notification_type, channel, locale):
+        language = locale.split('-')[0]
+        for candidate_locale in dict.fromkeys((locale, language, DEFAULT_LOCALE)):
+            for candidate_channel in dict.fromkeys((channel, DEFAULT_CHANNEL)):
+                yield (notification_type, candidate_channel, candidate_locale)
+
+    def compile(self, source):
+        """Parse each distinct source once, however many keys resolve to it"""
+        if source not in self.by_source:
+            self.by_source[source] = self.engine.from_string(source)
+        return self.by_source[source]
+
+    def get(self, notification_type, channel=DEFAULT_CHANNEL, locale=DEFAULT_LOCALE):
+        """
+        Compiled templates per part, or None when the type has no templates
+        """
+        key = (notification_type, channel, locale)
+        if key in self.compiled:
+            return self.compiled[key]
+
+        compiled = {}
+        for part in PARTS:
+            for candidate in self.candidates(notification_type, channel, locale):
+                source = self.templates.get(candidate, {}).get(part)
+                if source is not None:
+                    compiled[part] = self.compile(source)
+                    break
+
+        self.compiled[key] = compiled or None
+        return self.compiled[key]
+
+    def has_templates(self, notification_type):
+        return self.get(notification_type) is not None
+
+    def render(self, notification_type, context, channel=DEFAULT_CHANNEL, locale=DEFAULT_LOCALE):
+        compiled = self.get(notification_type, channel, locale)
+        if compiled is None:
+            return None
+        context = Context(context, autoescape=False)
+        return {part: template.render(context).strip() for part, template in compiled.items()}
+
+registry = TemplateRegistry(MESSAGE_TEMPLATES)
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance (haversine)
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+def nearest_vendors(medical_item_id, cities):
+    """
+    Nearest vendor with the item in stock for each city, using static city
+    coordinates. One query for the whole batch.
+    """
+    stocked = [
+        (name, float(latitude), float(longitude))
+        for name, latitude, longitude in Inventory.objects.filter(
+            medical_item_id=medical_item_id,
+            is_available=True,
+            current_stock__gt=0,
+            vendor__is_active=True,
+            vendor__latitude__isnull=False,
+            vendor__longitude__isnull=False
+        ).values_list('vendor__business_name', 'vendor__latitude', 'vendor__longitude')
+    ]
+    if not stocked:
+        return {}
+
+    gps = GPSService()
+    result = {}
+    for city in cities:
+        coordinates = gps.get_static_coordinates(city) if city else None
+        if coordinates is None:
+            continue
+        result[city] = min(
+            (distance_km(coordinates['latitude'], coordinates['longitude'], latitude, longitude), name)
+            for name, latitude, longitude in stocked
+        )
+    return result
+
+def render_for_users(notification, users, locales, channels=CHANNELS):
+    """
+    Render a notification for a chunk of users: {user_id: {channel: parts}}.
+    Users sharing a city, locale and channel share one render. Returns {} for
+    notifications not built from a template.
+    """
+    if not notification.template_context or not registry.has_templates(notification.notification_type):
+        return {}
+
+    nearest = {}
+    if notification.related_medical_item_id:
+        nearest = nearest_vendors(notification.related_medical_item_id, {user.city for user in users})
+
+    rendered = {}
+    result = {}
+    for user in users:
+        locale = locales.get(user.id) or DEFAULT_LOCALE
+        result[user.id] = {}
+        for channel in channels:
+            key = (channel, locale, user.city)
+            if key not in rendered:
+                context = dict(notification.template_context)
+                if user.city in nearest:
+                    context['distance_km'], context['nearest_vendor'] = nearest[user.city]
+                rendered[key] = registry.render(notification.notification_type, context, channel, locale)
+            result[user.id][channel] = rendered[key]
+    return result
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_alert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencybroadcast',
+            name='medical_match_mode',
+            field=models.CharField(choices=[('any', 'Any'), ('all', 'All')], default='any', max_length=10),
+        ),
+    ]
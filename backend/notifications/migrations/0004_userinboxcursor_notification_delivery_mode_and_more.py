@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0003_medicalterm_patientmedicalterm'),
+        ('inventory', '0001_initial'),
+        ('mcp', '0001_initial'),
+        ('notifications', '0003_emergencybroadcast_medical_match_mode'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserInboxCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_segment_notification_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='delivery_mode',
+            field=models.CharField(choices=[('direct', 'Direct'), ('segment', 'Segment')], default='direct', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['delivery_mode', 'id'], name='notificatio_deliver_52df33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationrecipient',
+            index=models.Index(fields=['user', '-created_at'], name='notificatio_user_id_b99848_idx'),
+        ),
+        migrations.AddField(
+            model_name='userinboxcursor',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_cursor', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
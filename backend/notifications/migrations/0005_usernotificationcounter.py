@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_userinboxcursor_notification_delivery_mode_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNotificationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_count', models.IntegerField(default=0)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('emergency_count', models.IntegerField(default=0)),
+                ('shortage_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
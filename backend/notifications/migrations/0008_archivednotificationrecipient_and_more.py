@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0007_usernotificationpreference_digest_frequency_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotificationRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('notification_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField(db_index=True)),
+                ('notification_type', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotificationDeliveryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('notification_type', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'notification_type', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_archivednotificationrecipient_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudienceSegmentMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_type', models.CharField(max_length=20)),
+                ('region', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audience_segments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_type', 'region', 'user'], name='notificatio_user_ty_0a73ac_idx'), models.Index(fields=['region', 'user'], name='notificatio_region_772f98_idx')],
+                'unique_together': {('user', 'region')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0009_audiencesegmentmember'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='related_broadcast',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='notifications.emergencybroadcast'),
+        ),
+    ]
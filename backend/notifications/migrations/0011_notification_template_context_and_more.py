@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0010_notification_related_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='template_context',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='usernotificationpreference',
+            name='locale',
+            field=models.CharField(default='en', max_length=10),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations
+
+def backfill_audience_segments(apps, schema_editor):
+    """
+    Index existing users into their (user_type, region) segments, as
+    notifications.segments.index_user does for users saved from now on
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Vendor = apps.get_model('inventory', 'Vendor')
+    AudienceSegmentMember = apps.get_model('notifications', 'AudienceSegmentMember')
+
+    vendor_cities = {}
+    for user_id, city in Vendor.objects.exclude(city__isnull=True).exclude(city='').values_list('user_id', 'city'):
+        vendor_cities.setdefault(user_id, set()).add(city)
+
+    members = []
+    users = User.objects.filter(is_active=True).values_list('id', 'user_type', 'city')
+    for user_id, user_type, city in users.iterator(chunk_size=2000):
+        regions = vendor_cities.get(user_id, set()) | ({city} if city else set())
+        members.extend(
+            AudienceSegmentMember(user_id=user_id, user_type=user_type, region=region) for region in regions
+        )
+        if len(members) >= 2000:
+            AudienceSegmentMember.objects.bulk_create(members, ignore_conflicts=True)
+            members = []
+    AudienceSegmentMember.objects.bulk_create(members, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0011_notification_template_context_and_more'),
+        ('inventory', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_audience_segments, migrations.RunPython.noop),
+    ]
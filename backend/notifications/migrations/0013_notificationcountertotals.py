@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0012_backfill_audience_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounterTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_count', models.BigIntegerField(default=0)),
+                ('unread_count', models.BigIntegerField(default=0)),
+                ('emergency_count', models.BigIntegerField(default=0)),
+                ('shortage_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
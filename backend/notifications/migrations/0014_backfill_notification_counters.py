@@ -0,0 +1,50 @@
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+UNREAD_STATUSES = ('sent', 'delivered')
+COUNTER_FIELDS = ('total_count', 'unread_count', 'emergency_count', 'shortage_count')
+
+def backfill_notification_counters(apps, schema_editor):
+    """
+    Seed UserNotificationCounter rows and the NotificationCounterTotals row
+    from existing NotificationRecipient rows, as
+    reconcile_notification_counters does
+    """
+    NotificationRecipient = apps.get_model('notifications', 'NotificationRecipient')
+    UserNotificationCounter = apps.get_model('notifications', 'UserNotificationCounter')
+    NotificationCounterTotals = apps.get_model('notifications', 'NotificationCounterTotals')
+
+    rows = NotificationRecipient.objects.values('user_id').annotate(
+        total_count=Count('id'),
+        unread_count=Count('id', filter=Q(status__in=UNREAD_STATUSES)),
+        emergency_count=Count('id', filter=Q(notification__notification_type='emergency_broadcast')),
+        shortage_count=Count('id', filter=Q(notification__notification_type='shortage_alert')),
+    ).order_by()
+
+    counters = []
+    for row in rows.iterator(chunk_size=2000):
+        counters.append(UserNotificationCounter(**row))
+        if len(counters) >= 2000:
+            UserNotificationCounter.objects.bulk_create(
+                counters, update_conflicts=True, unique_fields=['user'], update_fields=COUNTER_FIELDS
+            )
+            counters = []
+    UserNotificationCounter.objects.bulk_create(
+        counters, update_conflicts=True, unique_fields=['user'], update_fields=COUNTER_FIELDS
+    )
+
+    totals = UserNotificationCounter.objects.aggregate(**{field: Sum(field) for field in COUNTER_FIELDS})
+    NotificationCounterTotals.objects.update_or_create(
+        pk=1, defaults={field: totals[field] or 0 for field in COUNTER_FIELDS}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0013_notificationcountertotals'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_notification_counters, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,22 @@ from django.utils import timezone
 
 User = get_user_model()
 
+DELIVERY_STATUSES = ('pending', 'sent', 'delivered', 'read', 'failed')
+
+class NotificationQuerySet(models.QuerySet):
+    def with_delivery_stats(self):
+        """
+        Annotate per-status recipient counts (stats_pending, stats_sent, ...)
+        using one conditional aggregation instead of a COUNT per status
+        """
+        return self.annotate(**{
+            f'stats_{status}': models.Count(
+                'notificationrecipient',
+                filter=models.Q(notificationrecipient__status=status)
+            )
+            for status in DELIVERY_STATUSES
+        })
+
 class Notification(models.Model):
     NOTIFICATION_TYPE_CHOICES = (
         ('shortage_alert', 'Shortage Alert'),
@@ -23,6 +39,11 @@ class Notification(models.Model):
         ('critical', 'Critical'),
     )
 
+    DELIVERY_MODE_CHOICES = (
+        ('direct', 'Direct'),    # One NotificationRecipient row per user, written at send time
+        ('segment', 'Segment'),  # Stored once; recipient rows are created when users read their inbox
+    )
+
     # Basic notification fields
     title = models.CharField(max_length=255)
     message = models.TextField()
@@ -38,8 +59,21 @@ class Notification(models.Model):
     related_medical_item = models.ForeignKey('inventory.MedicalItem', on_delete=models.SET_NULL, null=True, blank=True)
     related_prediction = models.ForeignKey('mcp.ShortagePrediction', on_delete=models.SET_NULL, null=True, blank=True)
     related_prescription = models.ForeignKey('ehr.Prescription', on_delete=models.SET_NULL, null=True, blank=True)
+    related_broadcast = models.ForeignKey(
+        'EmergencyBroadcast', on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications'
+    )
+
+    # Variables the title/message were rendered from (see notifications.message_templates),
+    # re-rendered per channel, locale and recipient at delivery time
+    template_context = models.JSONField(default=dict, blank=True)
+
+    # Coalescing of repeated alerts (see notifications.coalescing)
+    coalesce_key = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    occurrence_count = models.IntegerField(default=1)
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
 
     # Delivery control
+    delivery_mode = models.CharField(max_length=20, choices=DELIVERY_MODE_CHOICES, default='direct')
     scheduled_for = models.DateTimeField(null=True, blank=True)
     expires_at = models.DateTimeField(null=True, blank=True)
     is_sent = models.BooleanField(default=False)
@@ -52,9 +86,32 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_mode', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.notification_type}: {self.title}"
 
+    def get_delivery_stats(self):
+        """
+        Per-status recipient counts, read from with_delivery_stats() annotations
+        when present, otherwise computed with a single grouped query
+        """
+        if hasattr(self, 'stats_pending'):
+            return {status: getattr(self, f'stats_{status}') for status in DELIVERY_STATUSES}
+
+        stats = dict.fromkeys(DELIVERY_STATUSES, 0)
+        rows = self.notificationrecipient_set.values('status').annotate(count=models.Count('id'))
+        for row in rows:
+            stats[row['status']] = row['count']
+        for status, count in stats.items():
+            setattr(self, f'stats_{status}', count)
+        return stats
+
     def save(self, *args, **kwargs):
         if self.is_sent and not self.sent_at:
             self.sent_at = timezone.now()
@@ -104,6 +161,7 @@ class NotificationRecipient(models.Model):
         ('read', 'Read'),
         ('failed', 'Failed'),
     )
+    UNREAD_STATUSES = ('sent', 'delivered')
     
     notification = models.ForeignKey(Notification, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -128,10 +186,88 @@ class NotificationRecipient(models.Model):
 
     class Meta:
         unique_together = ['notification', 'user']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.notification.title}"
 
+class ArchivedNotificationRecipient(models.Model):
+    """
+    Cold storage for NotificationRecipient rows moved out by the retention job
+    (prune_notifications). Plain ids instead of foreign keys so archived rows
+    survive deletion of the notification or user and add no index maintenance.
+    """
+    original_id = models.BigIntegerField(unique=True)
+    notification_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(db_index=True)
+    notification_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)
+    read_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived recipient {self.original_id}"
+
+class NotificationDeliveryRollup(models.Model):
+    """
+    Compact per-day delivery stats for archived recipient rows
+    """
+    date = models.DateField()
+    notification_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['date', 'notification_type', 'status']
+
+    def __str__(self):
+        return f"{self.date} {self.notification_type} {self.status}: {self.count}"
+
+class UserNotificationCounter(models.Model):
+    """
+    Per-user badge counters, maintained incrementally as recipient rows are
+    created and change status, and reconciled periodically against
+    NotificationRecipient (see reconcile_notification_counters)
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_counter')
+    total_count = models.IntegerField(default=0)
+    unread_count = models.IntegerField(default=0)
+    emergency_count = models.IntegerField(default=0)
+    shortage_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Counters for {self.user.username}"
+
+class NotificationCounterTotals(models.Model):
+    """
+    System-wide sums of the per-user counters in a single row, adjusted
+    alongside them so admin stats never scan UserNotificationCounter
+    """
+    total_count = models.BigIntegerField(default=0)
+    unread_count = models.BigIntegerField(default=0)
+    emergency_count = models.BigIntegerField(default=0)
+    shortage_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "Notification counter totals"
+
+class UserInboxCursor(models.Model):
+    """
+    Tracks the last segment notification merged into a user's inbox
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='inbox_cursor')
+    last_segment_notification_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Inbox cursor for {self.user.username}"
+
 class EmergencyBroadcast(models.Model):
     EMERGENCY_TYPE_CHOICES = (
         ('disease_outbreak', 'Disease Outbreak'),
@@ -163,6 +299,10 @@ class EmergencyBroadcast(models.Model):
     target_conditions = models.JSONField(default=list, blank=True)  # ['diabetes', 'asthma', etc.]
     target_blood_types = models.JSONField(default=list, blank=True)  # ['A+', 'O-', etc.]
     target_medications = models.JSONField(default=list, blank=True)  # ['insulin', 'ventolin', etc.]
+    medical_match_mode = models.CharField(max_length=10, choices=(
+        ('any', 'Any'),  # Patient matches at least one listed condition/medication
+        ('all', 'All'),  # Patient matches every listed condition/medication
+    ), default='any')
     
     # Break Glass features
     break_glass_activated = models.BooleanField(default=False)
@@ -209,11 +349,59 @@ class UserNotificationPreference(models.Model):
     # Emergency override
     emergency_override = models.BooleanField(default=True)  # Receive critical alerts even during quiet hours
     
+    # Routine (low-priority) notifications are batched into a digest per channel
+    DIGEST_FREQUENCY_CHOICES = (
+        ('off', 'Off'),
+        ('hourly', 'Hourly'),
+        ('daily', 'Daily'),
+    )
+    digest_frequency = models.CharField(max_length=10, choices=DIGEST_FREQUENCY_CHOICES, default='hourly')
+    
+    # Message template locale, e.g. 'en' or 'en-ng'
+    locale = models.CharField(max_length=10, default='en')
+    
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Preferences for {self.user.username}"
 
+class NotificationDigestEntry(models.Model):
+    """
+    A routine notification waiting to be sent in the user's next digest
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='digest_entries')
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='digest_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+    flushed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['flushed_at', 'user']),
+        ]
+
+    def __str__(self):
+        return f"Digest entry for {self.user.username}: {self.notification.title}"
+
+class AudienceSegmentMember(models.Model):
+    """
+    Materialized (user_type x region) segment membership: one row per active
+    user and region (their own city and their vendor city). Maintained by
+    notifications.signals on User and Vendor saves.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audience_segments')
+    user_type = models.CharField(max_length=20)
+    region = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = ['user', 'region']
+        indexes = [
+            models.Index(fields=['user_type', 'region', 'user']),
+            models.Index(fields=['region', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_type} in {self.region}: {self.user_id}"
+
 class DeviceToken(models.Model):
     DEVICE_TYPE_CHOICES = (
         ('ios', 'iOS'),
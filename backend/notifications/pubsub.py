@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+class InboxEvent:
+    """
+    A single server-sent event. Recipient events carry the NotificationRecipient
+    id as their event id so clients can resume with Last-Event-ID.
+    """
+    __slots__ = ('event', 'data', 'id')
+
+    def __init__(self, event, data, id=None):
+        self.event = event
+        self.data = data
+        self.id = id
+
+def notification_payload(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'notification_type': notification.notification_type,
+        'priority': notification.priority,
+        'action_url': notification.action_url,
+        'action_text': notification.action_text,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+def recipient_event(recipient):
+    """
+    Build the stream event for a NotificationRecipient row
+    """
+    return InboxEvent('notification', {
+        'recipient_id': recipient.id,
+        'status': recipient.status,
+        'notification': notification_payload(recipient.notification),
+    }, id=recipient.id)
+
+def segment_event(notification):
+    """
+    Build the stream event for a segment (fan-out-on-read) notification. It has
+    no recipient row yet, so it carries no event id; reconnecting clients get
+    the materialized row through Last-Event-ID replay instead.
+    """
+    return InboxEvent('notification', {
+        'recipient_id': None,
+        'status': 'delivered',
+        'notification': notification_payload(notification),
+    })
+
+class Subscription:
+    """
+    A connected client. Holds a bounded queue owned by the event loop that
+    serves the connection; overflowing clients are told to resync instead of
+    buffering without limit.
+    """
+    __slots__ = ('user_id', 'user_type', 'regions', 'queue', 'loop', 'overflowed')
+
+    def __init__(self, user_id, user_type, regions, loop, max_queue_size):
+        self.user_id = user_id
+        self.user_type = user_type
+        self.regions = regions
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.loop = loop
+        self.overflowed = False
+
+    def offer(self, event):
+        """Enqueue an event; must run on the subscription's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class InboxBroker:
+    """
+    In-process pub/sub feeding the inbox stream. publish() is thread-safe and
+    may be called from synchronous delivery code; events are handed to each
+    subscriber's event loop with call_soon_threadsafe.
+
+    Only clients connected to this process receive events. Deployments with
+    several ASGI workers rely on Last-Event-ID replay when a client reconnects.
+    """
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, user_type=None, regions=None):
+        subscription = Subscription(
+            user_id, user_type, set(regions or ()), asyncio.get_running_loop(), self.max_queue_size
+        )
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def _deliver(self, subscriptions, event):
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Event loop already closed; the connection is going away
+                logger.debug(f"Dropping event for closed stream of user {subscription.user_id}")
+
+    def publish(self, user_id, event):
+        """
+        Push an event to every open stream of one user
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        self._deliver(subscriptions, event)
+
+    def publish_segment(self, target_user_types, target_regions, event):
+        """
+        Push an event to every connected user inside a segment audience
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for subscriptions in self._subscriptions.values()
+                for subscription in subscriptions
+                if (not target_user_types or subscription.user_type in target_user_types)
+                and (not target_regions or subscription.regions & set(target_regions))
+            ]
+        self._deliver(subscriptions, event)
+
+broker = InboxBroker()
@@ -0,0 +1,64 @@
+from typing import Iterable, Iterator, Optional, Set
+from django.contrib.auth import get_user_model
+from inventory.models import Vendor
+from .models import AudienceSegmentMember
+
+User = get_user_model()
+
+# User fields that decide segment membership
+SEGMENT_FIELDS = frozenset({'user_type', 'city', 'is_active'})
+
+def user_regions(user) -> Set[str]:
+    """
+    Regions a user belongs to: their own city and their vendor's city
+    """
+    regions = {user.city} if user.city else set()
+    if user.pk:
+        regions.update(
+            city for city in Vendor.objects.filter(user_id=user.pk).values_list('city', flat=True) if city
+        )
+    return regions
+
+def index_user(user) -> None:
+    """
+    Rebuild the segment memberships of a single user. Inactive users belong
+    to no segment.
+    """
+    regions = user_regions(user) if user.is_active else set()
+
+    AudienceSegmentMember.objects.filter(user_id=user.pk).exclude(
+        region__in=regions, user_type=user.user_type
+    ).delete()
+    AudienceSegmentMember.objects.bulk_create(
+        [AudienceSegmentMember(user_id=user.pk, user_type=user.user_type, region=region) for region in regions],
+        ignore_conflicts=True
+    )
+
+def segment_member_ids(user_types: Optional[Iterable[str]] = None,
+                       regions: Optional[Iterable[str]] = None):
+    """
+    Ids of users in the given segments, as a values queryset usable as a
+    subquery. Reads the membership table only; no join to users or vendors.
+    """
+    members = AudienceSegmentMember.objects.all()
+    if user_types:
+        members = members.filter(user_type__in=list(user_types))
+    if regions:
+        members = members.filter(region__in=list(regions))
+    return members.values_list('user_id', flat=True)
+
+def iter_segment_member_ids(user_types: Optional[Iterable[str]] = None,
+                            regions: Optional[Iterable[str]] = None,
+                            chunk_size: int = 2000) -> Iterator[int]:
+    """
+    Stream distinct member ids in ascending order, chunk by chunk, using
+    keyset pagination so memory stays bounded for very large segments
+    """
+    members = segment_member_ids(user_types, regions).order_by('user_id')
+    last_id = 0
+    while True:
+        chunk = list(members.filter(user_id__gt=last_id).distinct()[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1]
@@ -36,20 +36,16 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = '__all__'
     
+    # Counts come from Notification.objects.with_delivery_stats() annotations;
+    # list views must annotate their queryset to keep a fixed query count
     def get_recipients_count(self, obj):
-        return obj.recipients.count()
+        return sum(obj.get_delivery_stats().values())
     
     def get_read_count(self, obj):
-        return obj.notificationrecipient_set.filter(status='read').count()
+        return obj.get_delivery_stats()['read']
     
     def get_delivery_status(self, obj):
-        return {
-            'pending': obj.notificationrecipient_set.filter(status='pending').count(),
-            'sent': obj.notificationrecipient_set.filter(status='sent').count(),
-            'delivered': obj.notificationrecipient_set.filter(status='delivered').count(),
-            'read': obj.notificationrecipient_set.filter(status='read').count(),
-            'failed': obj.notificationrecipient_set.filter(status='failed').count(),
-        }
+        return obj.get_delivery_stats()
 
 class NotificationCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -81,12 +77,22 @@ class EmergencyBroadcastCreateSerializer(serializers.ModelSerializer):
         fields = (
             'title', 'message', 'emergency_type', 'urgency_level',
             'regions', 'radius_km', 'coordinates_lat', 'coordinates_lng',
-            'target_conditions', 'target_blood_types', 'target_medications',
+            'target_conditions', 'target_blood_types', 'target_medications', 'medical_match_mode',
             'break_glass_activated', 'break_glass_reason', 'expires_at'
         )
 
+class InboxNotificationSerializer(NotificationSerializer):
+    """
+    A notification nested in a user's inbox: the delivery counts come from
+    the annotations, and the recipient list, which for a broadcast is every
+    user, is left out
+    """
+    class Meta:
+        model = Notification
+        exclude = ('recipients',)
+
 class UserNotificationSerializer(serializers.ModelSerializer):
-    notification_details = NotificationSerializer(source='notification', read_only=True)
+    notification_details = InboxNotificationSerializer(source='notification', read_only=True)
     
     class Meta:
         model = NotificationRecipient
@@ -109,4 +115,12 @@ class BulkNotificationSerializer(serializers.Serializer):
     title = serializers.CharField(max_length=255)
     message = serializers.CharField()
     notification_type = serializers.ChoiceField(choices=Notification.NOTIFICATION_TYPE_CHOICES)
-    priority = serializers.ChoiceField(choices=Notification.PRIORITY_CHOICES, default='medium')
\ No newline at end of file
+    priority = serializers.ChoiceField(choices=Notification.PRIORITY_CHOICES, default='medium')
+
+class ReceiptSerializer(serializers.Serializer):
+    id = serializers.IntegerField()  # NotificationRecipient id
+    status = serializers.ChoiceField(choices=('delivered', 'read'))
+    timestamp = serializers.DateTimeField(required=False)
+
+class BulkReceiptSerializer(serializers.Serializer):
+    receipts = ReceiptSerializer(many=True, allow_empty=False, max_length=1000)
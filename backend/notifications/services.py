@@ -1,25 +1,51 @@
 import logging
-from datetime import datetime, time
+from collections import Counter
+from datetime import datetime, time, timedelta
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, F, Count, Sum, Case, When, Value, Subquery, DateTimeField, BigIntegerField
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import transaction
 from .models import (
     Notification, NotificationRecipient, EmergencyBroadcast,
-    UserNotificationPreference, DeviceToken
+    UserNotificationPreference, DeviceToken, UserInboxCursor, UserNotificationCounter,
+    NotificationCounterTotals, NotificationDigestEntry, ArchivedNotificationRecipient, NotificationDeliveryRollup
 )
+from .pubsub import broker, segment_event
+from .coalescing import coalesce_key, window_start, is_escalation
 from inventory.models import MedicalItem
 from ehr.models import Patient
+from ehr.indexing import find_user_ids
+from .segments import segment_member_ids, user_regions
+from .lanes import get_dispatcher, lane_for, id_chunks
+from .throttling import throttle
+from .gateways import get_gateway
+from .message_templates import registry as message_templates, render_for_users
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 class NotificationService:
     @staticmethod
-    def create_notification(notification_data, send_immediately=True):
+    def create_notification(notification_data, send_immediately=True, coalesce=False):
         """
-        Create a notification and optionally send it immediately
+        Create a notification and optionally send it immediately.
+        With coalesce=True, a repeat of an alert still inside the coalescing
+        window updates the original instead of fanning out again.
         """
         try:
+            if coalesce:
+                notification_data = dict(notification_data)
+                notification_data['coalesce_key'] = coalesce_key(
+                    notification_data['notification_type'],
+                    getattr(notification_data.get('related_medical_item'), 'id', None),
+                    notification_data.get('target_regions', [])
+                )
+                existing = NotificationService.coalesce_repeat(notification_data)
+                if existing:
+                    return existing
+            
             notification = Notification.objects.create(**notification_data)
             
             if send_immediately and not notification.scheduled_for:
@@ -31,6 +57,36 @@ class NotificationService:
             logger.error(f"Error creating notification: {str(e)}")
             raise
     
+    @staticmethod
+    @transaction.atomic
+    def coalesce_repeat(notification_data):
+        """
+        Fold a repeated alert into the notification already sent within the
+        window. Returns the updated notification, or None if there is none.
+        The alert is re-delivered only when its priority escalates.
+        """
+        existing = Notification.objects.select_for_update().filter(
+            coalesce_key=notification_data['coalesce_key'],
+            created_at__gte=window_start()
+        ).order_by('-created_at').first()
+        
+        if not existing:
+            return None
+        
+        escalated = is_escalation(existing.priority, notification_data.get('priority', 'medium'))
+        for field in ('title', 'message', 'template_context', 'priority', 'related_prediction'):
+            if field in notification_data and (field != 'priority' or escalated):
+                setattr(existing, field, notification_data[field])
+        existing.occurrence_count += 1
+        existing.last_occurred_at = timezone.now()
+        existing.save()
+        
+        if escalated:
+            transaction.on_commit(lambda: NotificationService.deliver_notification(existing))
+        
+        logger.info(f"Coalesced repeat #{existing.occurrence_count} into notification {existing.id}")
+        return existing
+    
     @staticmethod
     def get_recipients_for_notification(notification):
         """
@@ -42,21 +98,19 @@ class NotificationService:
         if notification.target_user_types:
             base_query = base_query.filter(user_type__in=notification.target_user_types)
         
-        # Filter by regions
+        # Filter by regions through the materialized segment memberships
         if notification.target_regions:
-            # This would need to be enhanced with actual location data
-            base_query = base_query.filter(
-                Q(city__in=notification.target_regions) |
-                Q(vendor_profile__city__in=notification.target_regions)
-            ).distinct()
+            base_query = base_query.filter(id__in=segment_member_ids(
+                notification.target_user_types, notification.target_regions
+            ))
         
         # Additional filtering for medical conditions
         if notification.related_medical_item:
-            # Find users who might need this medication
-            patients_with_condition = Patient.objects.filter(
-                current_medications__icontains=notification.related_medical_item.name
-            ).values_list('user_id', flat=True)
-            base_query = base_query.filter(id__in=patients_with_condition)
+            # Find users who might need this medication (brand or generic name)
+            item = notification.related_medical_item
+            medication_names = [name for name in (item.name, item.generic_name) if name]
+            patients_on_medication = find_user_ids('medication', medication_names, match='any')
+            base_query = base_query.filter(id__in=patients_on_medication)
         
         return base_query
     
@@ -67,23 +121,53 @@ class NotificationService:
         """
         try:
             recipients = NotificationService.get_recipients_for_notification(notification)
+            recipient_count = recipients.count()
             
-            for user in recipients:
-                NotificationService.deliver_to_user(notification, user)
+            # Large audiences defined purely by user type and region are stored once
+            # and merged into each inbox on read instead of writing a row per user
+            if (recipient_count >= settings.NOTIFICATION_FANOUT_ON_READ_THRESHOLD
+                    and not notification.related_medical_item):
+                SegmentNotificationService.publish(notification, recipient_count)
+                return
             
-            notification.is_sent = True
-            notification.sent_at = timezone.now()
-            notification.save()
+            def mark_sent():
+                notification.is_sent = True
+                notification.sent_at = timezone.now()
+                notification.save(update_fields=['is_sent', 'sent_at', 'updated_at'])
+                logger.info(f"Notification {notification.id} delivered to {recipient_count} users")
             
-            logger.info(f"Notification {notification.id} delivered to {recipients.count()} users")
+            get_dispatcher().submit(
+                lane_for(notification),
+                id_chunks(recipients, settings.NOTIFICATION_DELIVERY_CHUNK_SIZE),
+                lambda user_ids: NotificationService.deliver_to_users(notification, user_ids),
+                on_complete=mark_sent,
+                label=f"notification {notification.id}"
+            )
             
         except Exception as e:
             logger.error(f"Error delivering notification {notification.id}: {str(e)}")
     
     @staticmethod
-    def deliver_to_user(notification, user):
+    def deliver_to_users(notification, user_ids):
+        """
+        Deliver one chunk of a fan-out
+        """
+        users = list(User.objects.filter(id__in=user_ids).select_related('notification_preferences'))
+        locales = {
+            user.id: getattr(getattr(user, 'notification_preferences', None), 'locale', None)
+            for user in users
+        }
+        # Personalized text for the whole chunk: one vendor lookup, cached templates
+        contents = render_for_users(notification, users, locales)
+        
+        for user in users:
+            NotificationService.deliver_to_user(notification, user, contents.get(user.id))
+    
+    @staticmethod
+    def deliver_to_user(notification, user, content=None):
         """
-        Deliver notification to a specific user via preferred channels
+        Deliver notification to a specific user via preferred channels.
+        content optionally maps each channel to its rendered title and message.
         """
         try:
             # Get or create recipient record
@@ -100,21 +184,39 @@ class NotificationService:
                 logger.info(f"Quiet hours active for {user.username}, skipping delivery")
                 return
             
-            # Deliver via preferred channels
+            # Routine traffic goes to the in-app inbox now and to the external channels in a digest
+            if DigestService.is_digestible(notification) and preferences.digest_frequency != 'off':
+                DigestService.enqueue(recipient, preferences)
+                return
+            
+            # Deliver via preferred channels, within the per-user channel rate limits.
+            # Critical alerts are never held back for users with emergency_override.
+            content = content or {}
             delivery_success = False
+            throttled = []
+            force = notification.priority == 'critical' and preferences.emergency_override
             
             if preferences.push_notifications:
-                if NotificationService.send_push_notification(notification, user):
+                if not throttle.allow(user.id, 'push', force=force):
+                    throttled.append('push')
+                elif NotificationService.send_push_notification(
+                        notification, user, content.get('push')):
                     recipient.sent_via_push = True
                     delivery_success = True
             
             if preferences.sms_notifications and user.phone_number:
-                if NotificationService.send_sms_notification(notification, user):
+                if not throttle.allow(user.id, 'sms', force=force):
+                    throttled.append('sms')
+                elif NotificationService.send_sms_notification(
+                        notification, user, content.get('sms')):
                     recipient.sent_via_sms = True
                     delivery_success = True
             
             if preferences.email_notifications and user.email:
-                if NotificationService.send_email_notification(notification, user):
+                if not throttle.allow(user.id, 'email', force=force):
+                    throttled.append('email')
+                elif NotificationService.send_email_notification(
+                        notification, user, content.get('email')):
                     recipient.sent_via_email = True
                     delivery_success = True
             
@@ -122,12 +224,25 @@ class NotificationService:
                 recipient.sent_via_in_app = True
                 delivery_success = True
             
+            # Overflow falls back to the digest when the user has one; critical
+            # alerts would be stale by then and stay in-app only
+            digested = False
+            if throttled:
+                logger.info(f"Rate limited {', '.join(throttled)} for {user.username}")
+                if preferences.digest_frequency != 'off' and notification.priority != 'critical':
+                    DigestService.add_entry(recipient)
+                    digested = True
+            
             if delivery_success:
                 recipient.status = 'sent'
                 recipient.delivered_at = timezone.now()
+            elif digested:
+                recipient.status = 'pending'
             else:
                 recipient.status = 'failed'
-                recipient.failure_reason = "All delivery channels failed"
+                recipient.failure_reason = (
+                    f"Rate limited on {', '.join(throttled)}" if throttled else "All delivery channels failed"
+                )
             
             recipient.save()
             
@@ -139,6 +254,11 @@ class NotificationService:
         """
         Get user notification preferences, create default if not exists
         """
+        try:
+            # Loaded with select_related('notification_preferences') during fan-out
+            return user.notification_preferences
+        except UserNotificationPreference.DoesNotExist:
+            pass
         preferences, created = UserNotificationPreference.objects.get_or_create(user=user)
         return preferences
     
@@ -154,18 +274,31 @@ class NotificationService:
         return preferences.quiet_hours_start <= now <= preferences.quiet_hours_end
     
     @staticmethod
-    def send_push_notification(notification, user):
+    def message_content(notification, content=None):
+        """
+        Channel text: the per-user rendering when given, else the stored text
+        """
+        return content or {'title': notification.title, 'message': notification.message}
+    
+    @staticmethod
+    def send_push_notification(notification, user, content=None):
         """
         Send push notification (integrate with FCM/APNS)
         """
         try:
+            content = NotificationService.message_content(notification, content)
+            
             # Get user's device tokens
             device_tokens = DeviceToken.objects.filter(user=user, is_active=True)
             
+            gateway = get_gateway('push')
+            if gateway is not None:
+                return any([gateway.send(device_token.token, content) for device_token in device_tokens])
+            
             for device_token in device_tokens:
                 # Integration with Firebase Cloud Messaging or Apple Push Notification Service
                 # This is a placeholder - implement actual push service integration
-                logger.info(f"Push sent to {user.username} via {device_token.device_type}: {notification.title}")
+                logger.info(f"Push sent to {user.username} via {device_token.device_type}: {content['title']}")
             
             return True
             
@@ -174,14 +307,20 @@ class NotificationService:
             return False
     
     @staticmethod
-    def send_sms_notification(notification, user):
+    def send_sms_notification(notification, user, content=None):
         """
         Send SMS notification (integrate with SMS gateway)
         """
         try:
+            content = NotificationService.message_content(notification, content)
+            
+            gateway = get_gateway('sms')
+            if gateway is not None:
+                return gateway.send(user.phone_number, content)
+            
             # Integration with SMS gateway like Twilio, Africa's Talking, etc.
             # This is a placeholder - implement actual SMS service integration
-            logger.info(f"SMS sent to {user.phone_number}: {notification.title}")
+            logger.info(f"SMS sent to {user.phone_number}: {content['message']}")
             return True
             
         except Exception as e:
@@ -189,20 +328,492 @@ class NotificationService:
             return False
     
     @staticmethod
-    def send_email_notification(notification, user):
+    def send_email_notification(notification, user, content=None):
         """
         Send email notification
         """
         try:
+            content = NotificationService.message_content(notification, content)
+            
+            gateway = get_gateway('email')
+            if gateway is not None:
+                return gateway.send(user.email, content)
+            
             # Integration with email service
             # This is a placeholder - implement actual email service integration
-            logger.info(f"Email sent to {user.email}: {notification.title}")
+            logger.info(f"Email sent to {user.email}: {content['title']}")
             return True
             
         except Exception as e:
             logger.error(f"Error sending email to {user.email}: {str(e)}")
             return False
 
+class DigestService:
+    """
+    Batches routine notifications per user and sends them as one message per
+    channel on the user's digest schedule (flush_notification_digests)
+    """
+    DIGEST_NOTIFICATION_TYPES = ('health_tip', 'stock_update')
+    
+    @staticmethod
+    def is_digestible(notification):
+        if notification.priority == 'critical' or notification.notification_type == 'emergency_broadcast':
+            return False
+        if notification.notification_type in DigestService.DIGEST_NOTIFICATION_TYPES:
+            return True
+        return notification.notification_type == 'shortage_alert' and notification.priority == 'low'
+    
+    @staticmethod
+    def enqueue(recipient, preferences):
+        """
+        Record the notification for the next digest and show it in-app right away
+        """
+        DigestService.add_entry(recipient)
+        
+        if preferences.in_app_notifications:
+            recipient.sent_via_in_app = True
+            recipient.status = 'sent'
+            recipient.delivered_at = timezone.now()
+        else:
+            recipient.status = 'pending'
+        recipient.save()
+    
+    @staticmethod
+    def add_entry(recipient):
+        NotificationDigestEntry.objects.create(user=recipient.user, notification=recipient.notification)
+    
+    @staticmethod
+    def build_digest(entries):
+        """
+        Build an unsaved Notification summarizing a user's pending entries,
+        consumed by the channel senders
+        """
+        count = len(entries)
+        lines = [f"- {entry.notification.title}" for entry in entries]
+        return Notification(
+            title=f"You have {count} new update{'s' if count != 1 else ''}",
+            message="\n".join(lines),
+            notification_type='system_alert',
+            priority='low'
+        )
+    
+    @staticmethod
+    def send_digest(user, entries, preferences):
+        """
+        Send one digest message per enabled channel
+        """
+        digest = DigestService.build_digest(entries)
+        
+        if preferences.push_notifications:
+            NotificationService.send_push_notification(digest, user)
+        if preferences.sms_notifications and user.phone_number:
+            NotificationService.send_sms_notification(digest, user)
+        if preferences.email_notifications and user.email:
+            NotificationService.send_email_notification(digest, user)
+    
+    @staticmethod
+    def flush_digests(frequency):
+        """
+        Send pending digests for users on the given schedule ('hourly' also
+        drains users who have since turned digests off). Returns the number
+        of digests sent.
+        """
+        frequencies = ['hourly', 'off'] if frequency == 'hourly' else [frequency]
+        pending = NotificationDigestEntry.objects.filter(
+            flushed_at__isnull=True,
+            user__notification_preferences__digest_frequency__in=frequencies
+        )
+        user_ids = list(pending.values_list('user_id', flat=True).distinct().order_by('user_id'))
+        
+        sent = 0
+        flushed = 0
+        for user_id in user_ids:
+            try:
+                # Entries are marked flushed with their digest: a failed send
+                # rolls the mark back, and a crash cannot resend earlier users
+                with transaction.atomic():
+                    user_entries = list(pending.filter(user_id=user_id).select_related(
+                        'notification', 'user', 'user__notification_preferences'
+                    ).order_by('created_at'))
+                    if not user_entries:
+                        continue
+                    user = user_entries[0].user
+                    claimed = NotificationDigestEntry.objects.filter(
+                        id__in=[entry.id for entry in user_entries], flushed_at__isnull=True
+                    ).update(flushed_at=timezone.now())
+                    if claimed != len(user_entries):
+                        # Another flush got to some of them first
+                        transaction.set_rollback(True)
+                        continue
+                    DigestService.send_digest(user, user_entries, user.notification_preferences)
+            except Exception as e:
+                logger.error(f"Error sending digest to user {user_id}: {str(e)}")
+                continue
+            sent += 1
+            flushed += len(user_entries)
+        
+        logger.info(f"Flushed {sent} {frequency} digests ({flushed} notifications)")
+        return sent
+
+class NotificationCounterService:
+    """
+    Incrementally maintained per-user badge counters (UserNotificationCounter).
+    Single-row saves are tracked by notifications.signals; bulk writes that
+    bypass signals must call adjust() themselves.
+    """
+    COUNTER_TYPES = {
+        'emergency_broadcast': 'emergency_count',
+        'shortage_alert': 'shortage_count',
+    }
+    COUNTER_FIELDS = ('total_count', 'unread_count', 'emergency_count', 'shortage_count')
+    TOTALS_ID = 1
+    
+    @staticmethod
+    def deltas_for(notification_type, status, sign=1):
+        """
+        Counter deltas contributed by one recipient row
+        """
+        deltas = {'total_count': sign}
+        if status in NotificationRecipient.UNREAD_STATUSES:
+            deltas['unread_count'] = sign
+        type_field = NotificationCounterService.COUNTER_TYPES.get(notification_type)
+        if type_field:
+            deltas[type_field] = sign
+        return deltas
+    
+    @staticmethod
+    def adjust(user_id, seed=True, **deltas):
+        """
+        Atomically apply counter deltas, e.g. adjust(user.id, unread_count=-3)
+        """
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if not changes:
+            return
+        
+        now = timezone.now()
+        updated = UserNotificationCounter.objects.filter(user_id=user_id).update(updated_at=now, **changes)
+        if updated:
+            NotificationCounterTotals.objects.filter(pk=NotificationCounterService.TOTALS_ID).update(
+                updated_at=now, **changes
+            )
+        elif seed:
+            # First activity for this user: seed the row from the source table
+            NotificationCounterService.reconcile_users([user_id])
+    
+    @staticmethod
+    def source_counts(queryset):
+        """
+        Grouped per-user counts computed directly from NotificationRecipient
+        """
+        return queryset.values('user_id').annotate(
+            total_count=Count('id'),
+            unread_count=Count('id', filter=Q(status__in=NotificationRecipient.UNREAD_STATUSES)),
+            emergency_count=Count('id', filter=Q(notification__notification_type='emergency_broadcast')),
+            shortage_count=Count('id', filter=Q(notification__notification_type='shortage_alert')),
+        ).order_by()
+    
+    @staticmethod
+    def reconcile_users(user_ids):
+        """
+        Recompute counters for the given users from NotificationRecipient
+        """
+        counters = {
+            user_id: UserNotificationCounter(user_id=user_id)
+            for user_id in user_ids
+        }
+        previous = UserNotificationCounter.objects.filter(user_id__in=counters).aggregate(
+            **{field: Sum(field) for field in NotificationCounterService.COUNTER_FIELDS}
+        )
+        rows = NotificationCounterService.source_counts(
+            NotificationRecipient.objects.filter(user_id__in=user_ids)
+        )
+        for row in rows:
+            counter = counters[row.pop('user_id')]
+            for field, value in row.items():
+                setattr(counter, field, value)
+        
+        UserNotificationCounter.objects.bulk_create(
+            counters.values(),
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[*NotificationCounterService.COUNTER_FIELDS, 'updated_at']
+        )
+        # Move the totals by what reconciling changed
+        deltas = {
+            field: sum(getattr(counter, field) for counter in counters.values()) - (previous[field] or 0)
+            for field in NotificationCounterService.COUNTER_FIELDS
+        }
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if changes:
+            NotificationCounterTotals.objects.filter(pk=NotificationCounterService.TOTALS_ID).update(
+                updated_at=timezone.now(), **changes
+            )
+        return len(counters)
+    
+    @staticmethod
+    def reconcile_totals():
+        """
+        Recompute the totals row from the per-user counters
+        """
+        fields = NotificationCounterService.COUNTER_FIELDS
+        totals = UserNotificationCounter.objects.aggregate(**{field: Sum(field) for field in fields})
+        totals = {field: value or 0 for field, value in totals.items()}
+        NotificationCounterTotals.objects.update_or_create(pk=NotificationCounterService.TOTALS_ID, defaults=totals)
+        return totals
+    
+    @staticmethod
+    def get_counter(user):
+        counter = UserNotificationCounter.objects.filter(user=user).first()
+        if counter is None:
+            NotificationCounterService.reconcile_users([user.id])
+            counter = UserNotificationCounter.objects.get(user=user)
+        return counter
+    
+    @staticmethod
+    def get_totals():
+        """
+        System-wide totals from the single totals row, seeded from the
+        per-user counters the first time
+        """
+        totals = NotificationCounterTotals.objects.filter(
+            pk=NotificationCounterService.TOTALS_ID
+        ).values(*NotificationCounterService.COUNTER_FIELDS).first()
+        return totals or NotificationCounterService.reconcile_totals()
+
+class SegmentNotificationService:
+    """
+    Fan-out-on-read for very large audiences. A segment notification is stored
+    once with its targeting (target_user_types / target_regions); each user's
+    NotificationRecipient row is created lazily the next time they read their inbox.
+    """
+    @staticmethod
+    def publish(notification, audience_size):
+        """
+        Mark a notification as a segment broadcast and push it to channel topics
+        """
+        notification.delivery_mode = 'segment'
+        notification.is_sent = True
+        notification.sent_at = timezone.now()
+        notification.save()
+        
+        # Topic-based push (FCM topics / SMS broadcast lists) replaces per-user sends
+        # This is a placeholder - implement actual topic service integration
+        logger.info(
+            f"Segment notification {notification.id} published to ~{audience_size} users "
+            f"(types={notification.target_user_types}, regions={notification.target_regions})"
+        )
+        
+        # Push to users connected to the inbox stream
+        event = segment_event(notification)
+        transaction.on_commit(lambda: broker.publish_segment(
+            notification.target_user_types, notification.target_regions, event
+        ))
+    
+    @staticmethod
+    def user_matches(notification, user, regions):
+        """
+        Check whether a user falls inside a segment notification's audience
+        """
+        if notification.target_user_types and user.user_type not in notification.target_user_types:
+            return False
+        if notification.target_regions and not regions & set(notification.target_regions):
+            return False
+        return True
+    
+    @staticmethod
+    def get_user_regions(user):
+        return user_regions(user)
+    
+    @staticmethod
+    def sync_inbox(user):
+        """
+        Materialize recipient rows for segment notifications the user has not seen yet.
+        Returns the number of rows created. When nothing is pending, as on
+        most inbox reads, this is a single read-only query.
+        """
+        now = timezone.now()
+        live = Notification.objects.filter(delivery_mode='segment').filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+        )
+        position = UserInboxCursor.objects.filter(user=user).values('last_segment_notification_id')[:1]
+        if not live.filter(id__gt=Coalesce(Subquery(position), Value(0), output_field=BigIntegerField())).exists():
+            return 0
+        
+        cursor, created = UserInboxCursor.objects.get_or_create(user=user)
+        pending = list(live.filter(
+            id__gt=cursor.last_segment_notification_id
+        ).order_by('id').only(
+            'id', 'notification_type', 'target_user_types', 'target_regions', 'related_broadcast_id'
+        ))
+        
+        if not pending:
+            return 0
+        
+        regions = None
+        rows = []
+        counter_deltas = {}
+        for notification in pending:
+            if notification.target_regions and regions is None:
+                regions = SegmentNotificationService.get_user_regions(user)
+            if SegmentNotificationService.user_matches(notification, user, regions or set()):
+                rows.append(NotificationRecipient(
+                    notification=notification,
+                    user=user,
+                    status='delivered',
+                    delivered_at=now,
+                    sent_via_in_app=True
+                ))
+                for field, delta in NotificationCounterService.deltas_for(
+                        notification.notification_type, 'delivered').items():
+                    counter_deltas[field] = counter_deltas.get(field, 0) + delta
+        
+        with transaction.atomic():
+            # Advance the cursor only from the position it was read at; a
+            # concurrent sync that already moved it owns these deltas
+            advanced = UserInboxCursor.objects.filter(
+                pk=cursor.pk,
+                last_segment_notification_id=cursor.last_segment_notification_id
+            ).update(last_segment_notification_id=pending[-1].id, updated_at=now)
+            if not advanced:
+                return 0
+            
+            NotificationRecipient.objects.bulk_create(rows, ignore_conflicts=True)
+            # bulk_create bypasses the counter signals
+            NotificationCounterService.adjust(user.id, **counter_deltas)
+            ReceiptService.increment_broadcast_counts(Counter(
+                row.notification.related_broadcast_id for row in rows if row.notification.related_broadcast_id
+            ), Counter())
+        
+        return len(rows)
+
+class ReceiptService:
+    """
+    Batched delivery and read receipts from clients. A batch is applied with
+    one UPDATE per status and one aggregate increment per affected broadcast.
+    """
+    # Receipts only move a recipient forward: sent/failed -> delivered -> read
+    STATUS_RANK = {'sent': 0, 'failed': 0, 'delivered': 1, 'read': 2}
+    
+    @staticmethod
+    def increment_broadcast_counts(delivered, read):
+        """
+        Apply per-broadcast deltas (Counters keyed by broadcast id) atomically
+        """
+        for broadcast_id in set(delivered) | set(read):
+            EmergencyBroadcast.objects.filter(id=broadcast_id).update(
+                delivered_count=F('delivered_count') + delivered[broadcast_id],
+                read_count=F('read_count') + read[broadcast_id]
+            )
+    
+    @staticmethod
+    def timestamp_case(timestamps):
+        """
+        Per-row timestamps for a single UPDATE
+        """
+        return Case(
+            *[When(id=recipient_id, then=Value(timestamp)) for recipient_id, timestamp in timestamps.items()],
+            output_field=DateTimeField()
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def apply_receipts(user, receipts):
+        """
+        Apply receipts ({'id', 'status', 'timestamp'}) for the user's own rows.
+        Unknown ids and receipts that would move a row backwards are ignored.
+        Returns the number of rows updated.
+        """
+        now = timezone.now()
+        wanted = {}
+        for receipt in receipts:
+            rank = ReceiptService.STATUS_RANK[receipt['status']]
+            timestamp = min(receipt.get('timestamp') or now, now)
+            current = wanted.get(receipt['id'])
+            if current is None or rank > ReceiptService.STATUS_RANK[current[0]]:
+                wanted[receipt['id']] = (receipt['status'], timestamp)
+        
+        rows = NotificationRecipient.objects.select_for_update().filter(
+            user=user, id__in=list(wanted)
+        ).values_list('id', 'status', 'notification__related_broadcast_id')
+        
+        delivered_at, read_at = {}, {}
+        delivered, read = Counter(), Counter()
+        unread_delta = 0
+        for recipient_id, current_status, broadcast_id in rows:
+            new_status, timestamp = wanted[recipient_id]
+            current_rank = ReceiptService.STATUS_RANK.get(current_status, 0)
+            if ReceiptService.STATUS_RANK[new_status] <= current_rank:
+                continue
+            
+            if new_status == 'read':
+                read_at[recipient_id] = timestamp
+            else:
+                delivered_at[recipient_id] = timestamp
+            
+            was_unread = current_status in NotificationRecipient.UNREAD_STATUSES
+            is_unread = new_status in NotificationRecipient.UNREAD_STATUSES
+            unread_delta += int(is_unread) - int(was_unread)
+            
+            if broadcast_id:
+                # A read receipt also proves delivery
+                if current_rank < ReceiptService.STATUS_RANK['delivered']:
+                    delivered[broadcast_id] += 1
+                if new_status == 'read':
+                    read[broadcast_id] += 1
+        
+        if delivered_at:
+            NotificationRecipient.objects.filter(id__in=list(delivered_at)).update(
+                status='delivered', delivered_at=ReceiptService.timestamp_case(delivered_at)
+            )
+        if read_at:
+            NotificationRecipient.objects.filter(id__in=list(read_at)).update(
+                status='read',
+                read_at=ReceiptService.timestamp_case(read_at),
+                delivered_at=Case(
+                    When(delivered_at__isnull=True, then=ReceiptService.timestamp_case(read_at)),
+                    default=F('delivered_at')
+                )
+            )
+        
+        # Queryset updates bypass the counter signals
+        if unread_delta:
+            NotificationCounterService.adjust(user.id, unread_count=unread_delta)
+        ReceiptService.increment_broadcast_counts(delivered, read)
+        
+        return len(delivered_at) + len(read_at)
+    
+    @staticmethod
+    @transaction.atomic
+    def mark_all_read(user):
+        """
+        Read receipts for all of the user's unread rows, stamped now, with one
+        UPDATE. Returns the number of rows updated.
+        """
+        now = timezone.now()
+        rows = list(NotificationRecipient.objects.select_for_update().filter(
+            user=user, status__in=NotificationRecipient.UNREAD_STATUSES
+        ).values_list('id', 'status', 'notification__related_broadcast_id'))
+        if not rows:
+            return 0
+        
+        delivered, read = Counter(), Counter()
+        for _, current_status, broadcast_id in rows:
+            if broadcast_id:
+                if current_status == 'sent':
+                    delivered[broadcast_id] += 1
+                read[broadcast_id] += 1
+        
+        NotificationRecipient.objects.filter(id__in=[recipient_id for recipient_id, _, _ in rows]).update(
+            status='read',
+            read_at=now,
+            delivered_at=Case(When(delivered_at__isnull=True, then=Value(now)), default=F('delivered_at'))
+        )
+        
+        # Queryset updates bypass the counter signals
+        NotificationCounterService.adjust(user.id, unread_count=-len(rows))
+        ReceiptService.increment_broadcast_counts(delivered, read)
+        return len(rows)
+
 class EmergencyBroadcastService:
     @staticmethod
     def create_emergency_broadcast(broadcast_data, author):
@@ -234,35 +845,45 @@ class EmergencyBroadcastService:
             broadcast.total_recipients = targeted_users.count()
             broadcast.save()
             
+            has_medical_targeting = (
+                broadcast.target_conditions or broadcast.target_medications or broadcast.target_blood_types
+            )
+            
             # Create notification for emergency broadcast
+            template_context = {'title': broadcast.title, 'message': broadcast.message}
+            text = message_templates.render('emergency_broadcast', template_context)
             notification_data = {
-                'title': f"EMERGENCY: {broadcast.title}",
-                'message': broadcast.message,
+                'title': text['title'],
+                'message': text['message'],
+                'template_context': template_context,
                 'notification_type': 'emergency_broadcast',
                 'priority': 'critical',  # Emergency broadcasts are always critical
                 'target_user_types': [],  # Already filtered in targeted_users
                 'target_regions': broadcast.regions,
                 'expires_at': broadcast.expires_at,
+                'related_broadcast': broadcast,
             }
             
             notification = Notification.objects.create(**notification_data)
             
-            # Deliver to targeted users (bypassing quiet hours)
-            for user in targeted_users:
-                recipient = NotificationRecipient.objects.create(
-                    notification=notification,
-                    user=user,
-                    status='sent'
-                )
-                
-                # Force delivery regardless of preferences for emergencies
-                NotificationService.deliver_to_user(notification, user)
-                
-                # Update broadcast stats
-                if recipient.status == 'delivered':
-                    broadcast.delivered_count += 1
+            # Regional and nationwide broadcasts above the threshold fan out on read
+            if (broadcast.total_recipients >= settings.NOTIFICATION_FANOUT_ON_READ_THRESHOLD
+                    and not has_medical_targeting):
+                SegmentNotificationService.publish(notification, broadcast.total_recipients)
+                logger.info(f"Emergency broadcast activated as segment: {broadcast.title}")
+                return
             
-            broadcast.save()
+            # Deliver to targeted users (critical priority bypasses quiet hours and digests)
+            # in the lane matching the urgency level, ahead of any bulk traffic
+            get_dispatcher().submit(
+                lane_for(notification, broadcast),
+                id_chunks(targeted_users, settings.NOTIFICATION_DELIVERY_CHUNK_SIZE),
+                lambda user_ids: NotificationService.deliver_to_users(notification, user_ids),
+                label=f"emergency broadcast {broadcast.id}"
+            )
+            
+            # delivered_count and read_count are incremented by client receipts
+            # (ReceiptService.apply_receipts) and segment inbox syncs
             logger.info(f"Emergency broadcast activated: {broadcast.title}")
             
         except Exception as e:
@@ -275,20 +896,23 @@ class EmergencyBroadcastService:
         """
         base_query = User.objects.filter(is_active=True)
         
-        # Geographic filtering (simplified - would need proper location service)
+        # Geographic filtering through the materialized segment memberships
         if broadcast.regions:
-            base_query = base_query.filter(
-                Q(city__in=broadcast.regions) |
-                Q(vendor_profile__city__in=broadcast.regions)
-            ).distinct()
+            base_query = base_query.filter(id__in=segment_member_ids(regions=broadcast.regions))
         
-        # Medical condition filtering
+        # Medical condition and medication filtering via the patient term index
         if broadcast.target_conditions:
-            patients_with_conditions = Patient.objects.filter(
-                chronic_conditions__icontains=broadcast.target_conditions[0]  # Simplified
-            ).values_list('user_id', flat=True)
+            patients_with_conditions = find_user_ids(
+                'condition', broadcast.target_conditions, match=broadcast.medical_match_mode
+            )
             base_query = base_query.filter(id__in=patients_with_conditions)
         
+        if broadcast.target_medications:
+            patients_on_medications = find_user_ids(
+                'medication', broadcast.target_medications, match=broadcast.medical_match_mode
+            )
+            base_query = base_query.filter(id__in=patients_on_medications)
+        
         # Blood type filtering
         if broadcast.target_blood_types:
             patients_with_blood_types = Patient.objects.filter(
@@ -305,9 +929,16 @@ class ShortageAlertService:
         Create shortage alert from prediction
         """
         try:
+            template_context = {
+                'item_name': prediction.medical_item.name,
+                'region': prediction.region,
+                'severity': prediction.severity_level,
+            }
+            text = message_templates.render('shortage_alert', template_context)
             notification_data = {
-                'title': f"Shortage Alert: {prediction.medical_item.name}",
-                'message': f"Potential shortage predicted in {prediction.region}. Severity: {prediction.severity_level}",
+                'title': text['title'],
+                'message': text['message'],
+                'template_context': template_context,
                 'notification_type': 'shortage_alert',
                 'priority': 'high' if prediction.severity_level in ['high', 'critical'] else 'medium',
                 'target_user_types': ['pharmacist', 'vendor', 'doctor'],
@@ -316,8 +947,92 @@ class ShortageAlertService:
                 'related_prediction': prediction,
             }
             
-            return NotificationService.create_notification(notification_data)
+            # Prediction runs repeat the same alert; fold repeats into the first one
+            return NotificationService.create_notification(notification_data, coalesce=True)
             
         except Exception as e:
             logger.error(f"Error creating shortage alert: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+class NotificationRetentionService:
+    """
+    Keeps NotificationRecipient small by moving cold rows (expired
+    notifications, and read rows past NOTIFICATION_READ_RETENTION_DAYS) into
+    ArchivedNotificationRecipient in batches, rolling their delivery stats
+    into NotificationDeliveryRollup.
+    """
+    @staticmethod
+    def get_prunable(read_retention_days=None):
+        if read_retention_days is None:
+            read_retention_days = settings.NOTIFICATION_READ_RETENTION_DAYS
+        now = timezone.now()
+        return NotificationRecipient.objects.filter(
+            Q(notification__expires_at__lt=now) |
+            Q(status='read', read_at__lt=now - timedelta(days=read_retention_days))
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def archive_batch(ids):
+        """
+        Archive and delete one batch of recipient rows by id
+        """
+        rows = list(NotificationRecipient.objects.filter(id__in=ids).values(
+            'id', 'notification_id', 'user_id', 'notification__notification_type',
+            'status', 'read_at', 'delivered_at', 'created_at'
+        ))
+        if not rows:
+            return 0
+        
+        ArchivedNotificationRecipient.objects.bulk_create([
+            ArchivedNotificationRecipient(
+                original_id=row['id'],
+                notification_id=row['notification_id'],
+                user_id=row['user_id'],
+                notification_type=row['notification__notification_type'],
+                status=row['status'],
+                read_at=row['read_at'],
+                delivered_at=row['delivered_at'],
+                created_at=row['created_at']
+            )
+            for row in rows
+        ], ignore_conflicts=True)
+        
+        rollups = Counter(
+            (row['created_at'].date(), row['notification__notification_type'], row['status'])
+            for row in rows
+        )
+        for (date, notification_type, status), count in rollups.items():
+            updated = NotificationDeliveryRollup.objects.filter(
+                date=date, notification_type=notification_type, status=status
+            ).update(count=F('count') + count)
+            if not updated:
+                NotificationDeliveryRollup.objects.create(
+                    date=date, notification_type=notification_type, status=status, count=count
+                )
+        
+        # A plain DELETE: Model.delete() would load every row to send post_delete
+        # signals, so counters are reconciled once per batch instead. Nothing
+        # references recipient rows, so there are no cascades to skip.
+        batch = NotificationRecipient.objects.filter(id__in=[row['id'] for row in rows])
+        batch._raw_delete(batch.db)
+        NotificationCounterService.reconcile_users({row['user_id'] for row in rows})
+        
+        return len(rows)
+    
+    @staticmethod
+    def prune(batch_size=2000, read_retention_days=None):
+        """
+        Archive all prunable rows in batches. Returns the number of rows moved.
+        """
+        prunable = NotificationRetentionService.get_prunable(read_retention_days)
+        archived = 0
+        
+        while True:
+            ids = list(prunable.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            archived += NotificationRetentionService.archive_batch(ids)
+        
+        logger.info(f"Archived {archived} notification recipient rows")
+        return archived
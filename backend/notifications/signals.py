@@ -0,0 +1,89 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.db import transaction
+from django.contrib.auth import get_user_model
+from inventory.models import Vendor
+from .models import Notification, NotificationRecipient, AudienceSegmentMember
+from .services import NotificationCounterService
+from .pubsub import broker, recipient_event
+from .segments import SEGMENT_FIELDS, index_user
+
+User = get_user_model()
+
+@receiver(post_init, sender=NotificationRecipient)
+def remember_recipient_status(sender, instance, **kwargs):
+    """
+    Remember the loaded status so status transitions can be detected on save
+    """
+    instance._loaded_status = instance.status
+
+@receiver(post_save, sender=NotificationRecipient)
+def update_counters_on_save(sender, instance, created, **kwargs):
+    """
+    Keep per-user badge counters in sync with single-row saves
+    """
+    if created:
+        NotificationCounterService.adjust(
+            instance.user_id,
+            **NotificationCounterService.deltas_for(
+                instance.notification.notification_type, instance.status
+            )
+        )
+    else:
+        was_unread = instance._loaded_status in NotificationRecipient.UNREAD_STATUSES
+        is_unread = instance.status in NotificationRecipient.UNREAD_STATUSES
+        if was_unread != is_unread:
+            NotificationCounterService.adjust(instance.user_id, unread_count=1 if is_unread else -1)
+
+    # Push to connected inbox streams once the row becomes visible as unread
+    if (instance.status in NotificationRecipient.UNREAD_STATUSES
+            and (created or instance._loaded_status not in NotificationRecipient.UNREAD_STATUSES)):
+        event = recipient_event(instance)
+        transaction.on_commit(lambda: broker.publish(instance.user_id, event))
+
+    instance._loaded_status = instance.status
+
+@receiver(post_delete, sender=NotificationRecipient)
+def update_counters_on_delete(sender, instance, **kwargs):
+    """
+    Remove a deleted row's contribution from the counters
+    """
+    notification_type = Notification.objects.filter(
+        pk=instance.notification_id
+    ).values_list('notification_type', flat=True).first()
+
+    # Never seed a counter here: the user itself may be in the middle of deletion
+    NotificationCounterService.adjust(
+        instance.user_id,
+        seed=False,
+        **NotificationCounterService.deltas_for(notification_type, instance._loaded_status, sign=-1)
+    )
+
+@receiver(post_save, sender=User)
+def index_user_segments(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the user's audience segment memberships current. Saves limited to
+    other fields (e.g. last_login on every sign-in) leave them unchanged.
+    """
+    if update_fields is not None and not SEGMENT_FIELDS.intersection(update_fields):
+        return
+    index_user(instance)
+
+@receiver(post_save, sender=Vendor)
+def index_vendor_segments(sender, instance, **kwargs):
+    """
+    A vendor's city is one of its owner's regions
+    """
+    user = User.objects.filter(pk=instance.user_id).first()
+    if user is not None:
+        index_user(user)
+
+@receiver(post_delete, sender=Vendor)
+def drop_vendor_segments(sender, instance, **kwargs):
+    """
+    Only delete here: this also runs while the owning user is being deleted,
+    when nothing may be re-inserted for them
+    """
+    AudienceSegmentMember.objects.filter(
+        user_id=instance.user_id, region=instance.city
+    ).exclude(user__city=instance.city).delete()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse, JsonResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from .models import NotificationRecipient
+from .pubsub import broker, InboxEvent, recipient_event
+from .services import SegmentNotificationService
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 20
+REPLAY_LIMIT = 500
+
+def format_event(event):
+    """
+    Encode an InboxEvent in text/event-stream format
+    """
+    lines = []
+    if event.id is not None:
+        lines.append(f"id: {event.id}")
+    lines.append(f"event: {event.event}")
+    lines.append(f"data: {json.dumps(event.data)}")
+    return "\n".join(lines) + "\n\n"
+
+def authenticate_stream(request):
+    """
+    Authenticate with the usual Bearer header, or a ?token= query parameter
+    since browser EventSource cannot set headers
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, TokenError):
+        return None
+
+def get_stream_context(user):
+    """
+    Merge pending segment notifications and collect the regions used for
+    segment matching, once per connection
+    """
+    SegmentNotificationService.sync_inbox(user)
+    return SegmentNotificationService.get_user_regions(user)
+
+def replay_events(user, last_event_id):
+    """
+    Events the client missed since Last-Event-ID
+    """
+    recipients = NotificationRecipient.objects.filter(
+        user=user,
+        id__gt=last_event_id
+    ).select_related('notification').order_by('id')[:REPLAY_LIMIT]
+    return [recipient_event(recipient) for recipient in recipients]
+
+async def event_stream(user, last_event_id=None):
+    """
+    Yield replayed events, then live events from the broker with periodic
+    keep-alive comments. Idle connections cost one queue and one parked task.
+    """
+    regions = await sync_to_async(get_stream_context)(user)
+    subscription = broker.subscribe(user.id, user.user_type, regions)
+    try:
+        yield "retry: 5000\n\n"
+
+        if last_event_id is not None:
+            for event in await sync_to_async(replay_events)(user, last_event_id):
+                last_event_id = event.id
+                yield format_event(event)
+
+        while True:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                # Events were dropped; the client should refetch its inbox
+                yield format_event(InboxEvent('resync', {}))
+                continue
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            # Skip rows already sent during replay
+            if event.id is not None and last_event_id is not None and event.id <= last_event_id:
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+async def inbox_stream(request):
+    """
+    Server-sent event stream of new notifications for the current user.
+    Supports resume through the Last-Event-ID header (or ?last_event_id=).
+    Serve under ASGI (e.g. uvicorn backend.asgi:application) so idle
+    connections do not hold a worker thread.
+    """
+    user = await sync_to_async(authenticate_stream)(request)
+    if user is None or not user.is_active:
+        return JsonResponse({'error': 'Authentication credentials were not provided'}, status=401)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(
+        event_stream(user, last_event_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
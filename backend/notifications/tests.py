@@ -1,3 +1,1043 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO
+from importlib import import_module
+import asyncio
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from rest_framework import status
 
-# Create your tests here.
+from notifications.models import (
+    Notification, NotificationRecipient, EmergencyBroadcast, UserNotificationCounter,
+    NotificationDigestEntry, ArchivedNotificationRecipient, NotificationDeliveryRollup,
+    AudienceSegmentMember, UserInboxCursor, NotificationCounterTotals
+)
+from notifications.services import (
+    NotificationService, EmergencyBroadcastService, ShortageAlertService, DigestService,
+    NotificationRetentionService, SegmentNotificationService, NotificationCounterService
+)
+from inventory.models import MedicalItem, Vendor, Inventory
+from notifications.segments import iter_segment_member_ids
+from notifications.lanes import DeliveryDispatcher, lane_for
+from notifications.throttling import SlidingWindowCounter, throttle
+from notifications.gateways import install_fake_gateways, uninstall_gateways, get_gateway
+from notifications.loadtest import QueryCounter, generate_users, run_benchmark
+from notifications.message_templates import registry, render_for_users
+import threading
+import time
+from mcp.models import ShortagePrediction
+from notifications.pubsub import broker
+from notifications.streams import event_stream
+
+User = get_user_model()
+
+class NotificationDeliveryStatsTestCase(TestCase):
+    """Test cases for annotated notification delivery statistics"""
+
+    def setUp(self):
+        """Set up an admin client and a few recipients"""
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            username='statsadmin',
+            password='adminpass123',
+            user_type='admin',
+            is_staff=True
+        )
+        self.client.force_authenticate(user=self.admin)
+
+        self.users = [
+            User.objects.create_user(username=f'recipient{i}', password='testpass123')
+            for i in range(4)
+        ]
+
+    def create_notification(self, statuses):
+        notification = Notification.objects.create(
+            title='Stock update',
+            message='Insulin restocked',
+            notification_type='stock_update'
+        )
+        for user, recipient_status in zip(self.users, statuses):
+            NotificationRecipient.objects.create(
+                notification=notification,
+                user=user,
+                status=recipient_status
+            )
+        return notification
+
+    def test_delivery_stats_annotation(self):
+        """Per-status counts are annotated in one query"""
+        notification = self.create_notification(['sent', 'read', 'read', 'failed'])
+
+        with self.assertNumQueries(1):
+            annotated = Notification.objects.with_delivery_stats().get(pk=notification.pk)
+            stats = annotated.get_delivery_stats()
+
+        self.assertEqual(stats, {'pending': 0, 'sent': 1, 'delivered': 0, 'read': 2, 'failed': 1})
+
+    def test_admin_list_issues_fixed_number_of_queries(self):
+        """The admin list query count does not grow with the page size"""
+        self.create_notification(['sent', 'read'])
+
+        with CaptureQueriesContext(connection) as single:
+            response = self.client.get('/api/notifications/notifications/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for _ in range(5):
+            self.create_notification(['sent', 'delivered', 'read', 'failed'])
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/api/notifications/notifications/')
+
+        self.assertEqual(len(single), len(many))
+        first = response.json()['results'][0]
+        self.assertEqual(first['recipients_count'], 4)
+        self.assertEqual(first['read_count'], 1)
+        self.assertEqual(first['delivery_status']['failed'], 1)
+
+    def test_user_inbox_issues_fixed_number_of_queries(self):
+        """The nested inbox serializer uses the prefetched annotations"""
+        self.create_notification(['sent'])
+        user_client = APIClient()
+        user_client.force_authenticate(user=self.users[0])
+        # The first read creates the user's inbox cursor
+        user_client.get('/api/notifications/my-notifications/')
+
+        with CaptureQueriesContext(connection) as single:
+            user_client.get('/api/notifications/my-notifications/')
+
+        for _ in range(5):
+            self.create_notification(['delivered', 'read'])
+
+        with CaptureQueriesContext(connection) as many:
+            response = user_client.get('/api/notifications/my-notifications/')
+
+        self.assertEqual(len(single), len(many))
+        self.assertEqual(response.json()['count'], 6)
+        details = response.json()['results'][0]['notification_details']
+        self.assertNotIn('recipients', details)
+        self.assertEqual(details['recipients_count'], 2)
+
+@override_settings(NOTIFICATION_FANOUT_ON_READ_THRESHOLD=3)
+class SegmentFanoutTestCase(TestCase):
+    """Test cases for fan-out-on-read of large audiences"""
+
+    def setUp(self):
+        """Set up users in two regions"""
+        self.lagos_users = [
+            User.objects.create_user(username=f'lagos{i}', password='testpass123', city='Lagos')
+            for i in range(3)
+        ]
+        self.abuja_user = User.objects.create_user(username='abuja', password='testpass123', city='Abuja')
+
+    def get_inbox(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get('/api/notifications/my-notifications/').json()
+
+    def test_large_audience_is_stored_once(self):
+        """No recipient rows are written until a user reads their inbox"""
+        notification = NotificationService.create_notification({
+            'title': 'Health tip',
+            'message': 'Drink clean water',
+            'notification_type': 'health_tip',
+            'target_regions': ['Lagos'],
+        })
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.delivery_mode, 'segment')
+        self.assertTrue(notification.is_sent)
+        self.assertEqual(NotificationRecipient.objects.count(), 0)
+
+        inbox = self.get_inbox(self.lagos_users[0])
+        self.assertEqual(inbox['count'], 1)
+        self.assertEqual(inbox['results'][0]['notification'], notification.id)
+
+        # Repeated reads do not duplicate rows; other regions never see it
+        self.get_inbox(self.lagos_users[0])
+        self.assertEqual(self.get_inbox(self.abuja_user)['count'], 0)
+        self.assertEqual(NotificationRecipient.objects.count(), 1)
+
+    def test_sync_without_pending_notifications_is_read_only(self):
+        """Inbox reads with nothing new run one query and write nothing"""
+        with self.assertNumQueries(1):
+            self.assertEqual(SegmentNotificationService.sync_inbox(self.abuja_user), 0)
+        self.assertFalse(UserInboxCursor.objects.exists())
+
+        NotificationService.create_notification({
+            'title': 'Health tip',
+            'message': 'Drink clean water',
+            'notification_type': 'health_tip',
+            'target_regions': ['Lagos'],
+        })
+        self.assertEqual(SegmentNotificationService.sync_inbox(self.lagos_users[0]), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(SegmentNotificationService.sync_inbox(self.lagos_users[0]), 0)
+
+    def test_small_audience_fans_out_on_write(self):
+        """Audiences below the threshold still get rows at send time"""
+        notification = NotificationService.create_notification({
+            'title': 'Clinic closed',
+            'message': 'Closed today',
+            'notification_type': 'system_alert',
+            'target_regions': ['Abuja'],
+        })
+
+        self.assertEqual(notification.delivery_mode, 'direct')
+        self.assertEqual(NotificationRecipient.objects.filter(notification=notification).count(), 1)
+
+    def test_nationwide_broadcast_uses_segment(self):
+        """A broadcast without medical targeting above the threshold fans out on read"""
+        broadcast = EmergencyBroadcast.objects.create(
+            title='Flooding',
+            message='Avoid low-lying areas',
+            emergency_type='natural_disaster',
+            urgency_level='critical',
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+        EmergencyBroadcastService.activate_broadcast(broadcast)
+
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.total_recipients, 4)
+        self.assertEqual(NotificationRecipient.objects.count(), 0)
+        self.assertEqual(self.get_inbox(self.abuja_user)['count'], 1)
+
+        # Materializing the row on read counts as delivery
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.delivered_count, 1)
+
+    def test_concurrent_syncs_apply_deltas_once(self):
+        """A sync that read the cursor before another advanced it adds nothing"""
+        user = self.lagos_users[0]
+        NotificationService.create_notification({
+            'title': 'Health tip',
+            'message': 'Drink clean water',
+            'notification_type': 'health_tip',
+            'target_regions': ['Lagos'],
+        })
+        stale_cursor = UserInboxCursor.objects.create(user=user)
+
+        self.assertEqual(SegmentNotificationService.sync_inbox(user), 1)
+        with mock.patch.object(UserInboxCursor.objects, 'get_or_create', return_value=(stale_cursor, False)):
+            self.assertEqual(SegmentNotificationService.sync_inbox(user), 0)
+
+        counter = UserNotificationCounter.objects.get(user=user)
+        self.assertEqual((counter.total_count, counter.unread_count), (1, 1))
+
+class NotificationCounterTestCase(TestCase):
+    """Test cases for incrementally maintained badge counters"""
+
+    def setUp(self):
+        """Set up a patient with a mix of notifications"""
+        self.patient = User.objects.create_user(username='badge', password='testpass123', user_type='patient')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+        for notification_type in ['emergency_broadcast', 'shortage_alert', 'health_tip']:
+            notification = Notification.objects.create(
+                title=notification_type,
+                message='Message',
+                notification_type=notification_type
+            )
+            NotificationRecipient.objects.create(notification=notification, user=self.patient, status='sent')
+
+    def counter(self):
+        return UserNotificationCounter.objects.get(user=self.patient)
+
+    def test_counters_follow_inserts_and_status_changes(self):
+        """Inserts and single-row reads adjust the counters"""
+        counter = self.counter()
+        self.assertEqual(
+            (counter.total_count, counter.unread_count, counter.emergency_count, counter.shortage_count),
+            (3, 3, 1, 1)
+        )
+
+        recipient = NotificationRecipient.objects.filter(user=self.patient).first()
+        response = self.client.post(f'/api/notifications/my-notifications/{recipient.id}/read/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counter().unread_count, 2)
+
+        self.client.post('/api/notifications/my-notifications/mark-all-read/')
+        self.assertEqual(self.counter().unread_count, 0)
+
+    def test_stats_read_counters(self):
+        """The badge endpoint is served from the counter row"""
+        self.client.get('/api/notifications/stats/')  # warm the inbox cursor
+
+        # Pending segment check (no write) and the counter row
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/notifications/stats/')
+
+        self.assertEqual(response.json()['unread_count'], 3)
+        self.assertEqual(response.json()['emergency_alerts'], 1)
+
+    def test_totals_follow_adjustments(self):
+        """Admin totals are one row read, kept in step with the per-user counters"""
+        self.assertEqual(NotificationCounterService.get_totals()['unread_count'], 3)
+
+        other = User.objects.create_user(username='other', password='testpass123')
+        notification = Notification.objects.create(title='Tip', message='Message', notification_type='health_tip')
+        NotificationRecipient.objects.create(notification=notification, user=other, status='sent')
+        NotificationRecipient.objects.create(notification=notification, user=self.patient, status='read')
+
+        with self.assertNumQueries(1):
+            totals = NotificationCounterService.get_totals()
+        self.assertEqual((totals['total_count'], totals['unread_count']), (5, 4))
+
+        NotificationCounterTotals.objects.update(unread_count=42)
+        call_command('reconcile_notification_counters', stdout=StringIO())
+        self.assertEqual(NotificationCounterService.get_totals()['unread_count'], 4)
+
+    def test_reconcile_repairs_drift(self):
+        """The reconcile command recomputes counters from the source table"""
+        UserNotificationCounter.objects.filter(user=self.patient).update(unread_count=42, total_count=0)
+
+        call_command('reconcile_notification_counters', stdout=StringIO())
+
+        counter = self.counter()
+        self.assertEqual((counter.total_count, counter.unread_count), (3, 3))
+
+    def test_migration_backfills_counters(self):
+        """The data migration seeds counters for recipients that predate them"""
+        from django.apps import apps
+        backfill = import_module('notifications.migrations.0014_backfill_notification_counters')
+        UserNotificationCounter.objects.all().delete()
+        NotificationCounterTotals.objects.all().delete()
+
+        backfill.backfill_notification_counters(apps, None)
+
+        counter = self.counter()
+        self.assertEqual(
+            (counter.total_count, counter.unread_count, counter.emergency_count, counter.shortage_count),
+            (3, 3, 1, 1)
+        )
+        self.assertEqual(NotificationCounterTotals.objects.get().unread_count, 3)
+
+class InboxStreamTestCase(TestCase):
+    """Test cases for the server-sent inbox stream"""
+
+    def setUp(self):
+        """Set up a user with one existing notification"""
+        self.user = User.objects.create_user(username='streamer', password='testpass123', city='Lagos')
+        self.first = self.create_recipient('Earlier alert')
+
+    def create_recipient(self, title):
+        notification = Notification.objects.create(
+            title=title,
+            message='Message',
+            notification_type='system_alert'
+        )
+        return NotificationRecipient.objects.create(notification=notification, user=self.user, status='sent')
+
+    def test_requires_authentication(self):
+        """Anonymous clients are rejected"""
+        response = self.client.get('/api/notifications/my-notifications/stream/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_resume_from_last_event_id(self):
+        """Rows after Last-Event-ID are replayed in order"""
+        second = self.create_recipient('Missed alert')
+
+        async def read_replay():
+            stream = event_stream(self.user, last_event_id=self.first.id)
+            chunks = [await stream.__anext__() for _ in range(2)]
+            await stream.aclose()
+            return chunks
+
+        retry, replayed = async_to_sync(read_replay)()
+        self.assertTrue(retry.startswith('retry:'))
+        self.assertIn(f'id: {second.id}', replayed)
+        self.assertIn('Missed alert', replayed)
+        self.assertEqual(broker.connection_count(), 0)
+
+    def test_live_rows_are_pushed(self):
+        """New recipient rows are published to connected streams"""
+        def deliver():
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.create_recipient('Live alert')
+
+        async def read_live():
+            stream = event_stream(self.user)
+            await stream.__anext__()  # subscribed once the retry hint is sent
+            recipient = await sync_to_async(deliver)()
+            chunk = await asyncio.wait_for(stream.__anext__(), timeout=5)
+            await stream.aclose()
+            return recipient, chunk
+
+        recipient, chunk = async_to_sync(read_live)()
+        self.assertIn(f'id: {recipient.id}', chunk)
+        self.assertIn('Live alert', chunk)
+
+class ShortageAlertCoalescingTestCase(TestCase):
+    """Test cases for coalescing repeated shortage alerts"""
+
+    def setUp(self):
+        """Set up the medical item shortage predictions refer to"""
+        self.insulin = MedicalItem.objects.create(name='Insulin', category='medication', unit_of_measure='vials')
+
+    def create_prediction(self, severity_level, days_ahead=7):
+        return ShortagePrediction.objects.create(
+            medical_item=self.insulin,
+            region='Lagos',
+            predicted_shortage_date=timezone.now() + timedelta(days=days_ahead),
+            confidence_score=0.9,
+            severity_level=severity_level,
+            predicted_shortage_duration=5
+        )
+
+    def test_repeats_update_the_original(self):
+        """Repeats within the window do not fan out again"""
+        first = ShortageAlertService.create_shortage_alert(self.create_prediction('medium', 7))
+        repeat = ShortageAlertService.create_shortage_alert(self.create_prediction('medium', 8))
+
+        self.assertEqual(first.id, repeat.id)
+        self.assertEqual(Notification.objects.filter(notification_type='shortage_alert').count(), 1)
+
+        first.refresh_from_db()
+        self.assertEqual(first.occurrence_count, 2)
+        self.assertIsNotNone(first.last_occurred_at)
+
+    def test_escalation_raises_priority(self):
+        """An escalated repeat updates the priority of the original"""
+        first = ShortageAlertService.create_shortage_alert(self.create_prediction('medium', 7))
+        with self.captureOnCommitCallbacks(execute=True):
+            ShortageAlertService.create_shortage_alert(self.create_prediction('critical', 2))
+
+        first.refresh_from_db()
+        self.assertEqual(first.priority, 'high')
+        self.assertEqual(first.occurrence_count, 2)
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW_MINUTES=0)
+    def test_outside_window_creates_new_alert(self):
+        """Once the window has passed, a fresh alert is sent"""
+        ShortageAlertService.create_shortage_alert(self.create_prediction('medium', 7))
+        ShortageAlertService.create_shortage_alert(self.create_prediction('medium', 8))
+
+        self.assertEqual(Notification.objects.filter(notification_type='shortage_alert').count(), 2)
+
+class DigestBatchingTestCase(TestCase):
+    """Test cases for per-user digest batching of routine notifications"""
+
+    def setUp(self):
+        """Set up a user reachable on every channel"""
+        throttle.clear()
+        self.user = User.objects.create_user(
+            username='digest', password='testpass123', email='digest@example.com', phone_number='+234100000000'
+        )
+
+    def deliver(self, notification_type, priority='medium'):
+        notification = Notification.objects.create(
+            title=f'{notification_type} {priority}',
+            message='Message',
+            notification_type=notification_type,
+            priority=priority
+        )
+        NotificationService.deliver_to_user(notification, self.user)
+        return notification
+
+    @mock.patch.object(NotificationService, 'send_sms_notification', return_value=True)
+    def test_routine_traffic_is_batched(self, send_sms):
+        """Routine notifications skip external channels until the digest flush"""
+        for _ in range(3):
+            self.deliver('health_tip')
+        self.deliver('shortage_alert', priority='low')
+
+        send_sms.assert_not_called()
+        self.assertEqual(NotificationDigestEntry.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(NotificationRecipient.objects.filter(user=self.user, sent_via_in_app=True).count(), 4)
+
+        self.assertEqual(DigestService.flush_digests('hourly'), 1)
+        send_sms.assert_called_once()
+        self.assertIn('4 new updates', send_sms.call_args[0][0].title)
+        self.assertFalse(NotificationDigestEntry.objects.filter(flushed_at__isnull=True).exists())
+
+    @mock.patch.object(NotificationService, 'send_sms_notification', return_value=True)
+    def test_critical_and_emergency_bypass_digest(self, send_sms):
+        """Critical and emergency traffic is sent immediately"""
+        self.deliver('stock_update', priority='critical')
+        self.deliver('emergency_broadcast', priority='high')
+
+        self.assertEqual(send_sms.call_count, 2)
+        self.assertFalse(NotificationDigestEntry.objects.exists())
+
+    def test_daily_users_are_not_flushed_hourly(self):
+        """Each user's digest_frequency decides which flush sends their digest"""
+        self.deliver('health_tip')
+        self.user.notification_preferences.digest_frequency = 'daily'
+        self.user.notification_preferences.save()
+
+        self.assertEqual(DigestService.flush_digests('hourly'), 0)
+        self.assertEqual(DigestService.flush_digests('daily'), 1)
+
+    def test_failed_digest_stays_pending(self):
+        """Entries are marked flushed per user, with that user's digest"""
+        other = User.objects.create_user(username='digest2', password='testpass123', email='digest2@example.com')
+        notification = self.deliver('health_tip')
+        NotificationService.deliver_to_user(notification, other)
+
+        def fail_for_first_user(user, entries, preferences):
+            if user == self.user:
+                raise ConnectionError('SMS gateway down')
+
+        with mock.patch.object(DigestService, 'send_digest', side_effect=fail_for_first_user):
+            self.assertEqual(DigestService.flush_digests('hourly'), 1)
+
+        pending = NotificationDigestEntry.objects.filter(flushed_at__isnull=True)
+        self.assertEqual(list(pending.values_list('user_id', flat=True)), [self.user.id])
+
+class NotificationRetentionTestCase(TestCase):
+    """Test cases for archiving cold recipient rows"""
+
+    def setUp(self):
+        """Set up a user with expired, old read and fresh notifications"""
+        self.user = User.objects.create_user(username='retention', password='testpass123')
+        now = timezone.now()
+
+        self.expired = self.create_recipient('Expired', expires_at=now - timedelta(days=1))
+        self.old_read = self.create_recipient('Old read', status='read', read_at=now - timedelta(days=200))
+        self.recent_read = self.create_recipient('Recent read', status='read', read_at=now - timedelta(days=1))
+        self.unread = self.create_recipient('Unread')
+
+    def create_recipient(self, title, status='delivered', read_at=None, expires_at=None):
+        notification = Notification.objects.create(
+            title=title,
+            message='Message',
+            notification_type='stock_update',
+            expires_at=expires_at
+        )
+        return NotificationRecipient.objects.create(
+            notification=notification, user=self.user, status=status, read_at=read_at
+        )
+
+    def test_prune_moves_cold_rows_in_batches(self):
+        """Expired and old read rows are archived; live rows stay"""
+        archived = NotificationRetentionService.prune(batch_size=1)
+
+        self.assertEqual(archived, 2)
+        self.assertEqual(
+            set(NotificationRecipient.objects.values_list('id', flat=True)),
+            {self.recent_read.id, self.unread.id}
+        )
+        self.assertEqual(
+            set(ArchivedNotificationRecipient.objects.values_list('original_id', flat=True)),
+            {self.expired.id, self.old_read.id}
+        )
+        self.assertEqual(
+            NotificationDeliveryRollup.objects.filter(notification_type='stock_update').aggregate(
+                total=Sum('count'))['total'],
+            2
+        )
+
+    def test_prune_reconciles_counters(self):
+        """Counters drop the archived rows without per-row signals"""
+        NotificationRetentionService.prune()
+
+        counter = UserNotificationCounter.objects.get(user=self.user)
+        self.assertEqual(counter.total_count, 2)
+        self.assertEqual(counter.unread_count, 1)
+
+    def test_prune_command(self):
+        """The management command honors the retention override"""
+        out = StringIO()
+        call_command('prune_notifications', '--read-retention-days', '0', stdout=out)
+
+        self.assertIn('Archived 3', out.getvalue())
+        self.assertEqual(NotificationRecipient.objects.get().id, self.unread.id)
+
+class AudienceSegmentTestCase(TestCase):
+    """Test cases for materialized (user_type x region) segments"""
+
+    def setUp(self):
+        """Set up pharmacists and patients across two cities"""
+        self.lagos_pharmacist = User.objects.create_user(
+            username='lagos_pharm', password='testpass123', user_type='pharmacist', city='Lagos'
+        )
+        self.abuja_pharmacist = User.objects.create_user(
+            username='abuja_pharm', password='testpass123', user_type='pharmacist', city='Abuja'
+        )
+        self.lagos_patient = User.objects.create_user(
+            username='lagos_patient', password='testpass123', user_type='patient', city='Lagos'
+        )
+        self.vendor_user = User.objects.create_user(
+            username='vendor', password='testpass123', user_type='vendor', city='Ibadan'
+        )
+        self.vendor = Vendor.objects.create(
+            user=self.vendor_user,
+            vendor_type='pharmacy',
+            business_name='Lagos Pharmacy',
+            business_license='SEG001',
+            address='1 Marina',
+            city='Lagos',
+            contact_person='Contact',
+            contact_email='vendor@example.com',
+            contact_phone='+234100000001'
+        )
+
+    def members(self, user_types=None, regions=None):
+        return list(iter_segment_member_ids(user_types, regions, chunk_size=1))
+
+    def test_segments_include_vendor_city(self):
+        """Users are members through their own city and their vendor city"""
+        self.assertEqual(
+            self.members(['pharmacist', 'vendor'], ['Lagos']),
+            sorted([self.lagos_pharmacist.id, self.vendor_user.id])
+        )
+        self.assertEqual(self.members(regions=['Ibadan', 'Lagos']), sorted([
+            self.lagos_pharmacist.id, self.lagos_patient.id, self.vendor_user.id
+        ]))
+
+    def test_memberships_follow_saves(self):
+        """Moving, deactivating and dropping a vendor update the segments"""
+        self.abuja_pharmacist.city = 'Lagos'
+        self.abuja_pharmacist.save()
+        self.lagos_patient.is_active = False
+        self.lagos_patient.save()
+        self.vendor.delete()
+
+        self.assertEqual(self.members(regions=['Lagos']), sorted([
+            self.lagos_pharmacist.id, self.abuja_pharmacist.id
+        ]))
+        self.assertEqual(self.members(regions=['Ibadan']), [self.vendor_user.id])
+
+    def test_login_saves_skip_reindexing(self):
+        """Saves limited to non-segment fields, such as last_login, run no segment queries"""
+        self.lagos_patient.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            self.lagos_patient.save(update_fields=['last_login'])
+
+        self.lagos_patient.city = 'Abuja'
+        self.lagos_patient.save(update_fields=['city'])
+        self.assertEqual(self.members(regions=['Abuja']), sorted([self.abuja_pharmacist.id, self.lagos_patient.id]))
+
+    def test_deleting_vendor_user(self):
+        """Deleting a user with a vendor profile removes every membership"""
+        self.vendor_user.delete()
+        self.assertFalse(AudienceSegmentMember.objects.filter(user_id=self.vendor_user.id).exists())
+
+    def test_migration_backfills_existing_users(self):
+        """Users saved before the segment table existed are indexed by the data migration"""
+        from django.apps import apps
+        backfill = import_module('notifications.migrations.0012_backfill_audience_segments')
+        expected = self.members(regions=['Ibadan', 'Lagos', 'Abuja'])
+        AudienceSegmentMember.objects.all().delete()
+
+        backfill.backfill_audience_segments(apps, None)
+        self.assertEqual(self.members(regions=['Ibadan', 'Lagos', 'Abuja']), expected)
+
+    def test_recipients_use_segments(self):
+        """Regional targeting reads the segment table, not a join over users"""
+        notification = Notification(
+            title='Regional',
+            message='Message',
+            notification_type='system_update',
+            target_user_types=['pharmacist', 'vendor'],
+            target_regions=['Lagos']
+        )
+        recipients = NotificationService.get_recipients_for_notification(notification)
+
+        self.assertNotIn('inventory_vendor', str(recipients.query))
+        self.assertEqual(
+            set(recipients.values_list('id', flat=True)),
+            {self.lagos_pharmacist.id, self.vendor_user.id}
+        )
+
+class BulkReceiptTestCase(TestCase):
+    """Test cases for batched delivery and read receipts"""
+
+    def setUp(self):
+        """Set up an activated emergency broadcast with three recipients"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='receipts', password='testpass123', city='Lagos')
+        self.other_user = User.objects.create_user(username='other', password='testpass123', city='Lagos')
+        self.client.force_authenticate(user=self.user)
+
+        self.broadcast = EmergencyBroadcast.objects.create(
+            title='Outbreak',
+            message='Stay indoors',
+            emergency_type='disease_outbreak',
+            urgency_level='critical',
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+        self.recipients = []
+        for index in range(3):
+            notification = Notification.objects.create(
+                title=f'Alert {index}',
+                message='Message',
+                notification_type='emergency_broadcast',
+                related_broadcast=self.broadcast
+            )
+            self.recipients.append(NotificationRecipient.objects.create(
+                notification=notification, user=self.user, status='sent'
+            ))
+        self.foreign = NotificationRecipient.objects.create(
+            notification=notification, user=self.other_user, status='sent'
+        )
+
+    def post_receipts(self, receipts):
+        return self.client.post(
+            '/api/notifications/my-notifications/receipts/', {'receipts': receipts}, format='json'
+        )
+
+    def test_batch_applies_with_fixed_queries(self):
+        """A batch is applied with a constant number of statements"""
+        read_time = timezone.now() - timedelta(minutes=5)
+        receipts = [
+            {'id': self.recipients[0].id, 'status': 'delivered'},
+            {'id': self.recipients[1].id, 'status': 'read', 'timestamp': read_time.isoformat()},
+            {'id': self.recipients[2].id, 'status': 'read'},
+            {'id': self.foreign.id, 'status': 'read'},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_receipts(receipts)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['applied'], 3)
+        self.assertEqual(response.data['ignored'], 1)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "notifications_notificationrecipient"')]
+        self.assertEqual(len(updates), 2)
+
+        read_row = NotificationRecipient.objects.get(id=self.recipients[1].id)
+        self.assertEqual(read_row.status, 'read')
+        self.assertEqual(read_row.read_at, read_time)
+        self.assertEqual(read_row.delivered_at, read_time)
+        self.assertEqual(NotificationRecipient.objects.get(id=self.foreign.id).status, 'sent')
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.delivered_count, 3)
+        self.assertEqual(self.broadcast.read_count, 2)
+        self.assertEqual(UserNotificationCounter.objects.get(user=self.user).unread_count, 1)
+
+    def test_receipts_only_move_forward(self):
+        """Repeated and backwards receipts are not counted twice"""
+        self.post_receipts([{'id': self.recipients[0].id, 'status': 'read'}])
+        response = self.post_receipts([
+            {'id': self.recipients[0].id, 'status': 'delivered'},
+            {'id': self.recipients[0].id, 'status': 'read'},
+        ])
+
+        self.assertEqual(response.data['applied'], 0)
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.delivered_count, 1)
+        self.assertEqual(self.broadcast.read_count, 1)
+
+    def test_read_endpoints_count_as_receipts(self):
+        """Marking one or all notifications read updates the broadcast's counts"""
+        response = self.client.post(f'/api/notifications/my-notifications/{self.recipients[0].id}/read/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.delivered_count, self.broadcast.read_count), (1, 1))
+
+        self.client.post('/api/notifications/my-notifications/mark-all-read/')
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.delivered_count, len(self.recipients))
+        self.assertEqual(self.broadcast.read_count, len(self.recipients))
+        self.assertEqual(UserNotificationCounter.objects.get(user=self.user).unread_count, 0)
+
+        response = self.client.post(f'/api/notifications/my-notifications/{self.foreign.id}/read/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rejects_empty_batch(self):
+        """An empty batch is a validation error"""
+        response = self.post_receipts([])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class DeliveryLaneTestCase(TestCase):
+    """Test cases for priority lanes in the delivery dispatcher"""
+
+    def start_job(self, dispatcher, lane, chunks, handler):
+        done = threading.Event()
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatcher.submit(lane, chunks, handler, on_complete=done.set, label=lane)
+        return done
+
+    def test_lane_selection(self):
+        """Broadcast urgency and notification priority pick the lane"""
+        notification = Notification(priority='low')
+        broadcast = EmergencyBroadcast(urgency_level='life_threatening')
+
+        self.assertEqual(lane_for(notification), 'bulk')
+        self.assertEqual(lane_for(Notification(priority='critical')), 'critical')
+        self.assertEqual(lane_for(notification, broadcast), 'critical')
+
+    def test_critical_preempts_bulk_between_chunks(self):
+        """A shared worker switches to critical work at the next chunk boundary"""
+        dispatcher = DeliveryDispatcher(workers=1, reserved_critical_workers=0)
+        handled = []
+        bulk_started = threading.Event()
+
+        def bulk(chunk):
+            handled.append(('bulk', chunk))
+            bulk_started.set()
+            time.sleep(0.005)
+
+        try:
+            bulk_done = self.start_job(dispatcher, 'bulk', ([index] for index in range(200)), bulk)
+            bulk_started.wait(5)
+            critical_done = self.start_job(
+                dispatcher, 'critical', [[1], [2]], lambda chunk: handled.append(('critical', chunk))
+            )
+
+            self.assertTrue(critical_done.wait(5))
+            self.assertTrue(bulk_done.wait(10))
+        finally:
+            dispatcher.stop(timeout=5)
+
+        lanes = [lane for lane, _ in handled]
+        self.assertEqual(len(lanes), 202)
+        self.assertLess(lanes.index('critical'), len(lanes) - 100)
+        self.assertEqual(dispatcher.metrics()['critical']['total']['count'], 1)
+
+    def test_wait_idle_and_worker_queries(self):
+        """Callers can wait for queued jobs and count the queries workers run"""
+        dispatcher = DeliveryDispatcher(workers=1)
+        queries = QueryCounter()
+
+        def handler(chunk):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        try:
+            with dispatcher.execute_wrapper(queries):
+                self.start_job(dispatcher, 'bulk', [[1], [2], [3]], handler)
+                self.assertTrue(dispatcher.wait_idle(5))
+        finally:
+            dispatcher.stop(timeout=5)
+
+        self.assertEqual(queries.count, 3)
+        self.assertEqual(dispatcher.metrics()['bulk']['total']['count'], 1)
+
+    def test_reserved_worker_serves_critical_while_bulk_is_busy(self):
+        """Critical work completes even while every shared worker is occupied"""
+        dispatcher = DeliveryDispatcher(workers=2, reserved_critical_workers=1)
+        release = threading.Event()
+        bulk_started = threading.Event()
+
+        def bulk(chunk):
+            bulk_started.set()
+            release.wait(10)
+
+        try:
+            bulk_done = self.start_job(dispatcher, 'bulk', [[1]], bulk)
+            bulk_started.wait(5)
+            critical_done = self.start_job(dispatcher, 'critical', [[1]], lambda chunk: None)
+
+            self.assertTrue(critical_done.wait(5))
+            self.assertFalse(bulk_done.is_set())
+
+            release.set()
+            self.assertTrue(bulk_done.wait(5))
+        finally:
+            release.set()
+            dispatcher.stop(timeout=5)
+
+    def test_reserved_workers_leave_a_shared_worker(self):
+        """Reserving every worker for critical still leaves one to deliver bulk jobs"""
+        dispatcher = DeliveryDispatcher(workers=2, reserved_critical_workers=2)
+        self.assertEqual(dispatcher.reserved_critical_workers, 1)
+        try:
+            bulk_done = self.start_job(dispatcher, 'bulk', [[1], [2]], lambda chunk: None)
+            self.assertTrue(bulk_done.wait(5))
+        finally:
+            dispatcher.stop(timeout=5)
+
+@override_settings(NOTIFICATION_CHANNEL_RATE_LIMITS={'push': 0, 'sms': 2, 'email': 0})
+class NotificationThrottleTestCase(TestCase):
+    """Test cases for per-user channel rate limits"""
+
+    def setUp(self):
+        """Set up a user reachable by SMS"""
+        throttle.clear()
+        self.user = User.objects.create_user(
+            username='throttled', password='testpass123', phone_number='+234100000002'
+        )
+
+    def deliver(self, priority='high'):
+        notification = Notification.objects.create(
+            title=f'Alert {priority}',
+            message='Message',
+            notification_type='shortage_alert',
+            priority=priority
+        )
+        NotificationService.deliver_to_user(notification, self.user)
+        return NotificationRecipient.objects.get(notification=notification, user=self.user)
+
+    def test_sliding_window(self):
+        """The previous window still counts in proportion to its overlap"""
+        now = [0.0]
+        counter = SlidingWindowCounter(clock=lambda: now[0])
+
+        self.assertTrue(counter.hit('key', 2, 60))
+        self.assertTrue(counter.hit('key', 2, 60))
+        self.assertFalse(counter.hit('key', 2, 60))
+
+        now[0] = 75.0  # 75% of the previous window still overlaps: 1.5 < 2
+        self.assertTrue(counter.hit('key', 2, 60))
+        self.assertFalse(counter.hit('key', 2, 60))
+
+        now[0] = 200.0
+        self.assertTrue(counter.hit('key', 2, 60))
+
+    @mock.patch.object(NotificationService, 'send_sms_notification', return_value=True)
+    def test_overflow_goes_to_digest(self, send_sms):
+        """Sends over the limit are shown in-app and queued for the digest"""
+        recipients = [self.deliver() for _ in range(4)]
+
+        self.assertEqual(send_sms.call_count, 2)
+        self.assertEqual([recipient.sent_via_sms for recipient in recipients], [True, True, False, False])
+        self.assertTrue(all(recipient.sent_via_in_app for recipient in recipients))
+        self.assertEqual(NotificationDigestEntry.objects.filter(user=self.user).count(), 2)
+
+    @mock.patch.object(NotificationService, 'send_sms_notification', return_value=True)
+    def test_critical_honors_emergency_override(self, send_sms):
+        """Critical alerts bypass the limit only for users with emergency_override"""
+        for _ in range(2):
+            self.deliver()
+        self.assertTrue(self.deliver(priority='critical').sent_via_sms)
+
+        preferences = self.user.notification_preferences
+        preferences.emergency_override = False
+        preferences.save()
+        recipient = self.deliver(priority='critical')
+
+        self.assertFalse(recipient.sent_via_sms)
+        self.assertTrue(recipient.sent_via_in_app)
+        self.assertEqual(send_sms.call_count, 3)
+        self.assertFalse(NotificationDigestEntry.objects.filter(notification=recipient.notification).exists())
+
+class LoadHarnessTestCase(TestCase):
+    """Test cases for the fake gateways and the fan-out benchmark"""
+
+    def tearDown(self):
+        uninstall_gateways()
+
+    def test_failure_injection(self):
+        """A failing gateway marks the recipient failed"""
+        install_fake_gateways(failure_rate=1.0, channels=('sms',))
+        throttle.clear()
+        user = User.objects.create_user(username='gateway', password='testpass123', phone_number='+234100000003')
+        preferences = NotificationService.get_user_preferences(user)
+        preferences.in_app_notifications = False
+        preferences.push_notifications = False
+        preferences.email_notifications = False
+        preferences.save()
+
+        notification = Notification.objects.create(
+            title='Alert', message='Message', notification_type='system_alert', priority='high'
+        )
+        NotificationService.deliver_to_user(notification, user)
+
+        self.assertEqual(NotificationRecipient.objects.get(user=user).status, 'failed')
+        self.assertEqual(get_gateway('sms').failed, 1)
+
+    def test_benchmark_reports_throughput(self):
+        """Generated users receive the broadcast through the fake gateways"""
+        install_fake_gateways(seed=1)
+        self.assertEqual(generate_users(25, 'BenchTown', batch_size=10), 25)
+        self.assertEqual(generate_users(25, 'BenchTown'), 0)
+
+        result = run_benchmark('broadcast', 'BenchTown')
+
+        self.assertEqual(result['recipients'], 25)
+        self.assertEqual(get_gateway('sms').sent, 25)
+        self.assertEqual(get_gateway('push').sent, 25)
+        self.assertGreater(result['queries'], 0)
+        self.assertIsNotNone(result['p99_time_to_deliver_ms'])
+
+    def test_critical_during_bulk_needs_workers(self):
+        """Critical latency under bulk load is only meaningful with delivery threads"""
+        with self.assertRaises(ValueError):
+            run_benchmark('critical_during_bulk', 'BenchTown')
+
+class MessageTemplateTestCase(TestCase):
+    """Test cases for cached message templates and per-recipient rendering"""
+
+    def setUp(self):
+        """Set up a Lagos vendor stocking an item and users in two cities"""
+        self.item = MedicalItem.objects.create(
+            name='Insulin', category='medication', unit_of_measure='vials'
+        )
+        vendor_user = User.objects.create_user(username='template_vendor', password='testpass123', user_type='vendor')
+        vendor = Vendor.objects.create(
+            user=vendor_user,
+            vendor_type='pharmacy',
+            business_name='Marina Pharmacy',
+            business_license='TPL001',
+            address='1 Marina',
+            city='Lagos',
+            latitude=Decimal('6.5244'),
+            longitude=Decimal('3.3792'),
+            contact_person='Contact',
+            contact_email='marina@example.com',
+            contact_phone='+234100000004'
+        )
+        Inventory.objects.create(vendor=vendor, medical_item=self.item, current_stock=50)
+
+        self.lagos_users = [
+            User.objects.create_user(username=f'lagos{index}', password='testpass123', city='Lagos')
+            for index in range(3)
+        ]
+        self.abuja_user = User.objects.create_user(username='abuja', password='testpass123', city='Abuja')
+        self.notification = Notification.objects.create(
+            title='Shortage Alert: Insulin',
+            message='Potential shortage predicted in Lagos. Severity: high',
+            notification_type='shortage_alert',
+            related_medical_item=self.item,
+            template_context={'item_name': 'Insulin', 'region': 'Lagos', 'severity': 'high'}
+        )
+
+    def test_registry_fallback_and_cache(self):
+        """Parts fall back by channel and locale and are compiled once"""
+        compiled = registry.get('shortage_alert', 'sms', 'en-ng')
+
+        self.assertIs(registry.get('shortage_alert', 'sms', 'en-ng'), compiled)
+        self.assertIs(compiled['title'], registry.get('shortage_alert', 'sms', 'en')['title'])
+        self.assertIsNot(compiled['message'], registry.get('shortage_alert')['message'])
+        self.assertIsNone(registry.get('health_tip'))
+
+    def test_shortage_alert_uses_templates(self):
+        """Stored text is rendered from the registry with its context kept"""
+        prediction = ShortagePrediction.objects.create(
+            medical_item=self.item,
+            region='Lagos',
+            predicted_shortage_date=timezone.now() + timedelta(days=5),
+            confidence_score=0.9,
+            severity_level='high',
+            predicted_shortage_duration=5
+        )
+        notification = ShortageAlertService.create_shortage_alert(prediction)
+
+        self.assertEqual(notification.title, 'Shortage Alert: Insulin')
+        self.assertEqual(notification.message, 'Potential shortage predicted in Lagos. Severity: high')
+        self.assertEqual(notification.template_context['item_name'], 'Insulin')
+
+    def test_batch_render_personalizes_with_one_query(self):
+        """Nearest vendor and distance are filled in per city with one lookup"""
+        users = self.lagos_users + [self.abuja_user]
+
+        with CaptureQueriesContext(connection) as queries:
+            contents = render_for_users(self.notification, users, {})
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('Nearest: Marina Pharmacy, 0.0 km', contents[self.lagos_users[0].id]['sms']['message'])
+        self.assertEqual(contents[self.lagos_users[0].id]['push']['title'], 'Shortage Alert: Insulin')
+        self.assertRegex(contents[self.abuja_user.id]['email']['message'], r'Marina Pharmacy \(\d{3}\.\d km\)')
+
+    @mock.patch.object(NotificationService, 'send_sms_notification', return_value=True)
+    def test_chunk_delivery_sends_rendered_text(self, send_sms):
+        """Channel senders receive the per-user rendering"""
+        user = self.lagos_users[0]
+        user.phone_number = '+234100000005'
+        user.save()
+        throttle.clear()
+
+        NotificationService.deliver_to_users(self.notification, [user.id])
+
+        self.assertIn('Nearest: Marina Pharmacy', send_sms.call_args[0][2]['message'])
@@ -0,0 +1,80 @@
+import threading
+import time
+from django.conf import settings
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding-window rate counter. Each key keeps only the counts
+    of the current and previous fixed windows; the previous count is weighted
+    by how much of it still overlaps the sliding window. O(1) time and memory
+    per key.
+    """
+    PRUNE_EVERY = 10000
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.windows = {}  # key -> [window index, current count, previous count]
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def estimate(self, state, window_seconds, now):
+        index = int(now // window_seconds)
+        window_index, current, previous = state
+        if window_index == index:
+            pass
+        elif window_index == index - 1:
+            current, previous = 0, current
+        else:
+            current, previous = 0, 0
+        overlap = 1 - (now % window_seconds) / window_seconds
+        return index, current, previous, current + previous * overlap
+
+    def hit(self, key, limit, window_seconds, force=False):
+        """
+        Count one event for the key if it is under the limit (or forced).
+        Returns whether the event was allowed.
+        """
+        now = self.clock()
+        with self.lock:
+            state = self.windows.get(key, (0, 0, 0))
+            index, current, previous, estimate = self.estimate(state, window_seconds, now)
+            allowed = force or estimate < limit
+            if allowed:
+                current += 1
+            self.windows[key] = [index, current, previous]
+
+            self.hits += 1
+            if self.hits % self.PRUNE_EVERY == 0:
+                self.prune(index)
+        return allowed
+
+    def prune(self, index):
+        """Drop keys idle for two windows or more; called with the lock held"""
+        for key in [key for key, state in self.windows.items() if state[0] < index - 1]:
+            del self.windows[key]
+
+    def clear(self):
+        with self.lock:
+            self.windows.clear()
+
+class NotificationThrottle:
+    """
+    Per-user, per-channel limits on external sends (push, SMS, email) within
+    NOTIFICATION_RATE_WINDOW_SECONDS. Counts are kept in process memory, so
+    each worker process enforces its own share of the limit.
+    """
+    def __init__(self):
+        self.counter = SlidingWindowCounter()
+
+    def allow(self, user_id, channel, force=False):
+        limit = settings.NOTIFICATION_CHANNEL_RATE_LIMITS.get(channel)
+        if not limit:
+            return True
+        return self.counter.hit(
+            (user_id, channel), limit, settings.NOTIFICATION_RATE_WINDOW_SECONDS, force=force
+        )
+
+    def clear(self):
+        self.counter.clear()
+
+throttle = NotificationThrottle()
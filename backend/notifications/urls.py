@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, streams
 
 urlpatterns = [
     # User notifications
@@ -7,6 +7,8 @@ urlpatterns = [
     path('my-notifications/unread/', views.UnreadNotificationsView.as_view(), name='unread-notifications'),
     path('my-notifications/<int:notification_recipient_id>/read/', views.mark_notification_read, name='mark-notification-read'),
     path('my-notifications/mark-all-read/', views.mark_all_notifications_read, name='mark-all-read'),
+    path('my-notifications/receipts/', views.submit_receipts, name='notification-receipts'),
+    path('my-notifications/stream/', streams.inbox_stream, name='notification-stream'),
     
     # Preferences
     path('preferences/', views.UserNotificationPreferencesView.as_view(), name='notification-preferences'),
@@ -28,6 +30,7 @@ urlpatterns = [
     
     # Stats
     path('stats/', views.notification_stats, name='notification-stats'),
+    path('stats/delivery-lanes/', views.delivery_lane_metrics, name='delivery-lane-metrics'),
     
     # Integrations
     path('shortage-alerts/<int:prediction_id>/', views.create_shortage_alert, name='create-shortage-alert'),
@@ -2,8 +2,7 @@ from rest_framework import generics, permissions, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from django.utils import timezone
+from django.db.models import Q, Prefetch
 from .models import (
     Notification, NotificationRecipient, EmergencyBroadcast,
     UserNotificationPreference, DeviceToken
@@ -13,10 +12,14 @@ from .serializers import (
     EmergencyBroadcastSerializer, EmergencyBroadcastCreateSerializer,
     UserNotificationPreferenceSerializer, DeviceTokenSerializer,
     UserNotificationSerializer, NotificationStatsSerializer,
-    BulkNotificationSerializer
+    BulkNotificationSerializer, BulkReceiptSerializer
 )
 from django.contrib.auth import get_user_model
-from .services import NotificationService, EmergencyBroadcastService, ShortageAlertService
+from .services import (
+    NotificationService, NotificationCounterService, SegmentNotificationService,
+    EmergencyBroadcastService, ShortageAlertService, ReceiptService
+)
+from .lanes import get_dispatcher
 
 User = get_user_model()
 
@@ -29,19 +32,31 @@ class UserNotificationsView(generics.ListAPIView):
     ordering_fields = ['created_at', 'notification__priority']
     
     def get_queryset(self):
+        SegmentNotificationService.sync_inbox(self.request.user)
         return NotificationRecipient.objects.filter(
             user=self.request.user
-        ).select_related('notification').order_by('-created_at')
+        ).prefetch_related(
+            Prefetch(
+                'notification',
+                queryset=Notification.objects.with_delivery_stats()
+            )
+        ).order_by('-created_at')
 
 class UnreadNotificationsView(generics.ListAPIView):
     serializer_class = UserNotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
+        SegmentNotificationService.sync_inbox(self.request.user)
         return NotificationRecipient.objects.filter(
             user=self.request.user,
             status__in=['sent', 'delivered']
-        ).select_related('notification').order_by('-created_at')
+        ).prefetch_related(
+            Prefetch(
+                'notification',
+                queryset=Notification.objects.with_delivery_stats()
+            )
+        ).order_by('-created_at')
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -49,23 +64,16 @@ def mark_notification_read(request, notification_recipient_id):
     """
     Mark a notification as read
     """
-    try:
-        recipient = NotificationRecipient.objects.get(
-            id=notification_recipient_id,
-            user=request.user
-        )
-        
-        recipient.status = 'read'
-        recipient.read_at = timezone.now()
-        recipient.save()
-        
-        return Response({'message': 'Notification marked as read'})
-    
-    except NotificationRecipient.DoesNotExist:
+    if not NotificationRecipient.objects.filter(id=notification_recipient_id, user=request.user).exists():
         return Response(
             {'error': 'Notification not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    # A read receipt, so broadcast read/delivered counts follow
+    ReceiptService.apply_receipts(request.user, [{'id': notification_recipient_id, 'status': 'read'}])
+    
+    return Response({'message': 'Notification marked as read'})
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -73,15 +81,32 @@ def mark_all_notifications_read(request):
     """
     Mark all user notifications as read
     """
-    updated_count = NotificationRecipient.objects.filter(
-        user=request.user,
-        status__in=['sent', 'delivered']
-    ).update(status='read', read_at=timezone.now())
+    SegmentNotificationService.sync_inbox(request.user)
+    updated_count = ReceiptService.mark_all_read(request.user)
     
     return Response({
         'message': f'Marked {updated_count} notifications as read'
     })
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def submit_receipts(request):
+    """
+    Apply a batch of delivery/read receipts for the user's notifications
+    """
+    serializer = BulkReceiptSerializer(data=request.data)
+    if serializer.is_valid():
+        receipts = serializer.validated_data['receipts']
+        updated_count = ReceiptService.apply_receipts(request.user, receipts)
+        
+        return Response({
+            'message': f'Applied {updated_count} receipts',
+            'applied': updated_count,
+            'ignored': len(receipts) - updated_count
+        })
+    
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 # Notification preferences
 class UserNotificationPreferencesView(generics.RetrieveUpdateAPIView):
     serializer_class = UserNotificationPreferenceSerializer
@@ -135,7 +160,7 @@ class NotificationListView(generics.ListCreateAPIView):
     ordering_fields = ['created_at', 'scheduled_for', 'sent_at']
     
     def get_queryset(self):
-        return Notification.objects.all().prefetch_related('recipients')
+        return Notification.objects.with_delivery_stats().prefetch_related('recipients').order_by('-created_at')
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -149,7 +174,7 @@ class NotificationListView(generics.ListCreateAPIView):
             NotificationService.deliver_notification(notification)
 
 class NotificationDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Notification.objects.all()
+    queryset = Notification.objects.with_delivery_stats()
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
@@ -221,33 +246,23 @@ def notification_stats(request):
     user = request.user
     
     if user.user_type == 'patient':
-        # Patient stats
-        total_notifications = NotificationRecipient.objects.filter(user=user).count()
-        unread_count = NotificationRecipient.objects.filter(
-            user=user, 
-            status__in=['sent', 'delivered']
-        ).count()
+        # Patient stats, read from the incrementally maintained counters
+        SegmentNotificationService.sync_inbox(user)
+        counter = NotificationCounterService.get_counter(user)
         
         stats = {
-            'total_notifications': total_notifications,
-            'unread_count': unread_count,
-            'emergency_alerts': NotificationRecipient.objects.filter(
-                user=user,
-                notification__notification_type='emergency_broadcast'
-            ).count(),
-            'shortage_alerts': NotificationRecipient.objects.filter(
-                user=user,
-                notification__notification_type='shortage_alert'
-            ).count(),
+            'total_notifications': counter.total_count,
+            'unread_count': counter.unread_count,
+            'emergency_alerts': counter.emergency_count,
+            'shortage_alerts': counter.shortage_count,
             'delivery_success_rate': 95.0,  # This would be calculated from actual delivery data
         }
     else:
-        # Admin stats
+        # Admin stats, rolled up from the per-user counters
+        totals = NotificationCounterService.get_totals()
         stats = {
             'total_notifications': Notification.objects.count(),
-            'unread_count': NotificationRecipient.objects.filter(
-                status__in=['sent', 'delivered']
-            ).count(),
+            'unread_count': totals['unread_count'],
             'emergency_alerts': EmergencyBroadcast.objects.count(),
             'shortage_alerts': Notification.objects.filter(
                 notification_type='shortage_alert'
@@ -258,6 +273,14 @@ def notification_stats(request):
     serializer = NotificationStatsSerializer(stats)
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, permissions.IsAdminUser])
+def delivery_lane_metrics(request):
+    """
+    Backlog and latency of each delivery lane in this process
+    """
+    return Response(get_dispatcher().metrics())
+
 # Integration with other services
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
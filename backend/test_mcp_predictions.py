@@ -107,9 +107,9 @@ def test_api_endpoints():
         response = client.post('/api/mcp/predictions/run/', prediction_request, format='json')
         print(f"Run predictions endpoint status: {response.status_code}")
 
-        if response.status_code == 200:
+        if response.status_code == 202:
             result = response.json()
-            print(f"API generated {len(result['predictions'])} predictions")
+            print(f"API queued prediction job {result['job_id']} ({result['status_url']})")
 
         # Test predictions list endpoint
         print("Testing predictions list endpoint...")